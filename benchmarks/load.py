@@ -0,0 +1,302 @@
+#concurrent session load test for home.py
+#
+#    python benchmarks/load.py                                  1, 2, 4, 8 and 16 sessions in one process
+#    python benchmarks/load.py --sessions 4,16 --workers 4      16 sessions spread over 4 processes
+#    python benchmarks/load.py --cold                           without warming the caches first
+#
+#a worker is one interpreter standing in for one streamlit server process: its
+#sessions are AppTest instances on threads of their own, sharing the process's
+#caches and GIL as a server's sessions do. every session cycles through the
+#analysis/data combinations, rerunning after each change, for --duration seconds.
+#before that each worker builds every view once (unless --cold), then all the
+#workers start together.
+#
+#for each session count it prints reruns/s, p50/p95 rerun latency, and the cpu
+#time and peak rss of every worker - the capacity curve. throughput stops rising
+#once the cpu is saturated, and from there on p95 only climbs. the capacity is the
+#most sessions whose p95 is within --target-p95. each run appends one line per
+#session count to load_history.jsonl.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(HERE, 'load_history.jsonl')
+SCRIPT = os.path.join(ROOT, 'home.py')
+
+SESSIONS = (1, 2, 4, 8, 16)
+
+#seconds of measured reruns per session count
+DURATION = 30
+
+#seconds a session waits between reruns - 0 is users clicking as fast as the app answers
+THINK = 0.0
+
+#p95 rerun latency in seconds a session count must keep to count towards capacity
+TARGET_P95 = 2.0
+
+#seconds a single rerun may take before the session gives up
+RERUN_TIMEOUT = 300
+
+
+def _emit(lock, **record):
+    with lock:
+        print(json.dumps(record), flush=True)
+
+
+def _cpu_s():
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _max_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _select(at, analysis, data):
+    at.selectbox[0].set_value(analysis)
+    at.radio[0].set_value(data)
+
+
+def run_worker(sessions, duration, think, warm, first):
+    #the child process: one json line per rerun, then one for the worker
+    import itertools
+    import warnings
+
+    warnings.filterwarnings('ignore')
+
+    from streamlit.testing.v1 import AppTest
+
+    from npt import views
+
+    combos = list(itertools.product(views.ANALYSES, views.DATA_TYPES))
+    lock = threading.Lock()
+
+    apps = []
+    for _ in range(sessions):
+        at = AppTest.from_file(SCRIPT, default_timeout=RERUN_TIMEOUT)
+        at.run()
+        apps.append(at)
+    if warm:
+        #every view built once, so the run measures reruns and not the first builds
+        for analysis, data in combos:
+            _select(apps[0], analysis, data)
+            apps[0].run()
+
+    #wait for the other workers, then measure for the same window
+    _emit(lock, ready=True)
+    sys.stdin.readline()
+    start = time.perf_counter()
+    cpu = _cpu_s()
+    deadline = start + duration
+
+    def session(i, at):
+        #sessions start at different views, as different users would
+        for k in itertools.count():
+            if time.perf_counter() >= deadline:
+                return
+            analysis, data = combos[(first + i + k) % len(combos)]
+            _select(at, analysis, data)
+            began = time.perf_counter()
+            error = None
+            try:
+                at.run()
+                if at.exception:
+                    error = str(at.exception[0].value)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            _emit(lock, latency=time.perf_counter() - began, view=f'{analysis} / {data}', error=error)
+            if think:
+                time.sleep(think)
+
+    threads = [threading.Thread(target=session, args=(i, at), daemon=True) for i, at in enumerate(apps)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    _emit(lock, worker=True, sessions=sessions, wall_s=wall, cpu_s=_cpu_s() - cpu, max_rss_mb=_max_rss_mb())
+
+
+def _percentile(values, q):
+    import numpy as np
+
+    return float(np.percentile(values, q)) if values else float('nan')
+
+
+def _drain(stream, lines, ready):
+    #collects a worker's output as it comes, setting ready at its ready line
+    for line in stream:
+        lines.append(line)
+        if ready is not None and line.startswith('{') and json.loads(line).get('ready'):
+            ready.set()
+    stream.close()
+
+
+def measure(sessions, workers=1, duration=DURATION, think=THINK, warm=True):
+    #sessions split as evenly as they go over the workers
+    workers = max(1, min(workers, sessions))
+    shares = [sessions // workers + (i < sessions % workers) for i in range(workers)]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    procs = []
+    first = 0
+    for share in shares:
+        command = [sys.executable, os.path.abspath(__file__), '--run', str(share), '--duration', str(duration),
+                   '--think', str(think), '--first', str(first)] + ([] if warm else ['--cold'])
+        procs.append(subprocess.Popen(command, cwd=ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE, text=True))
+        first += share
+
+    #one reader per pipe, so no worker blocks on a full pipe while another is read
+    readers = []
+    for proc in procs:
+        out, err, ready = [], [], threading.Event()
+        threads = [threading.Thread(target=_drain, args=(proc.stdout, out, ready), daemon=True),
+                   threading.Thread(target=_drain, args=(proc.stderr, err, None), daemon=True)]
+        for thread in threads:
+            thread.start()
+        readers.append((proc, out, err, ready, threads))
+
+    #every worker warmed up before any starts measuring
+    for proc, out, err, ready, threads in readers:
+        #a worker that dies while warming up never gets ready
+        while not ready.wait(1) and proc.poll() is None:
+            pass
+    for proc in procs:
+        try:
+            proc.stdin.write('go\n')
+            proc.stdin.flush()
+        except BrokenPipeError:
+            pass
+
+    latencies = []
+    errors = []
+    worker_stats = []
+    for proc, out, err, ready, threads in readers:
+        proc.wait()
+        for thread in threads:
+            thread.join()
+        if proc.returncode:
+            raise RuntimeError(f'worker failed: {("".join(err).strip().splitlines() or ["?"])[-1]}')
+        for line in out:
+            if not line.startswith('{'):
+                continue
+            record = json.loads(line)
+            if record.get('ready'):
+                continue
+            if record.get('worker'):
+                worker_stats.append({k: round(v, 3) for k, v in record.items() if k != 'worker'})
+            else:
+                latencies.append(record['latency'])
+                if record['error']:
+                    errors.append(f'{record["view"]}: {record["error"]}')
+
+    wall = max(w['wall_s'] for w in worker_stats)
+    return {
+        'sessions': sessions,
+        'workers': workers,
+        'reruns': len(latencies),
+        'throughput': round(len(latencies) / wall, 3) if wall else 0.0,
+        'p50_s': round(_percentile(latencies, 50), 3),
+        'p95_s': round(_percentile(latencies, 95), 3),
+        'max_s': round(max(latencies), 3) if latencies else None,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'cpu_s': round(sum(w['cpu_s'] for w in worker_stats), 2),
+        #busy cores - a worker tops out near 1 while its reruns hold the GIL
+        'cpu_util': round(sum(w['cpu_s'] for w in worker_stats) / wall, 2) if wall else 0.0,
+        'max_rss_mb': round(sum(w['max_rss_mb'] for w in worker_stats), 1),
+        'worker_stats': worker_stats,
+    }
+
+
+def _report(results, target_p95):
+    print(f'{"sessions":>8} {"workers":>7} {"reruns":>7} {"reruns/s":>9} {"p50 s":>7} {"p95 s":>7} {"cpu":>5} {"rss MB":>8} {"errors":>6}')
+    best = max((r['throughput'] for r in results), default=0) or 1.0
+    for r in results:
+        bar = '#' * round(r['throughput'] / best * 30)
+        print(f'{r["sessions"]:>8} {r["workers"]:>7} {r["reruns"]:>7} {r["throughput"]:>9.2f} {r["p50_s"]:>7.2f} {r["p95_s"]:>7.2f} '
+              f'{r["cpu_util"]:>5.2f} {r["max_rss_mb"]:>8.0f} {r["errors"]:>6}  {bar}')
+        for i, w in enumerate(r['worker_stats']):
+            print(f'{"":>17}worker {i}: {w["sessions"]} sessions, {w["cpu_s"]:.1f}s cpu over {w["wall_s"]:.1f}s, peak rss {w["max_rss_mb"]:.0f} MB')
+        if r['first_error']:
+            print(f'{"":>17}first error: {r["first_error"]}')
+
+    within = [r['sessions'] for r in results if r['p95_s'] <= target_p95 and not r['errors']]
+    if within:
+        print(f'capacity: {max(within)} concurrent sessions with p95 within {target_p95}s')
+    else:
+        print(f'capacity: no session count kept p95 within {target_p95}s')
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure home.py rerun latency under many concurrent sessions.')
+    parser.add_argument('--sessions', default=','.join(map(str, SESSIONS)), help='comma separated concurrent session counts')
+    parser.add_argument('--workers', type=int, default=1, help='processes the sessions are spread over, like server replicas')
+    parser.add_argument('--duration', type=float, default=DURATION, help='seconds measured per session count')
+    parser.add_argument('--think', type=float, default=THINK, help='seconds a session waits between reruns')
+    parser.add_argument('--target-p95', type=float, default=TARGET_P95, help='p95 latency a session count must keep')
+    parser.add_argument('--cold', action='store_true', help='do not build every view before measuring')
+    parser.add_argument('--no-save', action='store_true', help='do not append to load_history.jsonl')
+    parser.add_argument('--run', type=int, metavar='SESSIONS', help=argparse.SUPPRESS)
+    parser.add_argument('--first', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        run_worker(args.run, args.duration, args.think, not args.cold, args.first)
+        return 0
+
+    try:
+        counts = [int(s) for s in args.sessions.split(',') if s.strip()]
+    except ValueError:
+        parser.error(f'sessions must be whole numbers: {args.sessions}')
+    if any(n < 1 for n in counts):
+        parser.error('sessions must be at least 1')
+    if args.workers < 1:
+        parser.error('workers must be at least 1')
+
+    meta = {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'duration_s': args.duration,
+        'think_s': args.think,
+        'warm': not args.cold,
+    }
+
+    results = []
+    for sessions in counts:
+        result = measure(sessions, args.workers, args.duration, args.think, not args.cold)
+        results.append(result)
+        if not args.no_save:
+            with open(HISTORY_FILE, 'a') as f:
+                f.write(json.dumps({**meta, **result}) + '\n')
+    _report(results, args.target_p95)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
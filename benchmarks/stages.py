@@ -0,0 +1,307 @@
+#stage benchmarks for the data and map pipeline
+#
+#    python benchmarks/stages.py                      shipped data (x1) plus 10x, 100x, 1000x
+#    python benchmarks/stages.py --scales 1,10        only some scales
+#
+#times each stage home.py depends on - reading the geojson and xlsx sources,
+#reprojection, building the bundle, finding candidates, map building and html
+#size for each of the nine views, and the summary aggregation. scaled networks
+#are made from the shipped files by tiling copies of the network side by side
+#with their A/B/N ids offset, so they keep the same schema and connectivity.
+#
+#each scale runs in a fresh interpreter under a time limit; a scale that runs
+#out of time still records the stages it finished, which is where it stops
+#scaling. every run appends one line per scale to stages_history.jsonl.
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(HERE, 'stages_history.jsonl')
+SYNTHETIC_DIR = os.path.join(HERE, '.synthetic')
+
+sys.path.insert(0, ROOT)
+
+SCALES = (1, 10, 100, 1000)
+
+#seconds allowed for all the stages of one scale
+TIME_LIMIT = 1800
+
+#columns holding TTSM node ids, offset in every copy so the copies do not join up
+ID_COLUMNS = ('A', 'B', 'N')
+
+#imported by geopandas' explore() the first time a map is built
+EXPLORE_IMPORTS = ('matplotlib', 'mapclassify', 'xyzservices', 'folium.plugins')
+
+#gap between copies, as a fraction of the network's extent
+SPACING = 1.1
+
+
+def _frames(data_dir):
+    import geopandas as gpd
+    import pandas as pd
+
+    from npt.bundle import SOURCES
+
+    frames = {}
+    for name, filename in SOURCES.items():
+        path = os.path.join(data_dir, filename)
+        frames[name] = pd.read_excel(path) if filename.endswith('.xlsx') else gpd.read_file(path)
+    return frames
+
+
+def _offsets(frames, scale):
+    import numpy as np
+
+    bounds = np.array([frame.total_bounds for frame in frames.values() if hasattr(frame, 'total_bounds')])
+    width = (bounds[:, 2].max() - bounds[:, 0].min()) * SPACING
+    height = (bounds[:, 3].max() - bounds[:, 1].min()) * SPACING
+    columns = math.ceil(math.sqrt(scale))
+    ids = [frame[c].max() for frame in frames.values() for c in ID_COLUMNS if c in frame]
+    stride = 10 ** math.ceil(math.log10(np.nanmax(ids) + 1))
+    return [((i % columns) * width, (i // columns) * height, i * stride) for i in range(scale)]
+
+
+def _tile(frame, offsets):
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+
+    copies = []
+    for dx, dy, id_offset in offsets:
+        copy = frame.copy()
+        for column in ID_COLUMNS:
+            if column in copy:
+                copy[column] = copy[column] + id_offset
+        if isinstance(copy, gpd.GeoDataFrame):
+            copy = copy.set_geometry(shapely.transform(copy.geometry.array, lambda xy: xy + (dx, dy)))
+        elif 'geometry' in copy:
+            #the xlsx sources keep geometry as wkt text
+            geoms = shapely.from_wkt(copy['geometry'].to_numpy(dtype=object))
+            copy['geometry'] = shapely.to_wkt(shapely.transform(geoms, lambda xy: xy + (dx, dy)), rounding_precision=-1)
+        copies.append(copy)
+    out = pd.concat(copies, ignore_index=True)
+    return gpd.GeoDataFrame(out, crs=frame.crs) if isinstance(frame, gpd.GeoDataFrame) else out
+
+
+def synthetic_data(scale):
+    #data/ with the network tiled scale times, written once per source version
+    #the shipped files are copied as they are, so x1 never touches data/.bundle
+    import shutil
+
+    from npt import bundle
+
+    path = os.path.join(SYNTHETIC_DIR, f'{bundle.source_version()}-x{scale}')
+    if os.path.exists(os.path.join(path, 'done')):
+        return path
+
+    os.makedirs(path, exist_ok=True)
+    if scale == 1:
+        for filename in bundle.SOURCES.values():
+            shutil.copy(os.path.join(bundle.DATA_DIR, filename), path)
+        open(os.path.join(path, 'done'), 'w').close()
+        return path
+
+    frames = _frames(bundle.DATA_DIR)
+    offsets = _offsets(frames, scale)
+    for name, frame in frames.items():
+        target = os.path.join(path, bundle.SOURCES[name])
+        tiled = _tile(frame, offsets)
+        if target.endswith('.xlsx'):
+            tiled.to_excel(target, index=False)
+        else:
+            tiled.to_file(target, driver='GeoJSON')
+    open(os.path.join(path, 'done'), 'w').close()
+    return path
+
+
+def _emit(stage, seconds, **extra):
+    print(json.dumps({'stage': stage, 'seconds': round(seconds, 4), **extra}), flush=True)
+
+
+def run_stages(data_dir):
+    #the child process: one json line per finished stage
+    import importlib
+    import resource
+    import shutil
+    import warnings
+
+    warnings.filterwarnings('ignore')
+
+    import geopandas as gpd
+    import pandas as pd
+
+    from npt import bundle, maps, stats, summary, thresholds, views
+
+    start = time.perf_counter()
+    frames = {}
+    for name, filename in bundle.SOURCES.items():
+        if not filename.endswith('.xlsx'):
+            frames[name] = gpd.read_file(os.path.join(data_dir, filename))
+    _emit('load_geojson', time.perf_counter() - start, rows=sum(len(f.index) for f in frames.values()))
+
+    start = time.perf_counter()
+    rows = 0
+    for filename in bundle.SOURCES.values():
+        if filename.endswith('.xlsx'):
+            rows += len(pd.read_excel(os.path.join(data_dir, filename)).index)
+    _emit('load_xlsx', time.perf_counter() - start, rows=rows)
+
+    start = time.perf_counter()
+    for frame in frames.values():
+        frame.to_crs(bundle.CRS)
+    _emit('reproject', time.perf_counter() - start)
+
+    #always a cold build, so the bundle stage measures the work and not the cache
+    shutil.rmtree(os.path.join(data_dir, bundle.BUNDLE_DIRNAME), ignore_errors=True)
+    start = time.perf_counter()
+    path = bundle.build_bundle(data_dir)
+    _emit('bundle_build', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    data = bundle.Bundle(path)
+    for name in data.names:
+        data.frame(name)
+    _emit('bundle_open', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    found = thresholds.candidates(data)
+    _emit('candidates', time.perf_counter() - start, links=len(found.frames['links'].index), nodes=len(found.frames['nodes'].index))
+
+    start = time.perf_counter()
+    stats.summary_table(data)
+    for view in views.all_views():
+        summary.summarise(view, data)
+    _emit('summary', time.perf_counter() - start)
+
+    #explore() imports these on first use - timed apart so the first view is comparable
+    start = time.perf_counter()
+    for name in EXPLORE_IMPORTS:
+        importlib.import_module(name)
+    _emit('explore_imports', time.perf_counter() - start)
+
+    for view in views.all_views():
+        start = time.perf_counter()
+        m = maps.build_map(view, data)
+        built = time.perf_counter() - start
+        html = maps.render(m).html
+        _emit(f'map: {view.analysis.label} / {view.data}', time.perf_counter() - start, build_s=round(built, 4),
+              html_bytes=len(html.encode()))
+
+    _emit('max_rss_mb', 0, value=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(scale, time_limit=TIME_LIMIT):
+    #generation gets its own interpreter too, so its memory is not held while measuring
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--generate', str(scale)], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    data_dir = out.stdout.strip().splitlines()[-1]
+    generate = time.perf_counter() - start
+
+    command = [sys.executable, os.path.abspath(__file__), '--run', data_dir]
+    status = 'ok'
+    try:
+        out = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, timeout=time_limit)
+        lines = out.stdout
+        if out.returncode:
+            status = 'failed: ' + (out.stderr.strip().splitlines() or ['?'])[-1]
+    except subprocess.TimeoutExpired as e:
+        lines = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or '')
+        status = f'timeout after {time_limit}s'
+
+    stages = {}
+    for line in lines.splitlines():
+        if line.startswith('{'):
+            record = json.loads(line)
+            stages[record.pop('stage')] = record
+    return {'generate_s': round(generate, 2), 'status': status, 'stages': stages}
+
+
+def _report(scale, result, previous):
+    print(f'x{scale}: {result["status"]} (data generated in {result["generate_s"]}s)')
+    before = (previous or {}).get('stages', {})
+    for stage, record in result['stages'].items():
+        if stage == 'max_rss_mb':
+            print(f'  {"max rss":58} {record["value"]:9.1f} MB')
+            continue
+        change = ''
+        if stage in before and before[stage]['seconds']:
+            change = f'{(record["seconds"] / before[stage]["seconds"] - 1) * 100:+6.0f}%'
+        size = f'  {record["html_bytes"] / 1e6:8.2f} MB' if 'html_bytes' in record else ''
+        print(f'  {stage:58} {record["seconds"]:9.3f}s {change:>7}{size}')
+
+
+def _history():
+    if not os.path.exists(HISTORY_FILE):
+        return []
+    with open(HISTORY_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    import warnings
+
+    warnings.filterwarnings('ignore')
+
+    parser = argparse.ArgumentParser(description='Time the NPT data and map stages at several network sizes.')
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)), help='comma separated copies of the network')
+    parser.add_argument('--time-limit', type=int, default=TIME_LIMIT, help='seconds allowed per scale')
+    parser.add_argument('--no-save', action='store_true', help='do not append to stages_history.jsonl')
+    parser.add_argument('--generate', type=int, metavar='SCALE', help=argparse.SUPPRESS)
+    parser.add_argument('--run', metavar='DATA_DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        print(synthetic_data(args.generate))
+        return 0
+    if args.run:
+        run_stages(args.run)
+        return 0
+
+    try:
+        scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    except ValueError:
+        parser.error(f'scales must be whole numbers: {args.scales}')
+    if any(s < 1 for s in scales):
+        parser.error('scales must be at least 1')
+
+    history = _history()
+    meta = {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or None,
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+    for scale in scales:
+        result = measure(scale, args.time_limit)
+        previous = next((r for r in reversed(history) if r['scale'] == scale), None)
+        _report(scale, result, previous)
+        if not args.no_save:
+            with open(HISTORY_FILE, 'a') as f:
+                f.write(json.dumps({**meta, 'scale': scale, **result}) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
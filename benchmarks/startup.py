@@ -0,0 +1,125 @@
+#startup budget check for home.py
+#
+#    python benchmarks/startup.py            measure and compare with startup_budget.json
+#    python benchmarks/startup.py --update   write new budgets from this machine
+#
+#each measurement runs in a fresh interpreter so nothing is already imported.
+#exits 1 when a measurement is over its budget, so it can gate a CI job.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+#budgets written by --update leave this much headroom over the measured value
+HEADROOM = 1.5
+
+SCRIPT = os.path.join(ROOT, 'home.py')
+
+
+def home_imports(script=SCRIPT):
+    #what home.py imports before the static tabs are drawn (its top level), and what the tool tab adds
+    import ast
+
+    with open(script) as f:
+        tree = ast.parse(f.read())
+    top = set(tree.body)
+    first_paint, tool = [], []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            #from npt import maps is the module npt.maps
+            names = [f'{node.module}.{alias.name}' if node.module == 'npt' else node.module for alias in node.names]
+        else:
+            continue
+        (first_paint if node in top else tool).extend(names)
+    first_paint = list(dict.fromkeys(first_paint))
+    return first_paint, [name for name in dict.fromkeys(tool) if name not in first_paint]
+
+
+FIRST_PAINT_IMPORTS, TOOL_IMPORTS = home_imports()
+
+IMPORT_SCRIPT = """
+import importlib, json, sys, time
+before, after = json.loads(sys.argv[1])
+for name in before:
+    importlib.import_module(name)
+start = time.perf_counter()
+for name in after:
+    importlib.import_module(name)
+print(json.dumps(time.perf_counter() - start))
+"""
+
+#time to the first static tab's title, and to the end of the first full run
+RUN_SCRIPT = """
+import json, time, warnings
+warnings.filterwarnings('ignore')
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+marks = {}
+title = streamlit.title
+def timed_title(*args, **kwargs):
+    marks.setdefault('first_render', time.perf_counter())
+    return title(*args, **kwargs)
+streamlit.title = timed_title
+
+at = AppTest.from_file('home.py', default_timeout=300)
+start = time.perf_counter()
+at.run()
+end = time.perf_counter()
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+print(json.dumps({'first_render_s': marks['first_render'] - start, 'first_run_s': end - start}))
+"""
+
+
+def _python(script, *args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, '-c', script, *args], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure():
+    results = {
+        'first_paint_imports_s': _python(IMPORT_SCRIPT, json.dumps([[], FIRST_PAINT_IMPORTS])),
+        'tool_imports_s': _python(IMPORT_SCRIPT, json.dumps([FIRST_PAINT_IMPORTS, TOOL_IMPORTS])),
+    }
+    results.update(_python(RUN_SCRIPT))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check home.py startup times against a budget.')
+    parser.add_argument('--update', action='store_true', help='write budgets from this run instead of checking')
+    args = parser.parse_args(argv)
+
+    results = measure()
+
+    if args.update:
+        budget = {name: round(value * HEADROOM, 3) for name, value in results.items()}
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(budget, f, indent=2)
+            f.write('\n')
+        print(f'budgets written to {BUDGET_FILE}')
+
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+
+    failed = False
+    for name, value in results.items():
+        limit = budget.get(name)
+        over = limit is not None and value > limit
+        failed |= over
+        print(f"{name:24} {value:7.3f}s  budget {limit if limit is not None else '-':>7}  {'OVER' if over else 'ok'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
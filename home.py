@@ -1,18 +1,16 @@
-from os import link
-import select
+import json
+
 import streamlit as st
-import folium
-from folium.features import Marker, Popup
-import pandas as pd
-import numpy as np
-import geopandas as gpd
-import leafmap
-import openpyxl
 
-from streamlit_folium import st_folium
+#only the view registry is needed to draw the page - pandas, the geo stack and
+#the data are imported when the tool tab runs, after the static tabs are sent
+from npt import instrument, views
 
 st.set_page_config(layout="wide")
 
+#timing spans, cache counters and payload sizes for this rerun - ?debug=1 or NPT_DEBUG=1
+trace = instrument.begin(instrument.requested(st.query_params))
+
 st.sidebar.image('https://becagroup.sharepoint.com/sites/ClientsandMarkets/Images1/Market%20Profile%20&%20Brand/Beca%20Brand%20&%20Standards/Beca%20Logo%20Black%20PNG.png?csf=1&web=1&e=p6QEq9&cid=d89ac465-29af-4979-83d9-a76c21e84693', width=150, output_format="auto")
 
 st.sidebar.title("About")
@@ -54,541 +52,9 @@ with tab1:
 
     st.info("For further information on how this tool was developed, click on the 'How it works' tab.")
 
-with tab2:
-
-    #cache data
-    @st.cache_data
-    def gdf_load_data(url):
-        gdf = gpd.read_file(url)
-        return gdf
-
-    @st.cache_data
-    def df_load_data(url):
-        df = pd.read_excel(url)
-        return df
-
-    #import intersection and links data
-
-    intersection_key_locations = gdf_load_data(r"data/intersections_key_locations.geojson")
-    intersection_secondary = gdf_load_data(r"data/intersections_outside_primary.geojson")
-
-    links_key_locations = gdf_load_data(r'data/links_key_locations.geojson')
-    links_secondary = gdf_load_data(r'data/links_outside_primary.geojson')
-
-    merged_intersections = df_load_data(r'data/merged_intersections.xlsx')
-    merged_links = df_load_data(r'data/merged_links.xlsx')
-
-    #drop-down box
-    analysis_selection = st.selectbox('Please select what type of analysis you are interested in exploring.', ['Select', 'Priority locations', 'Secondary Locations', 'All locations'])
-    
-    if analysis_selection == 'Priority locations' or 'Secondary Locations' or 'All locations':
-        
-        #radio button
-        data_selection = st.radio('What type of data do you want to see?', ['Select', 'Roads', 'Intersections', 'Both roads and intersections'])
-        
-        
-        #define columns
-        col1, col2 = st.columns([3, 1])
-
-        #show specific maps and data on selection
-        if analysis_selection == 'Priority locations' and data_selection == 'Roads':
-                
-            with col1:
-                
-                map = links_key_locations.explore(tiles='CartoDB positron',
-                    legend=False,
-                    tooltip=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    popup=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Priority locations",
-                    style_kwds= {
-                        "color":"red",
-                        "weight":3,
-                        "opacity":0.7})
-
-
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                
-                st.info("Tip: click on the roads or intersections to explore the data further.")
-                    
-                
-            with col2:
-                st.subheader("Priority Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{len(links_key_locations.index)}** road segments identified in this analysis.
-
-                            These roads have been selected because they are forecast to accomodate:
-                            - an average of **{links_key_locations['ADT_PT'].mean().astype('int')}** bus users per day (2048).
-                            - an average of **{links_key_locations['AM_PT'].mean().astype('int')}** bus users in the AM peak (2048).
-                            - average level of service (LoS) classification of **{links_key_locations['LOS'].mean().astype('int')}**, equating to >120 seconds of delay per bus every hour (2048).
-                            
-                            """)
-
-        if analysis_selection == 'Priority locations' and data_selection == 'Intersections':
-                
-            with col1:
-                
-                map = intersection_key_locations.explore(tiles='CartoDB positron',
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    legend=False,
-                    zoom_on_click=True,
-                    name="Intersections - Priority locations",
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    marker_type="circle_marker",
-                    marker_kwds={
-                        "radius" : "6"},
-                    style_kwds= {
-                        "fillColor":"red",
-                        "stroke":True,
-                        "weight":0.6,
-                        "opacity":0.7
-                    })
-
-
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                     
-                st.info("Tip: click on the roads or intersections to explore the data further.")
-                
-            with col2:
-                st.subheader("Priority Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{len(intersection_key_locations.index)}** {data_selection} identified in this analysis.
-
-                            These intersections have been selected because they accomodate::
-                            - an average of **{intersection_key_locations['ADT_PT'].mean().astype('int')}** bus users travelling through them every day (2048).
-                            - an average of **{intersection_key_locations['AM_PT'].mean().astype('int')}** bus users in the AM peak (2048).
-                            - average delays of **{intersection_key_locations['DELAY_WAVG'].mean().astype('int')}** seconds every hour per bus movement (2048).
-                            
-                            """) 
-
-
-        if analysis_selection == 'Priority locations' and data_selection == 'Both roads and intersections':
-                
-            with col1:
-                
-                map = intersection_key_locations.explore(tiles='CartoDB positron',
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    legend=False,
-                    zoom_on_click=True,
-                    name="Intersections - Priority locations",
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    marker_type="circle_marker",
-                    marker_kwds={
-                        "radius" : "6"},
-                    style_kwds= {
-                        "fillColor":"red",
-                        "stroke":True,
-                        "weight":0.6,
-                        "opacity":0.7})
-                
-                links_key_locations.explore(
-                    m=map,
-                    legend=False,
-                    tooltip=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    popup=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Priority locations",
-                    style_kwds= {
-                        "color":"red",
-                        "weight":3,
-                        "opacity":0.7})
-
-
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                
-                st.info("Tip: click on the roads or intersections to explore the data further.")    
-                
-            with col2:
-                st.subheader("Priority Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{len(intersection_key_locations.index)}** intersections and **{len(links_key_locations.index)}** road segments identified in this analysis.
-
-                            These roads and intersections have been selected because they accomodate:
-                            - an average of **{intersection_key_locations['ADT_PT'].mean().astype('int')}** bus users travelling through them every day (2048).
-                            - an average of **{intersection_key_locations['AM_PT'].mean().astype('int')}** bus users in the AM peak (2048).
-                            - average delays of **{intersection_key_locations['DELAY_WAVG'].mean().astype('int')}** seconds every hour per bus movement (2048).
-                            
-                            """)
-
-        if analysis_selection == 'Secondary Locations' and data_selection == 'Roads':
-                
-            with col1:
-                
-                map = links_secondary.explore(tiles='CartoDB positron',
-                    legend=False,
-                    tooltip=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    popup=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Secondary locations",
-                    style_kwds= {
-                        "color":"orange",
-                        "weight":3,
-                        "opacity":0.7})
-
-
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                    
-                
-            with col2:
-                st.subheader("Secondary Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{len(links_secondary.index)}** road segments identified in this analysis.
-
-                            These roads have been selected because they are forecast to accomodate:
-                            - an average of **{links_secondary['ADT_PT'].mean().astype('int')}** bus users per day (2048).
-                            - an average of **{links_secondary['AM_PT'].mean().astype('int')}** bus users in the AM peak (2048).
-                            - average level of service (LoS) classification of **{links_secondary['LOS'].mean().astype('int')}**, equating to >80 seconds of delay per bus every hour (2048).
-                            
-                            """)
-
-        if analysis_selection == 'Secondary Locations' and data_selection == 'Intersections':
-                
-            with col1:
-                
-                map = intersection_secondary.explore(tiles='CartoDB positron',
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    legend=False,
-                    zoom_on_click=True,
-                    name="Intersections - Secondary locations",
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    marker_type="circle_marker",
-                    marker_kwds={
-                        "radius" : "6"},
-                    style_kwds= {
-                        "fillColor":"orange",
-                        "stroke":True,
-                        "weight":0.6,
-                        "opacity":0.7
-                    })
-
-
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                     
-                
-            with col2:
-                st.subheader("Secondary Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{len(intersection_secondary.index)}** {data_selection} identified in this analysis.
-
-                            These intersections have been selected because they accomodate::
-                            - an average of **{intersection_secondary['ADT_PT'].mean().astype('int')}** bus users travelling through them every day (2048).
-                            - an average of **{intersection_secondary['AM_PT'].mean().astype('int')}** bus users in the AM peak (2048).
-                            - average delays of **{intersection_secondary['DELAY_WAVG'].mean().astype('int')}** seconds every hour per bus movement (2048).
-                            
-                            """) 
-
-
-        if analysis_selection == 'Secondary Locations' and data_selection == 'Both roads and intersections':
-                
-            with col1:
-                
-                map = intersection_secondary.explore(tiles='CartoDB positron',
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    legend=False,
-                    zoom_on_click=True,
-                    name="Intersections - Secondary locations",
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    marker_type="circle_marker",
-                    marker_kwds={
-                        "radius" : "6"},
-                    style_kwds= {
-                        "fillColor":"orange",
-                        "stroke":True,
-                        "weight":0.6,
-                        "opacity":0.7})
-                
-                links_secondary.explore(
-                    m=map,
-                    legend=False,
-                    tooltip=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    popup=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Secondary locations",
-                    style_kwds= {
-                        "color":"orange",
-                        "weight":3,
-                        "opacity":0.7})
-
-
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                     
-                
-            with col2:
-                st.subheader("Secondary Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{len(intersection_secondary.index)}** intersections and **{len(links_secondary.index)}** road segments identified in this analysis.
-
-                            These roads and intersections have been selected because they accomodate:
-                            - an average of **{(links_secondary['ADT_PT'].mean().astype('int'))+(intersection_secondary['ADT_PT'].mean().astype('int'))}** bus users travelling through them every day (2048).
-                            - an average of **{(intersection_secondary['AM_PT'].mean().astype('int'))+(links_secondary['AM_PT'].mean().astype('int'))}** bus users in the AM peak (2048).
-                            - average delays of **{intersection_secondary['DELAY_WAVG'].mean().astype('int')}** seconds every hour per bus movement (2048).
-                            
-                            """) 
-                
-        
-        if analysis_selection == 'All locations' and data_selection == 'Roads':
-                
-            with col1:
-                
-                st.info("Note: On this map, each link is weighted by the severity of delay (ie LoS).")
-                                    
-                map = links_key_locations.explore(tiles='CartoDB positron',
-                    legend=True,
-                    column='LOS',
-                    tooltip=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    popup=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Priority locations",
-                    style_kwds= {
-                        
-                        "weight":3,
-                        "opacity":0.7},
-                    legend_kwds= {
-                        "caption":"Level of service",
-                        "fmt":"{:.0f}",
-                    })
-                
-                links_secondary.explore(
-                    m=map,
-                    column='LOS',
-                    legend=False,
-                    tooltip=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    popup=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Secondary locations",
-                    style_kwds= {
-                        
-                        "weight":3,
-                        "opacity":0.7})
-                
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                     
-                
-            with col2:
-                st.subheader("All Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{(len(links_secondary.index))+(len(links_key_locations.index))}** road segments identified in this analysis.
-
-                            These roads have been selected because they are forecast to accomodate:
-                            - an average of **{((links_secondary['ADT_PT'].mean())+(links_key_locations['ADT_PT'].mean())).astype('int')}** bus users per day (2048).
-                            - an average of **{((links_secondary['AM_PT'].mean())+(links_key_locations['AM_PT'].mean())).astype('int')}** bus users in the AM peak (2048).
-                            - average level of service (LoS) classification of **{links_key_locations['LOS'].mean().astype('int')}**, equating to >120 seconds of delay per bus every hour (2048).
-                            
-                            """)
-
-        if analysis_selection == 'All locations' and data_selection == 'Intersections':
-                
-            with col1:
-                
-                st.info("Note: On this map, each intersection is weighted by the severity of delay (ie LoS).")
-                
-                map = intersection_key_locations.explore(tiles='CartoDB positron',
-                    legend=True,
-                    column='DELAY_WAVG',
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Intersections - Priority locations",
-                    style_kwds= {
-                        "weight":3,
-                        "opacity":0.7},
-                    legend_kwds= {
-                        "caption":"Seconds of delay/hr per bus movement",
-                        "fmt":"{:.0f}"})
-                
-                intersection_secondary.explore(
-                    m=map,
-                    column='DELAY_WAVG',
-                    legend=False,
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Intersections - Secondary locations",
-                    style_kwds= {
-                        "weight":3,
-                        "opacity":0.7})
-                
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                    
-                
-            with col2:
-                st.subheader("All Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{(len(intersection_secondary.index))+(len(intersection_key_locations.index))}** identified in this analysis.
-
-                            These intersections have been selected because they accomodate::
-                            - an average of **{((intersection_secondary['ADT_PT'].mean())+(intersection_key_locations['ADT_PT'].mean())).astype('int')}** bus users travelling through them every day (2048).
-                            - an average of **{((intersection_secondary['AM_PT'].mean())+(intersection_key_locations['AM_PT'].mean())).astype('int')}** bus users in the AM peak (2048).
-                            - average delays of **{((intersection_secondary['DELAY_WAVG'].mean())+(intersection_key_locations['DELAY_WAVG'].mean())).astype('int')}** seconds every hour per bus movement (2048).
-                            
-                            """) 
-
-
-        if analysis_selection == 'All locations' and data_selection == 'Both roads and intersections':
-                
-            with col1:
-                
-                st.info("Note: On this map, each intersection and link is weighted by the severity of delay (ie LoS).")
-                
-                map = links_key_locations.explore(tiles='CartoDB positron',
-                    legend=True,
-                    column='LOS',
-                    tooltip=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    popup=['label', 'ADT_PT', 'AM_PT', 'LOS'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Priority locations",
-                    style_kwds= {
-                        "weight":3,
-                        "opacity":0.7},
-                    legend_kwds= {
-                        "caption":"Links - Level of service",
-                        "fmt":"{:.0f}",
-                    })
-                
-                links_secondary.explore(
-                    m=map,
-                    column='LOS',
-                    legend=False,
-                    tooltip=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    popup=['Label', 'ADT_PT', 'AM_PT', 'LOS', 'length'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Links - Secondary locations",
-                    style_kwds= {
-                        "weight":3,
-                        "opacity":0.7})
-                              
-                intersection_key_locations.explore(
-                    m=map,
-                    legend=True,
-                    column='DELAY_WAVG',
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Intersections - Priority locations",
-                    style_kwds= {
-                        "weight":3,
-                        "opacity":0.7},
-                    legend_kwds= {
-                        "caption":"Intersections - Seconds of delay/hr per bus movement",
-                        "fmt":"{:.0f}",
-                    })
-                
-                intersection_secondary.explore(
-                    m=map,
-                    column='DELAY_WAVG',
-                    legend=False,
-                    tooltip=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    popup=['LABEL', 'ADT_PT', 'AM_PT', 'DELAY_WAVG'],
-                    highlight=True,
-                    zoom_on_click=True,
-                    name="Intersections - Secondary locations",
-                    style_kwds= {
-                        "weight":3,
-                        "opacity":0.7})
-                
-                folium.LayerControl().add_to(map)
-                
-                out = st_folium(map, use_container_width=True)
-                    
-                
-            with col2:
-                st.subheader("All Locations Summary")
-
-                st.markdown(f"""
-                            
-                            This shows the results of analysis for:
-                            - {analysis_selection}; where,
-                            - {data_selection} has been selected.
-
-                            There are **{(len(links_secondary.index))+(len(links_key_locations.index))}** roads and **{(len(intersection_secondary.index))+(len(intersection_key_locations.index))}** road segments identified in this analysis.
-
-                            These roads and intersections have been selected because they accomodate:
-                            - an average of **{(((links_secondary['ADT_PT'].mean())+(links_key_locations['ADT_PT'].mean())).astype('int'))+(((intersection_secondary['ADT_PT'].mean())+(intersection_key_locations['ADT_PT'].mean())).astype('int'))}** bus users travelling through them every day (2048).
-                            - an average of **{(((links_secondary['AM_PT'].mean())+(links_key_locations['AM_PT'].mean())).astype('int'))+(((intersection_secondary['AM_PT'].mean())+(intersection_key_locations['AM_PT'].mean())).astype('int'))}** bus users in the AM peak (2048).
-                            - average delays of **{((intersection_secondary['DELAY_WAVG'].mean())+(intersection_key_locations['DELAY_WAVG'].mean())).astype('int')}** seconds every hour per bus movement (2048).
-                            
-                            """)
-
 with tab3:
+    import pandas as pd
+
     st.markdown("""
                 
                 The NPT has been developed in a top-down process using a variety of datasets, including transport modelling data, Remix model outputs, alongside open-source data. It is built upon several key information/data sources, such as the Tauranga Transport Strategic Model (TTSM), as well as General Transit Feed Specification data. 
@@ -629,4 +95,256 @@ with tab3:
                 - Nodes: locations where there is moderate PT demand (ie equating to roughly 80+ daily trips in AM peak) leading to intersections with moderate levels of delay (ie, LOS C-F).
                 - Links: routes/links where there is moderate PT demand (roughly 80+ daily PT trips in AM peak) and high number of buses (>= 20 per hour) under the Hybrid network along low LOS links (ie LOS C-F).
 
-                """)
\ No newline at end of file
+                """)
+
+with tab2:
+
+    #drop-down box
+    analysis_selection = st.selectbox('Please select what type of analysis you are interested in exploring.', ['Select', *views.ANALYSES])
+    
+    #radio button
+    data_selection = st.radio('What type of data do you want to see?', ['Select', *views.DATA_TYPES])
+
+    with st.spinner("Loading the network data..."), instrument.span('load data'):
+        import numpy as np
+        import pandas as pd
+
+        from npt import bundle, corridors, export, maps, network, scenarios, scoring, snapshots, spatial, summary, thresholds, viewport, warm
+
+        #shared caches are built in the background, so the first view picked is already built
+        @st.cache_resource(max_entries=1)
+        def warm_caches(version, _data):
+            return warm.start(_data)
+
+        #the compiled bundle is memory-mapped and decoded once per process, then shared by every
+        #session of it. it is swapped for a new version when the files in data/ change, without a restart
+        data = bundle.current()
+        warm_caches(data.version, data)
+
+    if bundle.STORE.error is not None:
+        st.warning(f"The updated files in data/ could not be loaded, so the previous version is still shown: {bundle.STORE.error}")
+    if st.session_state.get('npt_version') not in (None, data.version):
+        st.toast("The network data has been updated.")
+    st.session_state['npt_version'] = data.version
+
+    #model scenario - figures for other model years and network options
+    with instrument.span('scenarios'):
+        store = scenarios.scenario_store(data)
+        scenario_labels = {name: store.get(name).label for name in store.names}
+    with st.expander("Scenario"):
+        scenario_name = st.selectbox('Model scenario', store.names, format_func=scenario_labels.get)
+        others = [name for name in store.names if name != scenario_name]
+        compare = st.selectbox('Compare against', ['None', *others], format_func=lambda name: scenario_labels.get(name, name), disabled=not others)
+        comparison = st.selectbox('Attribute to compare', list(scenarios.COMPARISONS), disabled=compare == 'None')
+        if not others:
+            st.caption("Only the 2048 TTSM run is available. Further scenarios are added under data/scenarios.")
+
+    with instrument.span('apply scenario'):
+        data = store.apply(data, scenario_name)
+
+    #composite priority score - the criteria matrix is shared, the weights and scores are per session
+    with st.expander("Rank locations by a weighted score"), instrument.span('ranking'):
+        matrix = scoring.criteria_matrix(data)
+        ranker = st.session_state.get('npt_ranker')
+        if ranker is None or ranker.matrix is not matrix:
+            ranker = st.session_state['npt_ranker'] = scoring.Ranker(matrix)
+
+        weights = {}
+        for (criterion, (label, _, _)), column in zip(scoring.CRITERIA.items(), st.columns(len(scoring.CRITERIA))):
+            with column:
+                weights[criterion] = st.slider(label, 0.0, 1.0, scoring.DEFAULT_WEIGHTS[criterion], 0.05, key=f'weight_{criterion}')
+        ranker.set_weights(weights)
+
+        top = st.number_input('Number of locations to list', 5, len(matrix), min(20, len(matrix)), 5)
+        st.dataframe(ranker.table(top), hide_index=True)
+        st.caption("Each criterion is scaled 0-1 across all roads or all intersections; the score is the weighted average out of 100 "
+                   "over the criteria a location has data for - intersections are not scored on bus frequency or length.")
+
+    #custom thresholds - re-derive the locations from the TTSM attributes
+    with st.expander("Adjust analysis thresholds"):
+        custom = st.toggle('Re-derive locations using the thresholds below', value=False)
+
+        rules = {}
+        grades = list(thresholds.LOS_GRADES)
+        for category, column in zip(['priority', 'secondary'], st.columns(2)):
+            default = thresholds.DEFAULTS[category]
+            with column:
+                st.markdown(f"**{category.capitalize()} locations**")
+                am_pt = st.slider('AM peak PT trips (at least)', 0, 400, int(default.am_pt), 10, key=f'{category}_am_pt', disabled=not custom)
+                buses = st.slider('Buses per hour (at least)', 0, 60, int(default.buses), 1, key=f'{category}_buses', disabled=not custom)
+                los = st.select_slider('Level of service (at least)', grades, grades[default.los - 1], key=f'{category}_los', disabled=not custom)
+                rules[category] = thresholds.Thresholds(am_pt, buses, thresholds.LOS_GRADES[los])
+
+        if custom:
+            with instrument.span('reclassify'):
+                data = thresholds.reclassify(data, rules)
+            st.caption(f"{data.count('links', 'priority')} priority and {data.count('links', 'secondary')} secondary road segments, "
+                       f"{data.count('nodes', 'priority')} priority and {data.count('nodes', 'secondary')} secondary intersections. "
+                       "Links without Hybrid network frequency data are not filtered on buses per hour, and a location "
+                       "only reaches the categories of the study areas it lies in.")
+
+    #map options
+    with st.expander("Map options"):
+        modes = {'All features': 'inline', 'Tiles': 'tiled', 'Features in view': 'viewport'}
+        map_mode = modes[st.radio('Load map layers as', list(modes), horizontal=True,
+                                  help="For large networks. Tiles are fetched by the browser for the area in view, simplified to the current zoom level. "
+                                       "'Features in view' sends only the features inside the map as you pan and zoom.")]
+        layered = st.toggle('Keep every layer on one map', value=True, disabled=map_mode == 'viewport',
+                            help="Priority and secondary roads and intersections are sent once and switched with the map's layer control, "
+                                 "so changing the selection above does not reload the map. Features are coloured by category rather than severity.")
+        show_corridors = st.toggle('Draw road corridors', value=False,
+                                   help="Road segments that meet end to end are joined into corridors and drawn over the map as one line each, "
+                                        "thicker the more PT passenger-km they carry.")
+
+    #define columns
+    col1, col2 = st.columns([3, 1])
+
+    #show specific maps and data on selection
+    view = views.get_view(analysis_selection, data_selection)
+
+    #one map holds every layer - the selection only switches which are shown, in the browser
+    map_view = views.network_view() if layered and map_mode != 'viewport' else view
+
+    if view is not None:
+
+        with col1:
+
+            if map_view is not view:
+                st.caption("Every layer is on this map - switch them with the layer control (top right). Red: priority, orange: secondary locations.")
+            elif view.note:
+                st.info(view.note)
+
+            #level of detail follows the zoom the user is viewing this map at
+            map_state = st.session_state.get('map_state')
+            if map_state is None or map_state['view'] != map_view.key:
+                map_state = st.session_state['map_state'] = {'view': map_view.key, 'zoom': None, 'center': None}
+                st.session_state.pop('npt_map', None)
+
+            #until the live map is built (e.g. just after a restart) a saved snapshot of the same map stands in for it
+            snapshot = None
+            if not maps.view_map_ready(map_view, data, map_mode, map_state['zoom']):
+                snapshot = snapshots.lookup(map_view, data)
+            if snapshot is not None:
+                placeholder = st.empty()
+                with placeholder.container():
+                    st.caption("A saved copy of this map is shown while the interactive map loads.")
+                    st.iframe(snapshots.url(snapshot), height=700)
+
+            with instrument.span('map'):
+                rendered = maps.get_view_map(map_view, data, map_mode, map_state['zoom'])
+            if snapshot is not None:
+                placeholder.empty()
+            instrument.payload('map payload', lambda: sum(len(part.encode()) for part in rendered.payload[:3]))
+
+            #the feature last clicked on, and for intersections its approach links drawn over the map
+            clicked = (st.session_state.get('npt_map') or {}).get('last_object_clicked')
+            with instrument.span('click lookup'):
+                hit = spatial.spatial_index(data).nearest(clicked['lng'], clicked['lat'], [layer.dataset for layer in map_view.layers]) if clicked else None
+            node = None
+            highlight = None
+            if hit is not None and spatial.LAYER_BY_DATASET[hit[0]].kind == 'nodes':
+                graph = network.network(data)
+                point = data.frame(hit[0]).geometry.iloc[hit[1]]
+                node = graph.node_near(point.x, point.y)
+            if node is not None:
+                #only the links of this analysis, not every candidate link at the intersection
+                shown = np.concatenate([graph.link_rows(data.frame(views.LAYERS[(category, 'links')].dataset))
+                                        for category in view.analysis.categories])
+                approach = graph.links.iloc[graph.approach_links(node, shown[shown >= 0])]
+                highlight = maps.highlight_group(approach, 'Approach links', ['label', 'AM_PT', 'LOS'])
+
+            #in viewport mode only the features newly in view are sent on each rerun
+            groups = [highlight] if highlight is not None else []
+            if show_corridors and 'links' in view.kinds:
+                with instrument.span('corridors'):
+                    groups.insert(0, maps.corridor_group(corridors.view_corridors(view, data)))
+            if map_view is not view:
+                groups.append(maps.show_layers([layer.name for layer in view.layers]))
+            if map_mode == 'viewport':
+                reported = st.session_state.get('npt_map') or {}
+                corners = [(reported.get('bounds') or {}).get(c) or {} for c in ('_southWest', '_northEast')]
+                bounds = None
+                if all(c.get('lat') is not None and c.get('lng') is not None for c in corners):
+                    bounds = (corners[0]['lng'], corners[0]['lat'], corners[1]['lng'], corners[1]['lat'])
+                with instrument.span('viewport delta'):
+                    in_view, st.session_state['npt_sent'] = viewport.delta(view, data, bounds, reported.get('zoom'),
+                                                                           st.session_state.get('npt_sent', {}), id(rendered.map))
+                if in_view is not None:
+                    groups.insert(0, in_view)
+            else:
+                st.session_state.pop('npt_sent', None)
+
+            with instrument.span('st_folium'):
+                out = maps.show(rendered, 'npt_map', groups, zoom=map_state['zoom'], center=map_state['center'])
+
+            if out and out.get('center') and out.get('zoom') != rendered.map.options.get('zoom'):
+                st.session_state['map_state'] = {'view': map_view.key, 'zoom': out['zoom'],
+                                                 'center': (out['center']['lat'], out['center']['lng'])}
+
+            if hit is not None:
+                layer = spatial.LAYER_BY_DATASET[hit[0]]
+                name = data.frame(hit[0])[layer.label].iloc[hit[1]] if layer.label in data.frame(hit[0]) else None
+                st.markdown(f"**Selected {views.KINDS[layer.kind].noun}: {name if pd.notna(name) else 'unnamed'}** ({layer.name})")
+                st.dataframe(spatial.feature_details(data, *hit), hide_index=True)
+                if node is not None:
+                    st.markdown(f"It is fed by **{len(approach.index)}** approach links in this analysis (highlighted in blue).")
+                    if len(approach.index):
+                        st.dataframe(approach[['label', 'AM_PT', 'LOS']], hide_index=True)
+
+            #features inside the current map view
+            bounds = (out or {}).get('bounds') or {}
+            corners = [bounds.get('_southWest') or {}, bounds.get('_northEast') or {}]
+            if all(c.get('lat') is not None and c.get('lng') is not None for c in corners):
+                with instrument.span('features in view'):
+                    in_view = spatial.features_in_view(data, view, (corners[0]['lng'], corners[0]['lat'], corners[1]['lng'], corners[1]['lat']))
+                with st.expander(f"Features in view ({len(in_view.index)})"):
+                    st.dataframe(in_view, hide_index=True)
+
+            #contiguous road segments as corridors, with figures weighted by length
+            if 'links' in view.kinds:
+                found = corridors.view_corridors(view, data)
+                with st.expander(f"Corridors ({len(found.index)})"):
+                    st.dataframe(corridors.table(found), hide_index=True)
+                    st.caption("Segments that share an end node form one corridor. Trips and LoS are averaged over length; "
+                               "delay is summed over the intersections a corridor passes.")
+
+            #scenario difference map
+            if compare != 'None':
+                kind, column, attribute = scenarios.COMPARISONS[comparison]
+                st.markdown(f"**Change in {attribute}: {scenario_labels[scenario_name]} compared with {scenario_labels[compare]}**")
+                name = views.KINDS[kind].plural.capitalize()
+                with instrument.span('diff map'):
+                    diff = maps.get_map(('diff', scenario_name, compare, kind, column), store.version,
+                                        lambda: maps.build_diff_map({name: store.diff_frame(scenario_name, compare, kind, column)}, column, f'Change in {attribute}'))
+                maps.show(diff, 'npt_diff', height=450, returned_objects=[])
+
+            st.info("Tip: click on the roads or intersections to explore the data further.")
+
+        with col2:
+            st.subheader(view.analysis.title)
+
+            with instrument.span('summary'):
+                text = summary.summarise(view, data, scenario_labels[scenario_name])
+            st.markdown(text)
+
+            #the features of this selection, with the scenario and thresholds applied, made when clicked
+            with st.expander("Download this selection"):
+                export_format = st.selectbox('Format', list(export.FORMATS), key='export_format')
+                st.download_button(f'Download {export_format}', lambda: export.to_bytes(view, data, export_format),
+                                   file_name=export.file_name(view, export_format),
+                                   mime=export.FORMATS[export_format].mime, on_click='ignore')
+
+#debug panel - where the time of this rerun went
+trace = instrument.finish()
+if trace is not None:
+    with st.sidebar.expander("Debug: this rerun", expanded=True):
+        st.markdown(f"**{trace.seconds * 1000:.0f} ms** on the server, peak memory **{trace.peak_rss_mb or 0:.0f} MB**.")
+        st.dataframe([{'Stage': '\u2003' * depth + name, 'ms': round((seconds or 0) * 1000, 1)} for name, depth, seconds in trace.spans],
+                     hide_index=True)
+        if trace.payload:
+            st.dataframe([{'Payload': name, 'KB': round(size / 1024, 1)} for name, size in trace.payload.items()], hide_index=True)
+        st.dataframe([{'Cache': c['name'], 'Entries': c['size'], 'Hits': c['rerun_hits'], 'Misses': c['rerun_misses'], 'Evictions': c['evictions']}
+                      for c in trace.caches], hide_index=True)
+        st.caption("Cache hits and misses are for this rerun, across all sessions. Time in the browser is not included.")
+        st.download_button('Trace (JSON)', json.dumps(trace.record(), indent=2), 'npt-trace.json', 'application/json')
+        st.download_button('Metrics (OpenMetrics)', instrument.openmetrics(), 'npt-metrics.txt', 'application/openmetrics-text')
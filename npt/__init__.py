@@ -0,0 +1 @@
+#Network Prioritisation Tool - data and map engine used by home.py
@@ -0,0 +1,275 @@
+#compiled columnar copy of everything under data/
+#
+#the geojson/xlsx files stay the source inputs. build_bundle() reprojects the
+#spatial layers to EPSG:4326 and writes each dataset as an uncompressed Arrow
+#IPC file (geometry as WKB) so open_bundle() can memory-map it - a cold start is
+#a few ms and no geojson is parsed. only the Arrow tables are shared between
+#processes: frame() decodes a dataset into pandas columns and shapely geometry
+#in each process that asks for it, so every worker still holds its own decoded
+#copy of the layers it uses.
+#the bundle is keyed by a hash of the source files and rebuilt when they change.
+#
+#current() is the bundle every session reads. it checks data/ every few seconds
+#(file sizes and mtimes only) and, once changed files have settled, builds and
+#swaps in the new version without a restart. workers build under a file lock,
+#so behind a load balancer one process builds and the others map its output.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.ipc
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+BUNDLE_DIRNAME = '.bundle'
+
+#bump when the on-disk layout changes so old bundles are not reused
+BUNDLE_FORMAT = 1
+
+CRS = 'EPSG:4326'
+
+#seconds between checks of data/ for changes
+RELOAD_INTERVAL = 2.0
+
+#changed files must be this many seconds old before they are read, so a copy in progress is not
+SETTLE = 2.0
+
+#bundle versions kept on disk - processes still on an older one keep their mapping after it is removed
+KEEP_VERSIONS = 3
+
+SOURCES = {
+    'intersections_key_locations': 'intersections_key_locations.geojson',
+    'intersections_outside_primary': 'intersections_outside_primary.geojson',
+    'links_key_locations': 'links_key_locations.geojson',
+    'links_outside_primary': 'links_outside_primary.geojson',
+    'links_demand': 'links_demand.geojson',
+    'links_delay': 'links_delay.geojson',
+    'demand': 'demand.geojson',
+    'delay': 'delay.geojson',
+    'key_locations': 'key_locations.geojson',
+    'merged_intersections': 'merged_intersections.xlsx',
+    'merged_links': 'merged_links.xlsx',
+}
+
+
+def source_version(data_dir=DATA_DIR):
+    h = hashlib.sha256(f'npt-bundle-{BUNDLE_FORMAT}'.encode())
+    for name in sorted(SOURCES):
+        h.update(name.encode())
+        with open(os.path.join(data_dir, SOURCES[name]), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+
+def source_stamp(data_dir=DATA_DIR):
+    #(fingerprint, newest mtime) from the source files' sizes and mtimes - no contents read
+    h = hashlib.sha256()
+    newest = 0.0
+    for name in sorted(SOURCES):
+        stat = os.stat(os.path.join(data_dir, SOURCES[name]))
+        h.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+        newest = max(newest, stat.st_mtime)
+    return h.hexdigest()[:16], newest
+
+
+def bundle_path(version, data_dir=DATA_DIR):
+    return os.path.join(data_dir, BUNDLE_DIRNAME, version)
+
+
+def _read_source(path):
+    if path.endswith('.xlsx'):
+        import pandas as pd
+
+        return pa.Table.from_pandas(pd.read_excel(path), preserve_index=False), False
+
+    import geopandas as gpd
+
+    gdf = gpd.read_file(path).to_crs(CRS)
+    return pa.table(gdf.to_arrow(geometry_encoding='WKB')), True
+
+
+@contextmanager
+def _build_lock(root):
+    #one builder at a time across worker processes
+    try:
+        import fcntl
+    except ImportError:
+        #windows - builds still finish with an atomic rename, they just may run twice
+        yield
+        return
+    with open(os.path.join(root, '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_bundle(data_dir=DATA_DIR, version=None):
+    version = version or source_version(data_dir)
+    target = bundle_path(version, data_dir)
+    if os.path.exists(os.path.join(target, 'manifest.json')):
+        return target
+
+    root = os.path.dirname(target)
+    os.makedirs(root, exist_ok=True)
+    with _build_lock(root):
+        if os.path.exists(os.path.join(target, 'manifest.json')):
+            return target
+        _build(data_dir, version, target)
+    return target
+
+
+def _build(data_dir, version, target):
+    root = os.path.dirname(target)
+    tmp = tempfile.mkdtemp(prefix=f'{version}.', dir=root)
+
+    try:
+        manifest = {'version': version, 'format': BUNDLE_FORMAT, 'crs': CRS, 'datasets': {}}
+
+        for name, filename in SOURCES.items():
+            table, spatial = _read_source(os.path.join(data_dir, filename))
+            with pa.OSFile(os.path.join(tmp, f'{name}.arrow'), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+            manifest['datasets'][name] = {
+                'file': f'{name}.arrow',
+                'source': filename,
+                'spatial': spatial,
+                'rows': table.num_rows,
+            }
+
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        #another worker may have finished the same version first - keep theirs
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            if not os.path.exists(os.path.join(target, 'manifest.json')):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def prune(data_dir=DATA_DIR, keep=KEEP_VERSIONS, current=None):
+    #remove all but the newest built versions, never the one named current
+    root = os.path.join(data_dir, BUNDLE_DIRNAME)
+    if not os.path.isdir(root):
+        return []
+    built = [name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, 'manifest.json'))]
+    built.sort(key=lambda name: os.stat(os.path.join(root, name, 'manifest.json')).st_mtime, reverse=True)
+    removed = [name for name in built[keep:] if name != current]
+    for name in removed:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return removed
+
+
+class Bundle:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        #every file is mapped up front (no data is read), so the version stays readable if pruned
+        self._tables = {name: self._map(name) for name in self.manifest['datasets']}
+        self._frames = {}
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def names(self):
+        return list(self.manifest['datasets'])
+
+    def is_spatial(self, name):
+        return self.manifest['datasets'][name]['spatial']
+
+    def _map(self, name):
+        #a view over the memory-mapped file - nothing is read until a frame is decoded
+        source = pa.memory_map(os.path.join(self.path, self.manifest['datasets'][name]['file']))
+        return pa.ipc.open_file(source).read_all()
+
+    def table(self, name):
+        return self._tables[name]
+
+    def frame(self, name):
+        #decoded on first use and kept - a copy per process, not shared with other workers
+        if name not in self._frames:
+            table = self.table(name)
+            if self.is_spatial(name):
+                import geopandas as gpd
+
+                self._frames[name] = gpd.GeoDataFrame.from_arrow(table)
+            else:
+                self._frames[name] = table.to_pandas()
+        return self._frames[name]
+
+
+def open_bundle(data_dir=DATA_DIR):
+    return Bundle(build_bundle(data_dir))
+
+
+class BundleStore:
+    #the bundle this process serves, swapped for a new version when data/ changes
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.bundle = None
+        self.stamp = None
+        self.error = None
+        self.checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        if self.bundle is not None and time.monotonic() - self.checked < RELOAD_INTERVAL:
+            return self.bundle
+        with self._lock:
+            if self.bundle is None or time.monotonic() - self.checked >= RELOAD_INTERVAL:
+                self._refresh()
+                self.checked = time.monotonic()
+        return self.bundle
+
+    def _refresh(self):
+        try:
+            stamp, newest = source_stamp(self.data_dir)
+        except OSError:
+            #a file is missing mid-swap - keep serving what is loaded
+            if self.bundle is None:
+                raise
+            return
+        if stamp == self.stamp:
+            return
+        if self.bundle is not None and time.time() - newest < SETTLE:
+            return
+        try:
+            bundle = Bundle(build_bundle(self.data_dir))
+        except Exception as e:
+            #unreadable new files - keep the loaded version and report why, until the files change again
+            if self.bundle is None:
+                raise
+            self.stamp, self.error = stamp, e
+            return
+        self.bundle, self.stamp, self.error = bundle, stamp, None
+        prune(self.data_dir, current=bundle.version)
+
+
+STORE = BundleStore()
+
+
+def current():
+    return STORE.current()
+
+
+if __name__ == '__main__':
+    path = build_bundle()
+    print(f'bundle written to {path}')
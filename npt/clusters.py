@@ -0,0 +1,186 @@
+#zoom-level clustering of intersection markers
+#
+#a supercluster-style hierarchy, built once per data version and node dataset:
+#starting from the single nodes, each zoom from MAX_ZOOM down greedily merges the
+#clusters of the zoom above that lie within RADIUS pixels of a seed (busiest
+#first), so every cluster is a union of clusters one zoom in. a cluster carries
+#its node count, the sums of the demand columns and the max of the severity
+#columns. maps draw the level for the current zoom - a few dozen markers for the
+#whole region - and the single nodes beyond MAX_ZOOM.
+
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import shapely
+from branca.element import MacroElement
+from jinja2 import Template
+
+from npt.cache import LRUCache
+
+#clusters are drawn up to this zoom, single nodes above it
+MAX_ZOOM = 13
+
+MIN_ZOOM = 0
+
+#pixels within which markers are merged
+RADIUS = 40
+
+TILE_SIZE = 256
+
+#aggregates carried by every cluster - demand adds up, severity is the worst node
+SUMS = ('ADT_PT', 'AM_PT')
+MAXES = ('DELAY_WAVG',)
+
+LABELS = {
+    'count': 'Intersections',
+    'ADT_PT': 'Daily PT trips (total)',
+    'AM_PT': 'AM peak PT trips (total)',
+    'DELAY_WAVG': 'Delay/hr per bus movement (worst)',
+}
+
+CLUSTER_CACHE = LRUCache('clusters', maxsize=16)
+
+
+def _mercator(lon, lat):
+    #lon/lat to the unit web mercator square
+    sin = np.sin(np.radians(np.clip(lat, -85.0511, 85.0511)))
+    return lon / 360 + 0.5, 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi
+
+
+def _lonlat(x, y):
+    return (x - 0.5) * 360, np.degrees(2 * np.arctan(np.exp((0.5 - y) * 2 * math.pi)) - math.pi / 2)
+
+
+def _merge(level, radius):
+    #clusters of the next zoom out - each unclaimed cluster, busiest first, claims the unclaimed ones within radius
+    points = shapely.points(level['x'].to_numpy(), level['y'].to_numpy())
+    seed, near = shapely.STRtree(points).query(points, predicate='dwithin', distance=radius)
+    starts = np.searchsorted(seed, np.arange(len(points) + 1))
+    owner = np.full(len(points), -1)
+    for p in np.argsort(-level['count'].to_numpy(), kind='stable'):
+        if owner[p] >= 0:
+            continue
+        claimed = near[starts[p]:starts[p + 1]]
+        owner[claimed[owner[claimed] < 0]] = p
+
+    weight = level['count'].to_numpy()
+    groups = level.assign(x=level['x'] * weight, y=level['y'] * weight).groupby(owner, sort=True)
+    merged = groups[['count', 'x', 'y']].sum()
+    for column in SUMS:
+        merged[column] = groups[column].sum(min_count=1)
+    for column in MAXES:
+        merged[column] = groups[column].max()
+    merged['x'] /= merged['count']
+    merged['y'] /= merged['count']
+    return merged.reset_index(drop=True)
+
+
+class ClusterIndex:
+
+    def __init__(self, gdf):
+        geoms = np.asarray(gdf.geometry.array, dtype=object)
+        points = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+        lon, lat = shapely.get_x(geoms[points]), shapely.get_y(geoms[points])
+        x, y = _mercator(lon, lat)
+        level = pd.DataFrame({'count': np.ones(len(x), dtype=np.int64), 'x': x, 'y': y})
+        for column in SUMS + MAXES:
+            level[column] = gdf[column].to_numpy(dtype=float)[points] if column in gdf else np.nan
+
+        self.levels = {}
+        for z in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+            level = _merge(level, RADIUS / (TILE_SIZE * 2 ** z))
+            self.levels[z] = level
+
+    def clusters(self, zoom, bounds=None):
+        #DataFrame of the clusters at this zoom with lon/lat, None above MAX_ZOOM where nodes are drawn
+        if zoom > MAX_ZOOM:
+            return None
+        level = self.levels[max(MIN_ZOOM, int(zoom))]
+        lon, lat = _lonlat(level['x'].to_numpy(), level['y'].to_numpy())
+        out = level.drop(columns=['x', 'y']).assign(lon=lon, lat=lat)
+        if bounds is not None:
+            minx, miny, maxx, maxy = bounds
+            out = out[(out['lon'] >= minx) & (out['lon'] <= maxx) & (out['lat'] >= miny) & (out['lat'] <= maxy)]
+        return out
+
+
+def cluster_index(data, dataset):
+    return CLUSTER_CACHE.get_or_build((data.version, dataset), lambda: ClusterIndex(data.frame(dataset)))
+
+
+def radius(count):
+    #marker radius in pixels, growing with the nodes in the cluster
+    return 6 + 3 * np.log2(np.asarray(count, dtype=float))
+
+
+def colours(level, colour, colormap=None):
+    #the layer colour, or the colormap over each cluster's worst delay when the view is a choropleth
+    if colormap is None:
+        return [colour] * len(level.index)
+    return [colormap.rgb_hex_str(v) if not np.isnan(v) else colour for v in level['DELAY_WAVG'].to_numpy(dtype=float)]
+
+
+class ClusterLayer(MacroElement):
+    #swaps a node layer for the cluster markers of the current zoom, inside the group the layer control switches
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function (map, group, nodes, levels, labels, maxZoom, minZoom) {
+                var built = {};
+                function tooltip(values) {
+                    return '<table>' + labels.map(function (label, i) {
+                        var value = values[i] === null ? 'n/a' : values[i].toLocaleString('en-NZ', {maximumFractionDigits: 0});
+                        return '<tr><th>' + label + '</th><td>' + value + '</td></tr>';
+                    }).join('') + '</table>';
+                }
+                var shown = null;
+                function level(z) {
+                    if (!built[z]) {
+                        built[z] = L.layerGroup(levels[z].map(function (c) {
+                            var marker = L.circleMarker([c[0], c[1]], {
+                                radius: c[2], color: c[3], fillColor: c[3], weight: 1, opacity: 0.9, fillOpacity: 0.7
+                            });
+                            marker.bindTooltip(tooltip(c.slice(4)), {sticky: true});
+                            marker.on('click', function () {
+                                map.flyTo(marker.getLatLng(), Math.min(map.getZoom() + 2, maxZoom + 1));
+                            });
+                            return marker;
+                        }));
+                    }
+                    return built[z];
+                }
+                function update() {
+                    var z = Math.round(map.getZoom());
+                    var next = z > maxZoom ? nodes : level(Math.max(z, minZoom));
+                    if (next === shown) { return; }
+                    if (shown) { group.removeLayer(shown); }
+                    group.addLayer(next);
+                    shown = next;
+                }
+                group.removeLayer(nodes);
+                map.on('zoomend', update);
+                map.whenReady(update);
+            })({{ this.map.get_name() }}, {{ this._parent.get_name() }}, {{ this.nodes.get_name() }},
+               {{ this.levels }}, {{ this.labels|tojson }}, {{ this.max_zoom }}, {{ this.min_zoom }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, m, nodes, index, colour, colormap=None):
+        super().__init__()
+        self._name = 'ClusterLayer'
+        self.map = m
+        self.nodes = nodes
+        self.max_zoom = MAX_ZOOM
+        self.min_zoom = MIN_ZOOM
+        self.labels = list(LABELS.values())
+        #[lat, lon, radius, colour, *aggregates] per cluster - the tooltip is made in the browser
+        levels = {}
+        for z in index.levels:
+            level = index.clusters(z)
+            values = level[list(LABELS)].round().astype(object).where(level[list(LABELS)].notna(), None)
+            rows = zip(level['lat'].round(6), level['lon'].round(6), radius(level['count']).round(1),
+                       colours(level, colour, colormap), values.itertuples(index=False, name=None))
+            levels[z] = [[lat, lon, r, c, *v] for lat, lon, r, c, v in rows]
+        self.levels = json.dumps(levels)
@@ -0,0 +1,193 @@
+#corridors - contiguous road segments merged into one feature
+#
+#links of the chosen datasets that share an A/B node are one corridor (the
+#components of npt.network's graph restricted to those links). a corridor's
+#figures are weighted by the length of its links, so a 20 m stub counts for 20 m
+#rather than as much as a 660 m link:
+#
+#    LOS, ADT_PT, AM_PT, buses   length-weighted means
+#    passenger_km                daily PT passenger-km, sum of ADT_PT x km
+#    delay_s                     delay/hr per bus movement summed over the intersections it passes
+#    bus_delay_s                 delay_s x buses/hr, the seconds lost by all its buses each hour
+#
+#all links are aggregated in one groupby and the geometry of each corridor is
+#its links line-merged, so a corridor draws as one feature. the two directions
+#of a road are one segment: its length is counted once.
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from npt import network, thresholds
+from npt.cache import LRUCache
+from npt.stats import link_length_m
+from npt.views import LAYERS
+
+#link attributes averaged over a corridor's length
+WEIGHTED = ('LOS', 'ADT_PT', 'AM_PT', 'buses')
+
+LABELS = {
+    'name': 'Corridor',
+    'links': 'Road segments',
+    'length_km': 'Length (km)',
+    'passenger_km': 'Daily PT passenger-km',
+    'ADT_PT': 'Daily PT trips (length-weighted)',
+    'AM_PT': 'AM peak PT trips (length-weighted)',
+    'LOS': 'LoS (length-weighted)',
+    'buses': 'Buses/hr (length-weighted)',
+    'intersections': 'Intersections',
+    'delay_s': 'Delay/hr per bus (s)',
+    'bus_delay_s': 'Bus delay/hr, all buses (s)',
+}
+
+CORRIDOR_CACHE = LRUCache('corridors', maxsize=16)
+
+LAYER_BY_DATASET = {layer.dataset: layer for layer in LAYERS.values()}
+
+
+def _labels(graph, rows):
+    #corridor of each link - links outside the graph are corridors of their own
+    labels = np.full(len(rows), -1, dtype=np.int64)
+    found = rows >= 0
+    unique = np.unique(rows[found])
+    if len(unique):
+        labels[found] = graph.corridors(unique)[np.searchsorted(unique, rows[found])]
+    first = labels.max() + 1 if found.any() else 0
+    labels[~found] = np.arange(first, first + int((~found).sum()))
+    return labels
+
+
+def _node_delay(data, graph):
+    #DELAY_WAVG at each graph node, from every intersection source of this data
+    delay = np.full(len(graph), np.nan)
+    for name in thresholds.NODE_SOURCES:
+        frame = data.frame(name)
+        if 'DELAY_WAVG' not in frame or not len(frame.index):
+            continue
+        rows = graph.node_rows(frame)
+        found = rows >= 0
+        nodes = graph.node_index[rows[found]]
+        delay[nodes] = np.fmax(delay[nodes], frame['DELAY_WAVG'].to_numpy(dtype=float)[found])
+    return delay
+
+
+def _link_buses(data, graph):
+    #buses/hr of each graph link - the registry layers only carry it after a reclassify
+    found = thresholds.candidates(data).frames['links']
+    rows = graph.link_rows(found)
+    buses = np.full(len(graph.links.index), np.nan)
+    buses[rows[rows >= 0]] = found['buses'].to_numpy(dtype=float)[rows >= 0]
+    return buses
+
+
+def _segments(graph, rows, geoms):
+    #a key per physical segment - the undirected node pair of graph links, the normalised line of the rest
+    n = len(graph)
+    a, b = graph.link_a[rows.clip(0)], graph.link_b[rows.clip(0)]
+    keys = np.minimum(a, b) * n + np.maximum(a, b)
+    outside = rows < 0
+    if outside.any():
+        _, lines = np.unique(shapely.to_wkb(shapely.normalize(geoms[outside])), return_inverse=True)
+        keys[outside] = -1 - lines
+    return keys
+
+
+def build_corridors(data, datasets):
+    import geopandas as gpd
+
+    graph = network.network(data)
+    frames = [data.frame(name) for name in datasets]
+    names = [LAYER_BY_DATASET[name].label for name in datasets]
+    links = pd.concat([
+        pd.DataFrame({
+            'row': graph.link_rows(frame),
+            'name': frame[label].to_numpy(dtype=object) if label in frame else None,
+            'length': np.nan_to_num(link_length_m(frame)),
+            **{column: frame[column].to_numpy(dtype=float) if column in frame else np.nan for column in WEIGHTED},
+            'geometry': np.asarray(frame.geometry.array, dtype=object),
+        })
+        for frame, label in zip(frames, names)
+    ], ignore_index=True)
+    #a link in more than one dataset is counted once
+    links = links[(links['row'] < 0) | ~links['row'].duplicated()].reset_index(drop=True)
+    if not len(links.index):
+        return gpd.GeoDataFrame({'corridor': [], **{column: [] for column in LABELS}}, geometry=[], crs='EPSG:4326')
+
+    rows = links['row'].to_numpy()
+    if not any('buses' in frame for frame in frames):
+        links['buses'] = np.where(rows >= 0, _link_buses(data, graph)[rows.clip(0)], np.nan)
+
+    #both directions of a road are one physical segment - an undirected A/B in the graph, else the same line.
+    #a direction repeating the other's figures is dropped; directions with their own figures share its length
+    links['segment'] = _segments(graph, rows, links['geometry'].to_numpy())
+    links = links.drop_duplicates(['segment', *WEIGHTED]).reset_index(drop=True)
+    rows = links['row'].to_numpy()
+    segments = links.groupby('segment')
+    directions = segments['segment'].transform('size').to_numpy()
+    length = segments['length'].transform('max').to_numpy()
+    share = length / directions
+
+    labels = _labels(graph, rows)
+    sums = {'links': 1 / directions, 'length_m': share,
+            'passenger_km': np.nan_to_num(links['ADT_PT'].to_numpy() * length / 1000)}
+    for column in WEIGHTED:
+        values = links[column].to_numpy()
+        valid = ~np.isnan(values)
+        sums[f'{column}_wsum'] = np.where(valid, values * share, 0)
+        sums[f'{column}_w'] = np.where(valid, share, 0)
+    out = pd.DataFrame(sums).groupby(labels, sort=True).sum()
+    for column in WEIGHTED:
+        w = out.pop(f'{column}_w')
+        out[column] = (out.pop(f'{column}_wsum') / w).where(w > 0)
+
+    #the name of a corridor is its longest named link's
+    names = links['name'].where(links['name'].astype(str).str.strip().ne('')).to_numpy(dtype=object)
+    order = np.lexsort((-length, pd.isna(names), labels))
+    first = order[np.r_[True, labels[order][1:] != labels[order][:-1]]]
+    out['name'] = names[first]
+
+    #intersections at either end of any of its links, each counted once
+    corridor = np.concatenate([labels, labels])[np.concatenate([rows, rows]) >= 0]
+    ends = np.concatenate([graph.link_a[rows[rows >= 0]], graph.link_b[rows[rows >= 0]]])
+    pairs = np.unique(np.column_stack([corridor, ends]), axis=0) if len(ends) else np.zeros((0, 2), dtype=np.int64)
+    delay = _node_delay(data, graph)[pairs[:, 1]]
+    known = ~np.isnan(delay)
+    out['intersections'] = np.bincount(pairs[known, 0], minlength=len(out.index))
+    out['delay_s'] = np.bincount(pairs[known, 0], weights=delay[known], minlength=len(out.index))
+    out['delay_s'] = out['delay_s'].where(out['intersections'] > 0)
+    out['bus_delay_s'] = out['delay_s'] * out['buses']
+
+    #the lines of each corridor, grouped in label order, then merged end to end
+    drawn = ~links['segment'].duplicated().to_numpy()
+    parts, index = shapely.get_parts(links['geometry'].to_numpy()[drawn], return_index=True)
+    index = np.flatnonzero(drawn)[index]
+    lines = shapely.get_type_id(parts) == shapely.GeometryType.LINESTRING
+    parts, corridor = parts[lines], labels[index[lines]]
+    order = np.argsort(corridor, kind='stable')
+    merged = np.empty(len(out.index), dtype=object)
+    shapely.multilinestrings(parts[order], indices=corridor[order], out=merged)
+    merged = shapely.line_merge(merged)
+
+    out['length_km'] = out.pop('length_m') / 1000
+    out['links'] = out['links'].round().astype(np.int64)
+    out = out.reset_index(drop=True).rename_axis('corridor').reset_index()
+    out = gpd.GeoDataFrame(out[['corridor', *LABELS]], geometry=merged, crs=frames[0].crs)
+    return out.sort_values('passenger_km', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def corridor_frame(data, datasets):
+    #one row per corridor of the links in these datasets, busiest (passenger-km) first
+    datasets = tuple(datasets)
+    return CORRIDOR_CACHE.get_or_build((data.version, datasets), lambda: build_corridors(data, datasets))
+
+
+def view_corridors(view, data):
+    return corridor_frame(data, [layer.dataset for layer in view.layers if layer.kind == 'links'])
+
+
+def table(corridors):
+    #the corridors with readable column names, for the app
+    out = pd.DataFrame(corridors[list(LABELS)]).rename(columns=LABELS)
+    out[LABELS['name']] = out[LABELS['name']].where(out[LABELS['name']].notna(), 'Unnamed')
+    return out.round({LABELS['length_km']: 2, LABELS['passenger_km']: 0, LABELS['ADT_PT']: 0, LABELS['AM_PT']: 0,
+                      LABELS['LOS']: 1, LABELS['buses']: 1, LABELS['delay_s']: 0, LABELS['bus_delay_s']: 0})
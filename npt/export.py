@@ -0,0 +1,186 @@
+#export of the selected locations as GeoParquet, FlatGeobuf, GeoJSON or CSV
+#
+#    python -m npt.export "Priority locations" Roads --format GeoParquet --out priority_links.parquet
+#
+#every layer of a view is read in slices of CHUNKSIZE rows into Arrow record
+#batches of one fixed schema (geometry as WKB) and each batch is written as it
+#is made, so an export holds one chunk at a time, not a copy of the network.
+#the same batches feed every format: parquet row groups, a FlatGeobuf written
+#by GDAL with its packed R-tree index, and GeoJSON or CSV text.
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from npt import views
+
+#rows per record batch
+CHUNKSIZE = 50_000
+
+Format = namedtuple('Format', ['extension', 'mime'])
+
+FORMATS = {
+    'GeoParquet': Format('parquet', 'application/vnd.apache.parquet'),
+    'FlatGeobuf': Format('fgb', 'application/octet-stream'),
+    'GeoJSON': Format('geojson', 'application/geo+json'),
+    'CSV': Format('csv', 'text/csv'),
+}
+
+#model attributes exported for links and intersections, nan where a layer does not have them
+NUMERIC = ('A', 'B', 'N', 'ADT_PT', 'AM_PT', 'IP_PT', 'PM_PT', 'LOS', 'DELAY_WAVG', 'LOS_WAVG', 'buses', 'length')
+
+SCHEMA = pa.schema(
+    [('layer', pa.string()), ('category', pa.string()), ('kind', pa.string()), ('name', pa.string())]
+    + [(column, pa.float64()) for column in NUMERIC]
+    + [('geometry', pa.binary())]
+)
+
+
+def _batch(layer, part):
+    n = len(part.index)
+    names = part[layer.label].astype(object).where(part[layer.label].notna(), None) if layer.label in part else [None] * n
+    arrays = [
+        pa.array([layer.name] * n, pa.string()),
+        pa.array([layer.category] * n, pa.string()),
+        pa.array([views.KINDS[layer.kind].noun] * n, pa.string()),
+        pa.array([None if v is None else str(v) for v in names], pa.string()),
+    ]
+    for column in NUMERIC:
+        values = pd.to_numeric(part[column], errors='coerce').to_numpy(dtype=float) if column in part else np.full(n, np.nan)
+        arrays.append(pa.array(values, pa.float64(), from_pandas=True))
+    arrays.append(pa.array(shapely.to_wkb(np.asarray(part.geometry.array, dtype=object)), pa.binary()))
+    return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+def batches(view, data, chunksize=CHUNKSIZE):
+    #record batches of every layer of the view, chunksize rows at a time
+    for layer in view.layers:
+        frame = data.frame(layer.dataset)
+        for start in range(0, len(frame.index), chunksize):
+            yield _batch(layer, frame.iloc[start:start + chunksize])
+
+
+def _geometries(batch):
+    return shapely.from_wkb(batch.column('geometry').to_numpy(zero_copy_only=False))
+
+
+def write_geoparquet(source, f):
+    import pyarrow.parquet as pq
+
+    #GeoParquet 1.0 metadata - no crs means OGC:CRS84, i.e. lon/lat as the bundle stores it
+    geo = {'version': '1.0.0', 'primary_column': 'geometry',
+           'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': []}}}
+    schema = SCHEMA.with_metadata({b'geo': json.dumps(geo).encode()})
+    with pq.ParquetWriter(f, schema, compression='zstd') as writer:
+        for batch in source:
+            writer.write_batch(batch)
+
+
+def write_flatgeobuf(source, path):
+    import pyogrio
+
+    #GDAL needs a path - it buffers the features to sort them along the R-tree
+    field = SCHEMA.field('geometry').with_metadata({b'ARROW:extension:name': b'geoarrow.wkb'})
+    schema = SCHEMA.set(SCHEMA.get_field_index('geometry'), field)
+    reader = pa.RecordBatchReader.from_batches(schema, (pa.RecordBatch.from_arrays(b.columns, schema=schema) for b in source))
+    pyogrio.write_arrow(reader, path, driver='FlatGeobuf', geometry_name='geometry', geometry_type='Unknown',
+                        crs='EPSG:4326', layer_options={'SPATIAL_INDEX': 'YES'})
+
+
+def write_geojson(source, f):
+    text = io.TextIOWrapper(f, encoding='utf-8', write_through=True)
+    text.write('{"type":"FeatureCollection","features":[')
+    first = True
+    for batch in source:
+        frame = batch.drop_columns(['geometry']).to_pandas()
+        records = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+        columns = list(frame.columns)
+        for properties, geometry in zip(records, shapely.to_geojson(_geometries(batch))):
+            text.write(('' if first else ',') + '{"type":"Feature","properties":'
+                       + json.dumps(dict(zip(columns, properties)), separators=(',', ':')) + f',"geometry":{geometry}}}')
+            first = False
+    text.write(']}\n')
+    text.detach()
+
+
+def write_csv(source, f):
+    import pyarrow.csv
+
+    #geometry as WKT, so the file opens in a spreadsheet or QGIS
+    schema = SCHEMA.set(SCHEMA.get_field_index('geometry'), pa.field('geometry', pa.string()))
+    with pyarrow.csv.CSVWriter(f, schema) as writer:
+        for batch in source:
+            wkt = pa.array(shapely.to_wkt(_geometries(batch), rounding_precision=-1), pa.string())
+            writer.write_batch(pa.RecordBatch.from_arrays(batch.columns[:-1] + [wkt], schema=schema))
+
+
+def write(view, data, fmt, target, chunksize=CHUNKSIZE):
+    #writes the view's features to a path or binary file object
+    source = batches(view, data, chunksize)
+    if fmt == 'FlatGeobuf':
+        if isinstance(target, str):
+            return write_flatgeobuf(source, target)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'export.fgb')
+            write_flatgeobuf(source, path)
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, target)
+        return None
+
+    writer = {'GeoParquet': write_geoparquet, 'GeoJSON': write_geojson, 'CSV': write_csv}[fmt]
+    if isinstance(target, str):
+        with open(target, 'wb') as f:
+            return writer(source, f)
+    return writer(source, target)
+
+
+def to_bytes(view, data, fmt, chunksize=CHUNKSIZE):
+    #the whole export - for the app's download button, which holds the file in memory anyway
+    f = io.BytesIO()
+    write(view, data, fmt, f, chunksize)
+    return f.getvalue()
+
+
+def file_name(view, fmt):
+    from npt.snapshots import view_slug
+
+    return f'npt-{view_slug(view)}.{FORMATS[fmt].extension}'
+
+
+def main(argv=None):
+    from npt import report, scenarios
+
+    parser = argparse.ArgumentParser(prog='python -m npt.export', description='Export the locations of an NPT view.')
+    parser.add_argument('analysis', choices=list(views.ANALYSES))
+    parser.add_argument('data', choices=list(views.DATA_TYPES))
+    parser.add_argument('--format', default='GeoParquet', choices=list(FORMATS))
+    parser.add_argument('--scenario', default=scenarios.BASE, help='model scenario (default: %(default)s)')
+    parser.add_argument('--out', help='output file, - for stdout (default: the view name with the format extension)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='rows per batch (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    view = views.get_view(args.analysis, args.data)
+    try:
+        data = report.load(args.scenario)
+    except KeyError:
+        parser.error(f'unknown scenario: {args.scenario}')
+    out = args.out or file_name(view, args.format)
+    if out == '-':
+        write(view, data, args.format, sys.stdout.buffer, args.chunksize)
+    else:
+        write(view, data, args.format, out, args.chunksize)
+        print(f'{args.analysis} / {args.data} written to {out}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
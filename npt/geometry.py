@@ -0,0 +1,107 @@
+#zoom-banded geometry generalisation and quantisation
+#
+#each layer is projected once to web mercator, simplified per zoom band with a
+#tolerance of about a pixel (Douglas-Peucker keeps every link's end nodes, so
+#adjacent links still meet), then snapped to a lon/lat grid fitted to the band.
+#links that meet snap to the same grid point, so there are no gaps between them
+#at any band, and the rounded coordinates keep the map and tile payloads small.
+#every feature keeps its own coordinates - nothing is shared between adjacent
+#links, and the payloads stay plain GeoJSON.
+
+import math
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from npt.cache import LRUCache
+
+#max zoom served by each band - 16 is street level and effectively full detail
+BANDS = (11, 13, 16)
+
+TILE_SIZE = 256
+EARTH_RADIUS = 6378137
+
+LEVEL_CACHE = LRUCache('geometry', maxsize=64)
+
+_TO_MERCATOR = Transformer.from_crs('EPSG:4326', 'EPSG:3857', always_xy=True)
+_FROM_MERCATOR = Transformer.from_crs('EPSG:3857', 'EPSG:4326', always_xy=True)
+
+
+def metres_per_pixel(z):
+    return 2 * math.pi * EARTH_RADIUS / (TILE_SIZE * 2 ** z)
+
+
+def decimals(z):
+    #decimal places of a degree needed to resolve a pixel at zoom z
+    return max(0, math.ceil(-math.log10(360 / (TILE_SIZE * 2 ** z))))
+
+
+def band_for_zoom(z):
+    for band in BANDS:
+        if z <= band:
+            return band
+    return BANDS[-1]
+
+
+def fit_zoom(bounds, width=900, height=700):
+    #zoom leaflet picks when fitting these lon/lat bounds into the map
+    minx, miny, maxx, maxy = bounds
+    x0, y0 = _TO_MERCATOR.transform(minx, miny)
+    x1, y1 = _TO_MERCATOR.transform(maxx, maxy)
+    span = max((x1 - x0) / width, (y1 - y0) / height, 1e-9)
+    return max(0, min(18, math.floor(math.log2(2 * math.pi * EARTH_RADIUS / TILE_SIZE / span))))
+
+
+def _transform(transformer):
+    return lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+
+
+def quantise(geoms, z):
+    #integer grid coordinates plus the feature each vertex belongs to
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    q = 10.0 ** -decimals(z)
+    grid = np.round(coords / q).astype(np.int64)
+
+    #drop vertices that collapse onto the previous one, but keep at least two per line
+    same = np.zeros(len(grid), dtype=bool)
+    same[1:] = (grid[1:] == grid[:-1]).all(axis=1) & (index[1:] == index[:-1])
+    ends = np.zeros(len(grid), dtype=bool)
+    ends[:-1] = index[1:] != index[:-1]
+    ends[1:] |= index[1:] != index[:-1]
+    ends[:1] = ends[-1:] = True
+    keep = ~same | ends
+    return grid[keep], index[keep], q
+
+
+def generalise(geoms, z):
+    #lines simplified to a pixel at zoom z and snapped to the quantisation grid
+    geoms = np.asarray(geoms, dtype=object)
+    types = shapely.get_type_id(geoms)
+    if np.isin(types, (1, 5)).any():
+        merc = shapely.transform(geoms, _transform(_TO_MERCATOR))
+        merc = shapely.simplify(merc, metres_per_pixel(z), preserve_topology=True)
+        geoms = shapely.transform(merc, _transform(_FROM_MERCATOR))
+
+    if len(geoms) and ((types == 0).all() or (types == 1).all()):
+        grid, index, q = quantise(geoms, z)
+        coords = np.round(grid * q, decimals(z))
+        if types[0] == 0:
+            return shapely.points(coords)
+        return shapely.linestrings(coords, indices=index)
+
+    #multi-part or missing geometries are only rounded to the grid
+    places = decimals(z)
+    return shapely.transform(geoms, lambda coords: np.round(coords, places))
+
+
+def level(data, dataset, band):
+    #the dataset with geometry generalised for a zoom band, cached per data version
+    def build():
+        import geopandas as gpd
+
+        gdf = data.frame(dataset)
+        geoms = generalise(np.asarray(gdf.geometry.array, dtype=object), band)
+        return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs))
+
+    return LEVEL_CACHE.get_or_build((data.version, dataset, band), build)
@@ -0,0 +1,372 @@
+#buses per hour on the network links from a GTFS feed
+#
+#each trip's shape (shapes.txt) is matched to the graph links it runs along: an
+#STRtree gives the links near every shape, and a link is on the shape when points
+#along it all lie within MATCH_METRES and the shape passes its start before its
+#end, so only the direction the bus runs is matched. shapely does the distance
+#and projection work for every (shape, link) pair in one call, so the cost
+#follows the number of distinct shapes, not of trips. a trip reaches a matched
+#link at its fraction along the shape between the trip's first and last times,
+#and trips reaching a link inside a period give its buses/hr for that period.
+#feeds without shapes fall back to snapping each stop to the link under it.
+#
+#results are cached in the process and on disk under data/.frequency, keyed on
+#the feed's content hash and the bundle version, so a feed is matched once.
+
+import hashlib
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+import shapely
+
+from npt import bundle, network, spatial
+from npt.cache import LRUCache
+
+#rows of stop_times read at a time
+CHUNKSIZE = 200_000
+
+#model periods buses/hr is counted over, as GTFS times - the TTSM AM_PT, IP_PT and PM_PT periods
+PERIODS = {
+    'AM': ('07:00:00', '09:00:00'),
+    'IP': ('09:00:00', '15:00:00'),
+    'PM': ('16:00:00', '18:00:00'),
+}
+
+#how far a shape may be from a link it runs along, in metres
+MATCH_METRES = 15
+
+#fractions along a link that must all be near a shape for the shape to run along it
+MATCH_SAMPLES = (0.1, 0.5, 0.9)
+
+#how far a stop may be from the link it is snapped to, in metres
+SNAP_METRES = 30
+
+#the link's direction is taken over this distance either side of the stop, in metres
+HEADING_METRES = 5
+
+#route_type values for buses - 3, and the extended 700 range
+BUS_ROUTE_TYPES = (3, *range(700, 800))
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+FREQUENCY_DIR = os.path.join(bundle.DATA_DIR, '.frequency')
+
+#bump when the matching changes, so cached results are not reused
+FREQUENCY_FORMAT = 1
+
+FREQUENCY_CACHE = LRUCache('frequency', maxsize=4)
+
+
+class Feed:
+    #a GTFS feed as a zip file or a directory of txt files
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+
+    def has(self, name):
+        if self._zip is not None:
+            return name in self._zip.namelist()
+        return os.path.exists(os.path.join(self.path, name))
+
+    def open(self, name):
+        if self._zip is not None:
+            return io.TextIOWrapper(self._zip.open(name), encoding='utf-8-sig')
+        return open(os.path.join(self.path, name), encoding='utf-8-sig')
+
+    def read(self, name, columns, **kwargs):
+        with self.open(name) as f:
+            return pd.read_csv(f, usecols=lambda c: c in columns, **kwargs)
+
+    def content_hash(self):
+        #sha256 over the feed's files, whatever it is packed in
+        digest = hashlib.sha256()
+        if self._zip is not None:
+            names = sorted(self._zip.namelist())
+        else:
+            names = sorted(n for n in os.listdir(self.path) if n.endswith('.txt'))
+        for name in names:
+            digest.update(name.encode() + b'\0')
+            with (self._zip.open(name) if self._zip is not None else open(os.path.join(self.path, name), 'rb')) as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+
+def service_ids(feed, weekday='tuesday'):
+    #services running on a typical weekday, or None when the feed has no calendar
+    if not feed.has('calendar.txt'):
+        return None
+    calendar = feed.read('calendar.txt', ('service_id', weekday), dtype={'service_id': str})
+    return set(calendar.loc[calendar[weekday] == 1, 'service_id'])
+
+
+def bus_trips(feed, weekday='tuesday'):
+    #trip_id and shape_id (where the feed has one) of the bus trips running on the weekday
+    routes = feed.read('routes.txt', ('route_id', 'route_type'), dtype={'route_id': str})
+    buses = set(routes.loc[routes['route_type'].isin(BUS_ROUTE_TYPES), 'route_id'])
+    trips = feed.read('trips.txt', ('route_id', 'service_id', 'trip_id', 'shape_id'), dtype=str)
+    trips = trips[trips['route_id'].isin(buses)]
+    services = service_ids(feed, weekday)
+    if services is not None:
+        trips = trips[trips['service_id'].isin(services)]
+    if 'shape_id' not in trips:
+        trips = trips.assign(shape_id=np.nan)
+    return trips[['trip_id', 'shape_id']].drop_duplicates('trip_id').reset_index(drop=True)
+
+
+def seconds(times):
+    #GTFS H:MM:SS (hours may pass 24) to seconds after midnight, nan where blank
+    parts = times.astype(str).str.extract(r'^\s*(\d+):(\d{2}):(\d{2})\s*$').astype(float)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy()
+
+
+def _windows(periods):
+    return {name: seconds(pd.Series(window)) for name, window in periods.items()}
+
+
+def read_stop_times(feed, chunksize=CHUNKSIZE):
+    #stop_times in chunks, with a time on every row that has one
+    columns = ('trip_id', 'stop_sequence', 'stop_id', 'arrival_time', 'departure_time')
+    with feed.open('stop_times.txt') as f:
+        for chunk in pd.read_csv(f, usecols=lambda c: c in columns, chunksize=chunksize,
+                                 dtype={'trip_id': str, 'stop_id': str, 'arrival_time': str, 'departure_time': str}):
+            times = seconds(chunk['departure_time'])
+            if 'arrival_time' in chunk:
+                times = np.where(np.isnan(times), seconds(chunk['arrival_time']), times)
+            yield chunk.assign(time=times)
+
+
+def _links(graph):
+    return spatial.project(np.asarray(graph.links.geometry.array, dtype=object))
+
+
+#stop matching, for feeds without shapes
+
+
+def _link_headings(links, at):
+    #unit direction of each projected link at distance `at` along it
+    before = shapely.line_interpolate_point(links, np.maximum(at - HEADING_METRES, 0))
+    after = shapely.line_interpolate_point(links, at + HEADING_METRES)
+    d = shapely.get_coordinates(after) - shapely.get_coordinates(before)
+    length = np.hypot(d[:, 0], d[:, 1])
+    return d / np.where(length > 0, length, 1)[:, None]
+
+
+class StopSnapper:
+    #candidate links within SNAP_METRES of every stop, with the link's heading there
+
+    def __init__(self, links, stops):
+        self.stop_ids = pd.Index(stops['stop_id'].astype(str))
+        points = spatial.project(shapely.points(stops['stop_lon'].to_numpy(dtype=float), stops['stop_lat'].to_numpy(dtype=float)))
+        self.xy = shapely.get_coordinates(points)
+
+        stop, link = shapely.STRtree(links).query(points, predicate='dwithin', distance=SNAP_METRES)
+        at = shapely.line_locate_point(links[link], points[stop])
+        heading = _link_headings(links[link], at)
+        self.candidates = pd.DataFrame({
+            'stop': stop,
+            'link': link,
+            'distance': shapely.distance(links[link], points[stop]),
+            'hx': heading[:, 0],
+            'hy': heading[:, 1],
+        })
+
+    def snap(self, stop, dx, dy):
+        #link under each (stop, travel direction), -1 where none runs that way within reach
+        moves = pd.DataFrame({'row': np.arange(len(stop)), 'stop': stop, 'dx': dx, 'dy': dy})
+        pairs = moves.merge(self.candidates, on='stop')
+        #a link counts when it runs with the bus - stationary moves take the nearest link either way
+        along = pairs['dx'] * pairs['hx'] + pairs['dy'] * pairs['hy']
+        still = (pairs['dx'] == 0) & (pairs['dy'] == 0)
+        pairs = pairs[(along > 0) | still].sort_values(['row', 'distance'], kind='stable')
+        best = pairs.drop_duplicates('row')
+        out = np.full(len(stop), -1, dtype=np.int64)
+        out[best['row'].to_numpy()] = best['link'].to_numpy()
+        return out
+
+
+def _trip_moves(chunk, snapper):
+    #stop index and the direction of travel from it, per stop_times row
+    stop = snapper.stop_ids.get_indexer(chunk['stop_id'].astype(str))
+    xy = np.where(stop[:, None] >= 0, snapper.xy[stop.clip(0)], np.nan)
+    trip = chunk['trip_id'].to_numpy()
+    same_next = np.r_[trip[1:] == trip[:-1], False]
+    same_prev = np.r_[False, trip[1:] == trip[:-1]]
+    nxt = np.r_[xy[1:], np.full((1, 2), np.nan)]
+    prv = np.r_[np.full((1, 2), np.nan), xy[:-1]]
+    #towards the next stop, or on from the previous one at the end of a trip
+    d = np.where(same_next[:, None], nxt - xy, np.where(same_prev[:, None], xy - prv, 0.0))
+    return stop, np.nan_to_num(d)
+
+
+def stop_frequency(graph, feed, trips, periods=PERIODS, chunksize=CHUNKSIZE, links=None):
+    #{period: buses/hr} on every graph link from the stops each trip makes on it -
+    #nan for links with no stop within reach, whose buses cannot be seen this way
+    trips = set(trips['trip_id'])
+    stops = feed.read('stops.txt', ('stop_id', 'stop_lat', 'stop_lon'), dtype={'stop_id': str}).dropna()
+    snapper = StopSnapper(_links(graph) if links is None else links, stops)
+    windows = _windows(periods)
+    counts = {name: np.zeros(len(graph.links.index), dtype=np.int64) for name in periods}
+
+    def count(chunk):
+        chunk = chunk[chunk['trip_id'].isin(trips)].sort_values(['trip_id', 'stop_sequence'], kind='stable')
+        if not len(chunk.index):
+            return
+        #untimed stops take the time of the stop before them
+        times = chunk['time'].groupby(chunk['trip_id'].to_numpy()).ffill().to_numpy()
+        stop, d = _trip_moves(chunk, snapper)
+        link = snapper.snap(stop, d[:, 0], d[:, 1])
+        for name, (start, end) in windows.items():
+            used = (link >= 0) & (times >= start) & (times < end)
+            served = pd.DataFrame({'trip': chunk['trip_id'].to_numpy()[used], 'link': link[used]}).drop_duplicates()
+            np.add.at(counts[name], served['link'].to_numpy(), 1)
+
+    #stop_times is grouped by trip, so the last trip of a chunk is held back to finish with the next
+    carry = None
+    for chunk in read_stop_times(feed, chunksize):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last = chunk['trip_id'].iloc[-1]
+        tail = (chunk['trip_id'] == last).to_numpy()
+        carry = chunk[tail]
+        count(chunk[~tail])
+    if carry is not None:
+        count(carry)
+
+    observed = np.zeros(len(graph.links.index), dtype=bool)
+    observed[snapper.candidates['link'].to_numpy()] = True
+    return {name: np.where(observed, counts[name] / ((end - start) / 3600), np.nan)
+            for name, (start, end) in windows.items()}
+
+
+#shape matching
+
+
+def read_shapes(feed, shape_ids=None):
+    #(shape ids, projected linestrings), for the given shapes only when given
+    shapes = feed.read('shapes.txt', ('shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'), dtype={'shape_id': str})
+    if shape_ids is not None:
+        shapes = shapes[shapes['shape_id'].isin(shape_ids)]
+    shapes = shapes.dropna().sort_values(['shape_id', 'shape_pt_sequence'], kind='stable')
+    ids, index = np.unique(shapes['shape_id'].to_numpy(), return_inverse=True)
+    #a linestring needs two points
+    enough = np.bincount(index, minlength=len(ids)) >= 2
+    keep = enough[index]
+    ids, index = np.unique(shapes['shape_id'].to_numpy()[keep], return_inverse=True)
+    coords = np.column_stack([shapes['shape_pt_lon'].to_numpy(dtype=float)[keep], shapes['shape_pt_lat'].to_numpy(dtype=float)[keep]])
+    lines = shapely.linestrings(coords, indices=index) if len(ids) else np.array([], dtype=object)
+    return ids, spatial.project(lines)
+
+
+def match_shapes(links, shapes):
+    #(shape, link, fraction along the shape) for every link a shape runs along, in its direction
+    shape, link = shapely.STRtree(links).query(shapes, predicate='dwithin', distance=MATCH_METRES)
+    if not len(shape):
+        return shape, link, np.zeros(0)
+    lines = shapes[shape]
+    samples = [shapely.line_interpolate_point(links[link], f, normalized=True) for f in MATCH_SAMPLES]
+    near = np.ones(len(shape), dtype=bool)
+    for points in samples:
+        near &= shapely.dwithin(lines, points, MATCH_METRES)
+    first = shapely.line_locate_point(lines, samples[0])
+    last = shapely.line_locate_point(lines, samples[-1])
+    along = near & (last > first)
+    middle = shapely.line_locate_point(lines, samples[len(samples) // 2], normalized=True)
+    return shape[along], link[along], middle[along]
+
+
+def trip_times(feed, trips, chunksize=CHUNKSIZE):
+    #first and last time of each trip, as a frame indexed by trip_id
+    wanted = set(trips)
+    parts = []
+    for chunk in read_stop_times(feed, chunksize):
+        chunk = chunk[chunk['trip_id'].isin(wanted)]
+        parts.append(chunk.groupby('trip_id')['time'].agg(['min', 'max']))
+    if not parts:
+        return pd.DataFrame({'min': [], 'max': []})
+    #a trip split over two chunks has a row in each
+    times = pd.concat(parts)
+    return times.groupby(level=0).agg({'min': 'min', 'max': 'max'}).dropna()
+
+
+def shape_frequency(graph, feed, trips, periods=PERIODS, chunksize=CHUNKSIZE, links=None):
+    #{period: buses/hr} on every graph link from the shapes of the trips, 0 where no bus runs
+    links = _links(graph) if links is None else links
+    ids, shapes = read_shapes(feed, set(trips['shape_id'].dropna()))
+    shape, link, frac = match_shapes(links, shapes)
+
+    times = trip_times(feed, trips['trip_id'], chunksize)
+    trips = trips.assign(shape=pd.Index(ids).get_indexer(trips['shape_id'].astype(str))).join(times, on='trip_id', how='inner')
+    trips = trips[trips['shape'] >= 0]
+
+    #every (trip, link) the trip runs along - shape matches repeated for each trip on the shape
+    order = np.argsort(shape, kind='stable')
+    shape, link, frac = shape[order], link[order], frac[order]
+    first = np.searchsorted(shape, trips['shape'].to_numpy(), 'left')
+    count = np.searchsorted(shape, trips['shape'].to_numpy(), 'right') - first
+    rows = np.repeat(first, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    start = np.repeat(trips['min'].to_numpy(), count)
+    end = np.repeat(trips['max'].to_numpy(), count)
+    at = start + frac[rows] * (end - start)
+
+    out = {}
+    for name, (lo, hi) in _windows(periods).items():
+        inside = (at >= lo) & (at < hi)
+        out[name] = np.bincount(link[rows][inside], minlength=len(graph.links.index)) / ((hi - lo) / 3600)
+    return out
+
+
+def _frequency(data, feed, periods, weekday, chunksize):
+    graph = network.network(data)
+    trips = bus_trips(feed, weekday)
+    links = _links(graph)
+    shaped = trips['shape_id'].notna()
+    if feed.has('shapes.txt') and shaped.any():
+        out = shape_frequency(graph, feed, trips[shaped], periods, chunksize, links)
+        #trips without a shape are still seen at their stops
+        if not shaped.all():
+            stops = stop_frequency(graph, feed, trips[~shaped], periods, chunksize, links)
+            out = {name: out[name] + np.nan_to_num(stops[name]) for name in out}
+        return out
+    return stop_frequency(graph, feed, trips, periods, chunksize, links)
+
+
+def _read_cached(path, periods):
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return {name: table.column(name).to_numpy() for name in periods}
+
+
+def _write_cached(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.table({name: pa.array(values, type=pa.float32()) for name, values in result.items()})
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def link_frequency(data, feed, periods=PERIODS, weekday='tuesday', chunksize=CHUNKSIZE, cache_dir=FREQUENCY_DIR):
+    #{period: float32 buses/hr} aligned to the rows of network.network(data).links
+    feed = feed if isinstance(feed, Feed) else Feed(feed)
+    data = getattr(data, 'base', data)
+    params = [FREQUENCY_FORMAT, feed.content_hash(), data.version, weekday, sorted(periods.items()), MATCH_METRES, SNAP_METRES]
+    key = hashlib.sha256(repr(params).encode()).hexdigest()[:16]
+
+    def build():
+        path = os.path.join(cache_dir, f'{key}.arrow') if cache_dir else None
+        if path and os.path.exists(path):
+            return _read_cached(path, periods)
+        result = {name: values.astype(np.float32) for name, values in _frequency(data, feed, periods, weekday, chunksize).items()}
+        if path:
+            _write_cached(path, result)
+        return result
+
+    return FREQUENCY_CACHE.get_or_build(key, build)
@@ -0,0 +1,143 @@
+#streaming ingestion of raw model and timetable exports into a scenario
+#
+#    python -m npt.ingest y2048b --label "2048 Hybrid (refresh)" --year 2048 --network Hybrid \
+#        --links ttsm_links.csv --nodes ttsm_nodes.csv --gtfs hybrid_gtfs.zip
+#
+#TTSM link and node tables (csv or parquet) are read in chunks, and only the rows
+#for links and nodes of the network graph are kept, straight into float32 arrays
+#aligned to the graph - memory follows the size of the NPT network, not of the
+#export. a GTFS feed gives buses per hour on each link in the AM, IP and PM
+#periods (npt.gtfs), with the AM peak figure as the `buses` the thresholds use.
+#the result is written as a scenario (npt.scenarios), so it appears in the
+#app's scenario list.
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from npt import bundle, gtfs, network, scenarios
+from npt.thresholds import LOS_GRADES
+
+#rows read at a time from the link, node and stop_times tables
+CHUNKSIZE = gtfs.CHUNKSIZE
+
+
+def read_chunks(path, columns, chunksize=CHUNKSIZE):
+    #DataFrames of the wanted columns the table has, chunksize rows at a time
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        source = pq.ParquetFile(path)
+        present = [c for c in columns if c in source.schema_arrow.names]
+        for batch in source.iter_batches(batch_size=chunksize, columns=present):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=lambda c: c in columns, chunksize=chunksize)
+
+
+def _numeric(values):
+    #LoS may be exported as grades
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        graded = values.astype(str).str.strip().str.upper().map(LOS_GRADES)
+        return graded.where(graded.notna(), pd.to_numeric(values, errors='coerce')).to_numpy(dtype=float)
+    return values.to_numpy(dtype=float)
+
+
+def ingest_table(graph, kind, path, chunksize=CHUNKSIZE):
+    #{attribute: float32 array in the graph's row order}, nan where the table has no row
+    id_columns = scenarios.ID_COLUMNS[kind]
+    size = len(graph.links.index) if kind == 'links' else len(graph.nodes.index)
+    arrays = {}
+    for chunk in read_chunks(path, id_columns + scenarios.ATTRIBUTES[kind], chunksize):
+        missing = [c for c in id_columns if c not in chunk]
+        if missing:
+            raise ValueError(f'{path} has no {", ".join(missing)} column')
+        ids = [chunk[c].to_numpy(dtype=float) for c in id_columns]
+        rows = graph.link_rows_for_ids(*ids) if kind == 'links' else graph.node_rows_for_ids(*ids)
+        found = rows >= 0
+        for column in scenarios.ATTRIBUTES[kind]:
+            if column in chunk:
+                values = arrays.setdefault(column, np.full(size, np.nan, dtype=np.float32))
+                values[rows[found]] = _numeric(chunk[column])[found]
+    return arrays
+
+
+def _frame(ids, arrays, id_columns):
+    frame = pd.DataFrame(dict(zip(id_columns, ids)))
+    for column, values in arrays.items():
+        frame[column] = values
+    known = np.zeros(len(frame.index), dtype=bool)
+    for values in arrays.values():
+        known |= ~np.isnan(values)
+    return frame[known]
+
+
+def ingest(name, meta, links=None, nodes=None, feed=None, data=None, chunksize=CHUNKSIZE, weekday='tuesday',
+           periods=gtfs.PERIODS, scenario_dir=scenarios.SCENARIO_DIR):
+    #writes scenario `name` from the exports given and returns its directory
+    data = data or bundle.open_bundle()
+    graph = network.network(data)
+
+    link_arrays = ingest_table(graph, 'links', links, chunksize) if links else {}
+    node_arrays = ingest_table(graph, 'nodes', nodes, chunksize) if nodes else {}
+    if feed:
+        for period, buses in gtfs.link_frequency(data, feed, periods, weekday, chunksize).items():
+            link_arrays[f'{period}_BUSES'] = buses
+        if 'AM' in periods:
+            link_arrays['buses'] = link_arrays['AM_BUSES']
+
+    #links and nodes without TTSM ids are written under the graph's own (negative) ids, taken from their coordinates
+    link_ids = (graph.ids[graph.link_a], graph.ids[graph.link_b])
+    node_ids = (graph.ids[graph.node_index],)
+    return scenarios.write_scenario(
+        name, meta,
+        links=_frame(link_ids, link_arrays, scenarios.ID_COLUMNS['links']) if link_arrays else None,
+        nodes=_frame(node_ids, node_arrays, scenarios.ID_COLUMNS['nodes']) if node_arrays else None,
+        scenario_dir=scenario_dir,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m npt.ingest', description='Build an NPT scenario from TTSM and GTFS exports.')
+    parser.add_argument('name', help='scenario name, a directory under data/scenarios')
+    parser.add_argument('--label', help='name shown in the app (default: the scenario name)')
+    parser.add_argument('--year', type=int, help='model year')
+    parser.add_argument('--network', help='network option, e.g. Hybrid')
+    parser.add_argument('--links', help='TTSM link table (csv or parquet) with A, B and any of ' + ', '.join(scenarios.ATTRIBUTES['links']))
+    parser.add_argument('--nodes', help='TTSM node table (csv or parquet) with N and any of ' + ', '.join(scenarios.ATTRIBUTES['nodes']))
+    parser.add_argument('--gtfs', help='GTFS feed (zip or directory) for buses per hour')
+    parser.add_argument('--weekday', default='tuesday', choices=gtfs.WEEKDAYS, help='service day taken from calendar.txt (default: tuesday)')
+    for period, window in gtfs.PERIODS.items():
+        parser.add_argument(f'--{period.lower()}', default='-'.join(window), metavar='FROM-TO',
+                            help=f'{period} period buses/hr is counted over (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='rows read at a time (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if not (args.links or args.nodes or args.gtfs):
+        parser.error('give at least one of --links, --nodes and --gtfs')
+    periods = {}
+    for period in gtfs.PERIODS:
+        value = getattr(args, period.lower())
+        window = tuple(value.split('-'))
+        if len(window) != 2 or np.isnan(gtfs.seconds(pd.Series(window))).any():
+            parser.error(f'--{period.lower()} must look like 07:00:00-09:00:00, not {value}')
+        periods[period] = window
+    meta = {'label': args.label or args.name}
+    if args.year is not None:
+        meta['year'] = args.year
+    if args.network:
+        meta['network'] = args.network
+
+    start = time.perf_counter()
+    try:
+        path = ingest(args.name, meta, args.links, args.nodes, args.gtfs, chunksize=args.chunksize,
+                      weekday=args.weekday, periods=periods)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f'scenario {args.name} written to {path} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#per-rerun instrumentation
+#
+#    NPT_DEBUG=1 streamlit run home.py        or open the app with ?debug=1
+#
+#home.py wraps each stage of a rerun in span(), and the map layer adds spans and
+#payload sizes of its own. with no trace running on the thread a span is a
+#shared no-op context, so when it is off the cost is one thread-local lookup.
+#a finished trace holds the stage timings, the hits and misses of every shared
+#cache during the rerun (process-wide, so other sessions running at the same
+#time are counted too), payload bytes and the process's peak memory. it is shown
+#in a sidebar panel, appended as a json line to NPT_DEBUG_LOG when that is set,
+#and totals over all traced reruns are exported in the OpenMetrics text format.
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from npt import cache
+
+try:
+    import resource
+except ImportError:
+    #not available on windows
+    resource = None
+
+LOG_FILE = os.environ.get('NPT_DEBUG_LOG')
+
+_NULL = contextlib.nullcontext()
+_local = threading.local()
+
+_TOTALS_LOCK = threading.Lock()
+_TOTALS = {'reruns': 0, 'spans': {}, 'payload': {}}
+
+
+def requested(query_params=None):
+    if os.environ.get('NPT_DEBUG', '') not in ('', '0'):
+        return True
+    return (query_params or {}).get('debug', '') in ('1', 'true')
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macos, kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class Trace:
+
+    def __init__(self):
+        self.started = time.time()
+        self.spans = []
+        self.payload = {}
+        self.seconds = None
+        self.caches = []
+        self.peak_rss_mb = None
+        self._start = time.perf_counter()
+        self._depth = 0
+        self._cache_start = {s['name']: s for s in cache.all_stats()}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        #[name, nesting depth, seconds] - seconds is None until the span ends
+        record = [name, self._depth, None]
+        self.spans.append(record)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record[2] = time.perf_counter() - start
+            self._depth -= 1
+
+    def add_payload(self, name, size):
+        self.payload[name] = self.payload.get(name, 0) + int(size)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+        self.caches = []
+        for stats in cache.all_stats():
+            before = self._cache_start.get(stats['name'], {})
+            self.caches.append({
+                **stats,
+                'rerun_hits': stats['hits'] - before.get('hits', 0),
+                'rerun_misses': stats['misses'] - before.get('misses', 0),
+            })
+        self.peak_rss_mb = peak_rss_mb()
+
+    def record(self):
+        return {
+            'started': self.started,
+            'seconds': self.seconds,
+            'spans': [{'name': n, 'depth': d, 'seconds': s} for n, d, s in self.spans],
+            'payload_bytes': self.payload,
+            'caches': self.caches,
+            'peak_rss_mb': self.peak_rss_mb,
+        }
+
+
+def begin(enabled):
+    #starts a trace for this thread's rerun, or turns tracing off for it
+    _local.trace = Trace() if enabled else None
+    return _local.trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def span(name):
+    trace = getattr(_local, 'trace', None)
+    return _NULL if trace is None else trace.span(name)
+
+
+def payload(name, size):
+    #size may be a callable, so it is only worked out when tracing
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add_payload(name, size() if callable(size) else size)
+
+
+def finish():
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    if trace is None:
+        return None
+    trace.finish()
+
+    with _TOTALS_LOCK:
+        _TOTALS['reruns'] += 1
+        for name, _, seconds in trace.spans:
+            count, total = _TOTALS['spans'].get(name, (0, 0.0))
+            _TOTALS['spans'][name] = (count + 1, total + (seconds or 0.0))
+        for name, size in trace.payload.items():
+            _TOTALS['payload'][name] = _TOTALS['payload'].get(name, 0) + size
+
+    if LOG_FILE:
+        with open(LOG_FILE, 'a') as f:
+            f.write(json.dumps(trace.record()) + '\n')
+    return trace
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def openmetrics():
+    #totals over every traced rerun in this process, plus the caches' own counters
+    with _TOTALS_LOCK:
+        reruns = _TOTALS['reruns']
+        spans = dict(_TOTALS['spans'])
+        payload_totals = dict(_TOTALS['payload'])
+
+    lines = ['# TYPE npt_traced_reruns counter', f'npt_traced_reruns_total {reruns}']
+
+    lines += ['# TYPE npt_stage_seconds summary', '# UNIT npt_stage_seconds seconds']
+    for name, (count, total) in sorted(spans.items()):
+        lines.append(f'npt_stage_seconds_count{{stage="{_label(name)}"}} {count}')
+        lines.append(f'npt_stage_seconds_sum{{stage="{_label(name)}"}} {total:.6f}')
+
+    lines += ['# TYPE npt_payload_bytes counter', '# UNIT npt_payload_bytes bytes']
+    for name, size in sorted(payload_totals.items()):
+        lines.append(f'npt_payload_bytes_total{{payload="{_label(name)}"}} {size}')
+
+    stats = cache.all_stats()
+    for metric in ('hits', 'misses', 'evictions'):
+        lines.append(f'# TYPE npt_cache_{metric} counter')
+        lines += [f'npt_cache_{metric}_total{{cache="{_label(s["name"])}"}} {s[metric]}' for s in stats]
+    lines.append('# TYPE npt_cache_entries gauge')
+    lines += [f'npt_cache_entries{{cache="{_label(s["name"])}"}} {s["size"]}' for s in stats]
+
+    rss = peak_rss_mb()
+    if rss is not None:
+        lines += ['# TYPE npt_peak_rss_bytes gauge', '# UNIT npt_peak_rss_bytes bytes', f'npt_peak_rss_bytes {int(rss * 1024 * 1024)}']
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
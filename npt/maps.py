@@ -0,0 +1,371 @@
+#map building layer - each view is built once per data version and kept
+#pre-rendered, so reruns and other sessions showing the same view reuse it.
+#the cache holds both the standalone page and the component payload st_folium
+#would work out from the map on every rerun; show() sends that payload as it is,
+#and serialises only the groups added for this rerun, on a map of their own.
+
+from collections import namedtuple
+
+import branca
+import folium
+import numpy as np
+import streamlit as st
+import streamlit_folium
+from branca.element import MacroElement
+from jinja2 import Template
+
+from npt import clusters, geometry, instrument, tiles
+from npt.cache import LRUCache
+from npt.views import KINDS
+
+MAP_CACHE = LRUCache('maps', maxsize=32)
+
+TILES = 'CartoDB positron'
+
+#html is the standalone page, payload what show() hands the st_folium component
+RenderedMap = namedtuple('RenderedMap', ['map', 'html', 'payload'])
+
+#the static arguments of the st_folium component for one map
+MapPayload = namedtuple('MapPayload', ['script', 'header', 'html', 'id', 'bounds', 'zoom', 'css_links', 'js_links', 'digest'])
+
+HIGHLIGHT = '#1f78b4'
+
+CORRIDOR = '#6a3d9a'
+
+#corridor figures shown on hover
+CORRIDOR_FIELDS = ('name', 'links', 'length_km', 'passenger_km', 'LOS', 'delay_s')
+
+
+
+def _links(elements):
+    #the css and js every element (and its children) needs, as st_folium collects them
+    css, js = [], []
+    stack = list(elements)
+    while stack:
+        element = stack.pop(0)
+        if isinstance(element, branca.colormap.ColorMap):
+            js[:0] = ['https://d3js.org/d3.v4.min.js', 'https://cdnjs.cloudflare.com/ajax/libs/d3/3.5.5/d3.min.js']
+        css.extend(href for _, href in getattr(element, 'default_css', []))
+        js.extend(src for _, src in getattr(element, 'default_js', []))
+        stack[:0] = getattr(element, '_children', {}).values()
+    return css, js
+
+
+def map_payload(m):
+    #what st_folium works out from a map - it renames the map's elements, so only once per map
+    m.render()
+    html = streamlit_folium._get_html(m)
+    header = streamlit_folium._get_header(m)
+    script = streamlit_folium._get_map_string(m)
+    css, js = _links([m])
+    try:
+        bounds = m.get_bounds()
+    except AttributeError:
+        bounds = [[None, None], [None, None]]
+    return MapPayload(script, header, html, streamlit_folium.get_full_id(m), bounds, m.options.get('zoom'),
+                      css, js, streamlit_folium.generate_js_hash(script))
+
+
+def render(m):
+    with instrument.span('render map html'):
+        html = m.get_root().render()
+    with instrument.span('render map payload'):
+        payload = map_payload(m)
+    return RenderedMap(m, html, payload)
+
+
+def get_map(key, version, build):
+    #build() returns a folium map; only called on a cache miss
+    return MAP_CACHE.get_or_build((version,) + tuple(key), lambda: render(build()))
+
+
+def layer_kwds(view, layer, legend):
+    kwds = {
+        'tooltip': layer.tooltip,
+        'popup': layer.tooltip,
+        'highlight': True,
+        'zoom_on_click': True,
+        'name': layer.name,
+        'legend': False,
+    }
+
+    if layer.kind == 'nodes':
+        kwds['marker_type'] = 'circle_marker'
+        kwds['marker_kwds'] = {'radius': 6}
+        style = {'stroke': True, 'weight': 0.6, 'opacity': 0.7}
+        colour_key = 'fillColor'
+    else:
+        style = {'weight': 3, 'opacity': 0.7}
+        colour_key = 'color'
+
+    if view.choropleth:
+        kwds['column'] = KINDS[layer.kind].column
+        if legend:
+            kwds['legend'] = True
+            kwds['legend_kwds'] = {'caption': view.caption(layer.kind), 'fmt': '{:.0f}'}
+    else:
+        style[colour_key] = layer.color
+
+    kwds['style_kwds'] = style
+    return kwds
+
+
+def layer_colormap(view, layer, gdf):
+    #the same viridis scale explore() uses for the inline choropleth
+    column = KINDS[layer.kind].column
+    colormap = branca.colormap.linear.viridis.scale(float(gdf[column].min()), float(gdf[column].max()))
+    colormap.caption = view.caption(layer.kind)
+    return colormap
+
+
+def add_tiled_layer(m, view, layer, gdf, manifest, legend):
+    kwds = layer_kwds(view, layer, legend)
+    style = dict(kwds['style_kwds'])
+    colour_key = 'fillColor' if layer.kind == 'nodes' else 'color'
+    options = {'color': style.pop(colour_key, layer.color), 'color_key': colour_key, 'style': style}
+
+    if view.choropleth:
+        colormap = layer_colormap(view, layer, gdf)
+        vmin, vmax = colormap.vmin, colormap.vmax
+        options.update(column=KINDS[layer.kind].column, vmin=vmin, vmax=vmax,
+                       colors=[colormap.rgb_hex_str(v) for v in np.linspace(vmin, vmax, 10)])
+        if legend:
+            m.add_child(colormap)
+
+    tiles.TiledGeoJson(tiles.layer_url(manifest['version'], layer.dataset), manifest, layer.tooltip,
+                       name=layer.name, **options).add_to(m)
+
+
+def add_clustered_layer(m, view, layer, data, frame, kwds):
+    #the nodes and their clusters in one group, so the layer control switches both
+    group = folium.FeatureGroup(name=layer.name).add_to(m)
+    frame.explore(m=group, **dict(kwds, legend=False))
+    nodes = list(group._children.values())[-1]
+    colormap = layer_colormap(view, layer, data.frame(layer.dataset)) if view.choropleth else None
+    if kwds['legend']:
+        m.add_child(colormap)
+    group.add_child(clusters.ClusterLayer(m, nodes, clusters.cluster_index(data, layer.dataset), layer.color, colormap))
+
+
+def view_bounds(view, data):
+    bounds = np.array([data.frame(layer.dataset).total_bounds for layer in view.layers])
+    return bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()
+
+
+def view_band(view, data, zoom=None):
+    #level of detail for the current zoom, or the zoom the view opens at
+    if zoom is None:
+        zoom = geometry.fit_zoom(view_bounds(view, data))
+    return geometry.band_for_zoom(zoom)
+
+
+def inline_frame(view, layer, data, band):
+    #only the columns the map shows are serialised into the page
+    columns = list(dict.fromkeys(layer.tooltip + ([KINDS[layer.kind].column] if view.choropleth else [])))
+    gdf = geometry.level(data, layer.dataset, band)
+    return gdf[[c for c in columns if c in gdf] + [gdf.geometry.name]]
+
+
+def build_map(view, data, mode='inline', band=None):
+    m = folium.Map(tiles=TILES, control_scale=True)
+    legends = set()
+    bounds = []
+    if mode == 'tiled':
+        with instrument.span('build tiles'):
+            manifests = tiles.build_view_tiles(view, data)
+    else:
+        manifests = {}
+    band = band or view_band(view, data)
+
+    for layer in view.layers:
+        gdf = data.frame(layer.dataset)
+        legend = layer.kind not in legends
+        legends.add(layer.kind)
+        if mode == 'tiled':
+            add_tiled_layer(m, view, layer, gdf, dict(manifests[layer.dataset], version=data.version), legend)
+        elif mode == 'viewport':
+            #features are sent per viewport by npt.viewport - the base map only has the legend
+            if legend and view.choropleth:
+                m.add_child(layer_colormap(view, layer, gdf))
+        else:
+            with instrument.span(f'explore: {layer.name}'):
+                frame = inline_frame(view, layer, data, band)
+                if layer.kind == 'nodes':
+                    #a regional view draws a few dozen clusters rather than every intersection
+                    add_clustered_layer(m, view, layer, data, frame, layer_kwds(view, layer, legend))
+                else:
+                    frame.explore(m=m, **layer_kwds(view, layer, legend))
+        bounds.append(gdf.total_bounds)
+
+    if bounds:
+        minx = min(b[0] for b in bounds)
+        miny = min(b[1] for b in bounds)
+        maxx = max(b[2] for b in bounds)
+        maxy = max(b[3] for b in bounds)
+        m.fit_bounds([[miny, minx], [maxy, maxx]])
+
+    if view.by_category:
+        names = {layer.name for layer in view.layers}
+        m.add_child(LayerRegistry({child.layer_name: child for child in m._children.values()
+                                   if getattr(child, 'layer_name', None) in names}))
+
+    folium.LayerControl(collapsed=not view.by_category).add_to(m)
+    return m
+
+
+def view_map_ready(view, data, mode='inline', zoom=None):
+    #whether get_view_map would return without building
+    key = view.key + ((mode,) if mode in ('tiled', 'viewport') else (mode, view_band(view, data, zoom)))
+    return (data.version,) + key in MAP_CACHE
+
+
+def get_view_map(view, data, mode='inline', zoom=None):
+    if mode in ('tiled', 'viewport'):
+        #tiles and viewport deltas carry their own per-zoom detail
+        return get_map(view.key + (mode,), data.version, lambda: build_map(view, data, mode))
+    band = view_band(view, data, zoom)
+    return get_map(view.key + (mode, band), data.version, lambda: build_map(view, data, mode, band))
+
+
+def build_diff_map(layers, column, caption):
+    #layers: {name: GeoDataFrame with the change in column}, coloured blue (down) to red (up)
+    m = folium.Map(tiles=TILES, control_scale=True)
+    frames = [gdf for gdf in layers.values() if len(gdf.index)]
+    if not frames:
+        return m
+    limit = max(float(np.nanmax(np.abs(gdf[column].to_numpy(dtype=float)))) for gdf in frames) or 1.0
+    colormap = branca.colormap.LinearColormap(['#2166ac', '#f7f7f7', '#b2182b'], vmin=-limit, vmax=limit, caption=caption)
+
+    for name, gdf in layers.items():
+        if not len(gdf.index):
+            continue
+        point = gdf.geom_type.iloc[0] == 'Point'
+        colour_key = 'fillColor' if point else 'color'
+        folium.GeoJson(
+            gdf,
+            name=name,
+            marker=folium.CircleMarker(radius=6, fill=True) if point else None,
+            style_function=lambda f, key=colour_key: {
+                key: colormap(f['properties'][column]), 'color': colormap(f['properties'][column]),
+                'weight': 0.6 if key == 'fillColor' else 4, 'fillOpacity': 0.8, 'opacity': 0.8,
+            },
+            tooltip=folium.GeoJsonTooltip([c for c in gdf.columns if c != gdf.geometry.name]),
+        ).add_to(m)
+
+    m.add_child(colormap)
+    minx, miny, maxx, maxy = np.array([gdf.total_bounds for gdf in frames]).T
+    m.fit_bounds([[miny.min(), minx.min()], [maxy.max(), maxx.max()]])
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def show(rendered, key, groups=None, height=700, zoom=None, center=None, returned_objects=None):
+    #st_folium(rendered.map, feature_group_to_add=groups, use_container_width=True) from the cached
+    #payload. the groups are serialised on a scratch map, so the shared cached one is never touched
+    payload = rendered.payload
+    scratch = folium.Map(tiles=None)
+    script = ''.join(streamlit_folium._get_feature_group_string(group, map=scratch, idx=idx)
+                     for idx, group in enumerate(groups or ()))
+    css, js = _links(groups or ())
+    sha = streamlit_folium.generate_js_hash(payload.digest, key)
+
+    def on_change():
+        st.session_state[key] = st.session_state.get(sha, {})
+
+    southwest, northeast = payload.bounds
+    defaults = {
+        'last_clicked': None, 'last_object_clicked': None, 'last_object_clicked_count': None,
+        'last_object_clicked_tooltip': None, 'last_object_clicked_popup': None, 'all_drawings': None,
+        'last_active_drawing': None, 'zoom': payload.zoom, 'last_circle_radius': None,
+        'last_circle_polygon': None, 'selected_layers': None, 'selected_tags': None, 'last_geocoder_result': None,
+        'bounds': {'_southWest': {'lat': southwest[0], 'lng': southwest[1]},
+                   '_northEast': {'lat': northeast[0], 'lng': northeast[1]}},
+    }
+    if returned_objects is not None:
+        defaults = {k: v for k, v in defaults.items() if k in returned_objects}
+
+    return streamlit_folium._component_func(
+        script=payload.script, header=payload.header, html=payload.html, id=payload.id, key=sha,
+        height=height, width=None, returned_objects=returned_objects, default=defaults, zoom=zoom, center=center,
+        feature_group=script if groups else None, return_on_hover=False, layer_control=None, pixelated=False,
+        css_links=list(dict.fromkeys(payload.css_links + css)), js_links=list(dict.fromkeys(payload.js_links + js)),
+        on_change=on_change, wrap_longitude=False,
+    )
+
+
+def highlight_group(gdf, name, fields):
+    group = folium.FeatureGroup(name=name)
+    fields = [f for f in fields if f in gdf]
+    if len(gdf.index):
+        folium.GeoJson(
+            gdf[fields + [gdf.geometry.name]],
+            style_function=lambda _: {'color': HIGHLIGHT, 'weight': 7, 'opacity': 0.9},
+            tooltip=folium.GeoJsonTooltip(fields) if fields else None,
+        ).add_to(group)
+    return group
+
+
+def corridor_group(corridors):
+    #each corridor as one line over the map, thicker the more passenger-km it carries
+    from npt.corridors import LABELS
+
+    group = folium.FeatureGroup(name='Corridors')
+    if len(corridors.index):
+        busiest = corridors['passenger_km'].max() or 1.0
+        gdf = corridors[[*CORRIDOR_FIELDS, corridors.geometry.name]].round({'length_km': 2, 'passenger_km': 0, 'LOS': 1, 'delay_s': 0})
+        gdf['weight'] = (3 + 7 * corridors['passenger_km'] / busiest).round(1)
+        folium.GeoJson(
+            gdf,
+            style_function=lambda feature: {'color': CORRIDOR, 'weight': feature['properties']['weight'], 'opacity': 0.8},
+            tooltip=folium.GeoJsonTooltip(list(CORRIDOR_FIELDS), aliases=[LABELS[f] for f in CORRIDOR_FIELDS]),
+        ).add_to(group)
+    return group
+
+
+class LayerRegistry(MacroElement):
+    #the map's overlays by name, so a script sent later can switch them. names are
+    #resolved when rendered, since st_folium renames the elements it serialises
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            window.__nptLayers = {
+                {%- for name, layer in this.layers.items() %}
+                {{ name|tojson }}: {{ layer.get_name() }},
+                {%- endfor %}
+            };
+        {% endmacro %}
+        """)
+
+    def __init__(self, layers):
+        super().__init__()
+        self._name = 'LayerRegistry'
+        self.layers = layers
+
+
+class ShowLayers(MacroElement):
+    #adds the named overlays to the map and takes the others off - the layer control follows
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function (map, names) {
+                var layers = window.__nptLayers || {};
+                Object.keys(layers).forEach(function (name) {
+                    var shown = names.indexOf(name) >= 0;
+                    if (shown && !map.hasLayer(layers[name])) { map.addLayer(layers[name]); }
+                    if (!shown && map.hasLayer(layers[name])) { map.removeLayer(layers[name]); }
+                });
+            })(window.map, {{ this.names|tojson }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, names):
+        super().__init__()
+        self._name = 'ShowLayers'
+        self.names = list(names)
+
+
+def show_layers(names):
+    #for st_folium's feature_group_to_add - switches layers of a map built from views.network_view()
+    group = folium.FeatureGroup(name='Shown layers', control=False)
+    group.add_child(ShowLayers(names))
+    return group
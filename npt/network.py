@@ -0,0 +1,209 @@
+#network graph over the TTSM node ids
+#
+#links carry their end nodes in A/B and intersections their node in N. the graph
+#is a CSR adjacency over dense node indices (indptr plus neighbour/link arrays,
+#each link stored once from each end), built once per data version from the
+#candidate links and nodes. a node's links are one slice, so approach links are
+#O(degree) and corridors are a walk over those slices. features without model
+#ids (the outside primary layers) are joined to the node at the same
+#coordinates; anything left over becomes a node of its own.
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from npt import thresholds
+from npt.cache import LRUCache
+
+#coordinate join grid in degrees - about a metre
+GRID = 1e-5
+
+#how far a click may land from an intersection, in degrees (the map rounds
+#coordinates to the zoom band, so exact matches are not guaranteed)
+CLICK_TOLERANCE = 1e-4
+
+NETWORK_CACHE = LRUCache('network', maxsize=4)
+
+
+def _coord_keys(xy):
+    grid = np.round(np.asarray(xy, dtype=float).reshape(-1, 2) / GRID).astype(np.int64)
+    return grid[:, 0] * (1 << 32) + grid[:, 1]
+
+
+def _coord_ids(xy):
+    #a negative id per coordinate - lon and lat on the GRID in 26 and 25 bits, exact as a float
+    grid = np.round(np.asarray(xy, dtype=float).reshape(-1, 2) / GRID).astype(np.int64)
+    return -1 - ((grid[:, 0] + (1 << 25)) * (1 << 25) + grid[:, 1] + (1 << 24))
+
+
+def _ids(frame, column):
+    if column not in frame:
+        return np.full(len(frame.index), np.nan)
+    return frame[column].to_numpy(dtype=float)
+
+
+def _endpoints(frame):
+    geoms = np.asarray(frame.geometry.array, dtype=object)
+    start = shapely.get_coordinates(shapely.get_point(geoms, 0))
+    end = shapely.get_coordinates(shapely.get_point(geoms, -1))
+    return start, end
+
+
+class Network:
+
+    def __init__(self, links, nodes):
+        self.links = links.reset_index(drop=True)
+        self.nodes = nodes.reset_index(drop=True)
+        n_links = len(self.links.index)
+
+        start, end = _endpoints(self.links)
+        node_xy = shapely.get_coordinates(np.asarray(self.nodes.geometry.array, dtype=object))
+        xy = np.vstack([start, end, node_xy])
+        ids = np.concatenate([_ids(self.links, 'A'), _ids(self.links, 'B'), _ids(self.nodes, 'N')])
+        keys = _coord_keys(xy)
+
+        #features without an id take the id already seen at their coordinates
+        known = ~np.isnan(ids)
+        by_key = pd.Series(ids[known], index=keys[known])
+        by_key = by_key[~by_key.index.duplicated()]
+        ids[~known] = by_key.reindex(keys[~known]).to_numpy()
+
+        #and anything still unmatched is its own node, numbered below zero from where it is
+        missing = np.isnan(ids)
+        ids[missing] = _coord_ids(xy[missing])
+
+        self.ids, index = np.unique(ids.astype(np.int64), return_inverse=True)
+        self.link_a = index[:n_links]
+        self.link_b = index[n_links:2 * n_links]
+        self.node_index = index[2 * n_links:]
+
+        n = len(self.ids)
+        self.xy = np.full((n, 2), np.nan)
+        self.xy[index[::-1]] = xy[::-1]
+        self.node_row = np.full(n, -1)
+        self.node_row[self.node_index[::-1]] = np.arange(len(self.node_index))[::-1]
+        self._by_key = pd.Series(index, index=keys)
+        self._by_key = self._by_key[~self._by_key.index.duplicated()]
+        self._pairs = pd.Series(np.arange(n_links), index=self.link_a * n + self.link_b)
+        self._pairs = self._pairs[~self._pairs.index.duplicated()]
+
+        #csr adjacency - every link appears under both of its end nodes
+        src = np.concatenate([self.link_a, self.link_b])
+        order = np.argsort(src, kind='stable')
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+        self.neighbours = np.concatenate([self.link_b, self.link_a])[order]
+        self.edges = np.tile(np.arange(n_links), 2)[order]
+        self.inbound = np.repeat([False, True], n_links)[order]
+
+        #nodes sorted by longitude for click lookups
+        self._x_order = np.argsort(self.xy[:, 0], kind='stable')
+        self._x_sorted = self.xy[self._x_order, 0]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def adjacent(self, node):
+        #(neighbour nodes, links) at a node
+        s = slice(self.indptr[node], self.indptr[node + 1])
+        return self.neighbours[s], self.edges[s]
+
+    def approach_links(self, node, among=None):
+        #links that end at this node, i.e. the traffic feeding it - only those among these rows if given
+        s = slice(self.indptr[node], self.indptr[node + 1])
+        links = np.unique(self.edges[s][self.inbound[s]])
+        return links if among is None else np.intersect1d(links, among)
+
+    def node_for(self, node_id):
+        pos = int(np.searchsorted(self.ids, node_id))
+        if pos < len(self.ids) and self.ids[pos] == node_id:
+            return pos
+        return None
+
+    def node_near(self, lon, lat, tolerance=CLICK_TOLERANCE):
+        lo, hi = np.searchsorted(self._x_sorted, [lon - tolerance, lon + tolerance])
+        nearby = self._x_order[lo:hi]
+        if not len(nearby):
+            return None
+        distance = np.hypot(self.xy[nearby, 0] - lon, self.xy[nearby, 1] - lat)
+        best = int(np.argmin(distance))
+        return int(nearby[best]) if distance[best] <= tolerance else None
+
+    def _lookup(self, ids, xy):
+        out = np.full(len(xy), -1, dtype=np.int64)
+        finite = np.isfinite(xy).all(axis=1)
+        out[finite] = self._by_key.reindex(_coord_keys(xy[finite])).fillna(-1).to_numpy(dtype=np.int64)
+        known = ~np.isnan(ids)
+        pos = np.searchsorted(self.ids, ids[known].astype(np.int64)).clip(0, max(len(self.ids) - 1, 0))
+        found = self.ids[pos] == ids[known].astype(np.int64)
+        out[np.flatnonzero(known)[found]] = pos[found]
+        return out
+
+    def _link_rows(self, a, b):
+        pairs = np.where((a >= 0) & (b >= 0), a * len(self.ids) + b, -1)
+        return self._pairs.reindex(pairs).fillna(-1).to_numpy(dtype=np.int64)
+
+    def link_rows(self, frame):
+        #rows of self.links for the links of a layer frame, -1 where not in the graph
+        if not len(frame.index):
+            return np.zeros(0, dtype=np.int64)
+        start, end = _endpoints(frame)
+        return self._link_rows(self._lookup(_ids(frame, 'A'), start), self._lookup(_ids(frame, 'B'), end))
+
+    def link_rows_for_ids(self, a_ids, b_ids):
+        no_xy = np.full((len(a_ids), 2), np.nan)
+        a = self._lookup(np.asarray(a_ids, dtype=float), no_xy)
+        b = self._lookup(np.asarray(b_ids, dtype=float), no_xy)
+        return self._link_rows(a, b)
+
+    def _node_rows(self, nodes):
+        return np.where(nodes >= 0, self.node_row[nodes.clip(0)], -1)
+
+    def node_rows(self, frame):
+        #rows of self.nodes for the intersections of a layer frame, -1 where not in the graph
+        if not len(frame.index):
+            return np.zeros(0, dtype=np.int64)
+        xy = shapely.get_coordinates(np.asarray(frame.geometry.array, dtype=object))
+        return self._node_rows(self._lookup(_ids(frame, 'N'), xy))
+
+    def node_rows_for_ids(self, n_ids):
+        return self._node_rows(self._lookup(np.asarray(n_ids, dtype=float), np.full((len(n_ids), 2), np.nan)))
+
+    def corridors(self, rows):
+        #label each of the given links with the connected corridor it belongs to
+        rows = np.asarray(rows, dtype=np.int64)
+        member = np.zeros(len(self.links.index), dtype=bool)
+        member[rows] = True
+        label = np.full(len(self.links.index), -1, dtype=np.int64)
+        corridor = 0
+
+        for first in rows:
+            if label[first] >= 0:
+                continue
+            label[first] = corridor
+            stack = [first]
+            while stack:
+                link = stack.pop()
+                for node in (self.link_a[link], self.link_b[link]):
+                    nxt = self.edges[self.indptr[node]:self.indptr[node + 1]]
+                    nxt = nxt[member[nxt] & (label[nxt] < 0)]
+                    label[nxt] = corridor
+                    stack.extend(nxt.tolist())
+            corridor += 1
+
+        return label[rows]
+
+
+def network(data):
+    #the graph covers every candidate, so reclassified and scenario data share their bundle's graph
+    data = getattr(data, 'base', data)
+
+    def build():
+        found = thresholds.candidates(data)
+        return Network(found.frames['links'], found.frames['nodes'])
+
+    return NETWORK_CACHE.get_or_build(data.version, build)
+
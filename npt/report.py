@@ -0,0 +1,160 @@
+#headless report pack: every view of every scenario as html, png and csv
+#
+#    python -m npt.report --out report --formats html,png,csv --workers 8
+#
+#uses the same engine as home.py (bundle, scenarios, views, maps, summary) with
+#no streamlit. each (scenario, view) is one task on a process pool; workers
+#memory-map the bundle once, so adding cores scales the pack close to linearly.
+
+import argparse
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from npt import bundle, scenarios, thresholds, views
+from npt.snapshots import page, view_slug
+
+FORMATS = ('html', 'png', 'csv')
+
+_WORKER = {}
+
+
+def load(scenario=scenarios.BASE, rules=None):
+    #the data home.py shows for a scenario and optional custom thresholds
+    data = bundle.open_bundle()
+    data = scenarios.scenario_store(data).apply(data, scenario)
+    if rules:
+        data = thresholds.reclassify(data, rules)
+    return data
+
+
+def view_table(view, data):
+    #every feature of a view with its layer and tooltip fields, no geometry
+    frames = []
+    for layer in view.layers:
+        frame = data.frame(layer.dataset)
+        columns = [c for c in layer.tooltip if c in frame]
+        frames.append(pd.DataFrame(frame[columns]).assign(Layer=layer.name)[['Layer', *columns]])
+    return pd.concat(frames, ignore_index=True)
+
+
+def save_png(view, data, path):
+    import matplotlib
+
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    for layer in view.layers:
+        gdf = data.frame(layer.dataset)
+        kwds = {'markersize': 30} if layer.kind == 'nodes' else {'linewidth': 2}
+        if view.choropleth:
+            gdf.plot(ax=ax, column=views.KINDS[layer.kind].column, cmap='viridis', **kwds)
+        else:
+            gdf.plot(ax=ax, color=layer.color, label=layer.name, **kwds)
+    ax.set_title(f'{view.analysis.label} - {view.data}')
+    ax.set_axis_off()
+    fig.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+
+def _scenario_data(scenario):
+    #per worker process - the bundle is opened once and scenario data is cached by the store
+    if 'bundle' not in _WORKER:
+        _WORKER['bundle'] = bundle.open_bundle()
+    store = scenarios.scenario_store(_WORKER['bundle'])
+    return store.apply(_WORKER['bundle'], scenario), store.get(scenario).label
+
+
+def render_view(scenario, key, out_dir, formats):
+    start = time.perf_counter()
+    data, label = _scenario_data(scenario)
+    view = views.get_view(*key)
+    stem = os.path.join(out_dir, view_slug(view))
+    written = []
+
+    if 'html' in formats:
+        with open(stem + '.html', 'w') as f:
+            f.write(page(view, data, label))
+        written.append(stem + '.html')
+    if 'png' in formats:
+        save_png(view, data, stem + '.png')
+        written.append(stem + '.png')
+    if 'csv' in formats:
+        view_table(view, data).to_csv(stem + '.csv', index=False)
+        written.append(stem + '.csv')
+
+    return scenario, key, written, time.perf_counter() - start
+
+
+def _warm():
+    #build the bundle once in the parent so workers only memory-map it
+    bundle.build_bundle()
+
+
+def write_index(out_dir, results, labels):
+    rows = []
+    for scenario, key, written, _ in sorted(results, key=lambda r: (r[0], r[1])):
+        links = ' '.join(f'<a href="{html.escape(os.path.relpath(p, out_dir))}">{os.path.splitext(p)[1][1:]}</a>' for p in written)
+        rows.append(f'<tr><td>{html.escape(labels[scenario])}</td><td>{html.escape(key[0])}</td><td>{html.escape(key[1])}</td><td>{links}</td></tr>')
+    page = ('<html><head><meta charset="utf-8"><title>Network Prioritisation Tool report</title></head><body>'
+            '<h1>Network Prioritisation Tool report</h1><table><tr><th>Scenario</th><th>Analysis</th><th>Data</th><th>Files</th></tr>'
+            + ''.join(rows) + '</table></body></html>')
+    with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+        f.write(page)
+
+
+def build_report(out_dir, formats=FORMATS, scenario_names=None, workers=None):
+    _warm()
+    store = scenarios.scenario_store(bundle.open_bundle())
+    scenario_names = scenario_names or store.names
+    missing = [name for name in scenario_names if name not in store.scenarios]
+    if missing:
+        raise ValueError(f'unknown scenario(s): {", ".join(missing)} - available: {", ".join(store.names)}')
+    labels = {name: store.get(name).label for name in scenario_names}
+    tasks = []
+    for scenario in scenario_names:
+        os.makedirs(os.path.join(out_dir, scenario), exist_ok=True)
+        tasks += [(scenario, view.key, os.path.join(out_dir, scenario), tuple(formats)) for view in views.all_views()]
+
+    results = []
+    if workers == 1:
+        results = [render_view(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_view, *task) for task in tasks]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    write_index(out_dir, results, labels)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m npt.report', description='Render every NPT view to static files.')
+    parser.add_argument('--out', default='report', help='output directory (default: report)')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma separated: html, png, csv')
+    parser.add_argument('--scenarios', default=None, help='comma separated scenario names (default: all)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f'unknown format(s): {", ".join(sorted(unknown))}')
+    names = [s.strip() for s in args.scenarios.split(',')] if args.scenarios else None
+
+    start = time.perf_counter()
+    try:
+        results = build_report(args.out, formats, names, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    files = sum(len(r[2]) for r in results)
+    print(f'{len(results)} views, {files} files written to {args.out} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
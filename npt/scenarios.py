@@ -0,0 +1,245 @@
+#model scenarios over one shared network
+#
+#link and node geometry is held once, by the network graph (keyed on the TTSM
+#A/B/N ids). a scenario is only its attribute columns: one float32 array per
+#attribute, aligned to the graph's link and node rows. the bundle's own figures
+#are the base scenario (the 2048 Hybrid network TTSM run); others are read from
+#data/scenarios/<name>/ as Arrow files of ids plus attributes:
+#
+#    scenario.json   {"label": "2038 Hybrid", "year": 2038, "network": "Hybrid"}
+#    links.arrow     A, B, ADT_PT, AM_PT, IP_PT, PM_PT, LOS, buses, AM_BUSES, IP_BUSES, PM_BUSES
+#    nodes.arrow     N, ADT_PT, AM_PT, IP_PT, PM_PT, LOS_WAVG, DELAY_WAVG
+#
+#comparing two scenarios is then a subtraction of two aligned arrays.
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+
+from npt import bundle, network
+from npt.cache import LRUCache
+from npt.thresholds import LINK_SOURCES, NODE_SOURCES
+
+SCENARIO_DIR = os.path.join(bundle.DATA_DIR, 'scenarios')
+
+BASE = 'base'
+BASE_META = {'label': '2048', 'year': 2048, 'network': 'Hybrid'}
+
+ATTRIBUTES = {
+    'links': ('ADT_PT', 'AM_PT', 'IP_PT', 'PM_PT', 'LOS', 'buses', 'AM_BUSES', 'IP_BUSES', 'PM_BUSES'),
+    'nodes': ('ADT_PT', 'AM_PT', 'IP_PT', 'PM_PT', 'LOS_WAVG', 'DELAY_WAVG'),
+}
+
+#attributes a scenario adds to layers that do not carry them - the link layers have Remix headways, not buses/hr
+ADDED = {'links': ('buses', 'AM_BUSES', 'IP_BUSES', 'PM_BUSES'), 'nodes': ()}
+
+ID_COLUMNS = {'links': ('A', 'B'), 'nodes': ('N',)}
+
+#datasets whose attributes follow the selected scenario
+SOURCE_KINDS = {**{name: 'links' for name in LINK_SOURCES}, **{name: 'nodes' for name in NODE_SOURCES}}
+
+#attributes offered for scenario comparison maps - the key is the option shown, the attribute
+#is how the map caption names it mid-sentence
+Comparison = namedtuple('Comparison', ['kind', 'column', 'attribute'])
+
+COMPARISONS = {
+    'Daily PT trips (roads)': Comparison('links', 'ADT_PT', 'daily PT trips (roads)'),
+    'AM peak PT trips (roads)': Comparison('links', 'AM_PT', 'AM peak PT trips (roads)'),
+    'Level of service (roads)': Comparison('links', 'LOS', 'level of service (roads)'),
+    'Buses per hour (roads)': Comparison('links', 'buses', 'buses per hour (roads)'),
+    'Interpeak buses per hour (roads)': Comparison('links', 'IP_BUSES', 'interpeak buses per hour (roads)'),
+    'PM peak buses per hour (roads)': Comparison('links', 'PM_BUSES', 'PM peak buses per hour (roads)'),
+    'Daily PT trips (intersections)': Comparison('nodes', 'ADT_PT', 'daily PT trips (intersections)'),
+    'AM peak PT trips (intersections)': Comparison('nodes', 'AM_PT', 'AM peak PT trips (intersections)'),
+    'Bus delay (intersections)': Comparison('nodes', 'DELAY_WAVG', 'bus delay (intersections)'),
+}
+
+STORE_CACHE = LRUCache('scenarios', maxsize=4)
+
+
+class Scenario:
+
+    def __init__(self, name, meta, arrays, digest):
+        self.name = name
+        self.meta = meta
+        self.label = meta.get('label', name)
+        self.arrays = arrays
+        self.digest = digest
+
+    def values(self, kind, column):
+        return self.arrays[kind].get(column)
+
+
+def scenarios_version(scenario_dir=SCENARIO_DIR):
+    #cheap fingerprint of the scenario files - names, sizes and mtimes
+    h = hashlib.sha256()
+    if os.path.isdir(scenario_dir):
+        for name in sorted(os.listdir(scenario_dir)):
+            path = os.path.join(scenario_dir, name)
+            for filename in ('scenario.json', 'links.arrow', 'nodes.arrow'):
+                if os.path.exists(os.path.join(path, filename)):
+                    stat = os.stat(os.path.join(path, filename))
+                    h.update(f'{name}/{filename}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return h.hexdigest()[:16]
+
+
+def _aligned(graph, kind, table):
+    #float32 attribute arrays in the graph's row order, nan where the scenario has no value
+    size = len(graph.links.index) if kind == 'links' else len(graph.nodes.index)
+    if table is None:
+        return {}
+    ids = [table.column(c).to_numpy(zero_copy_only=False).astype(float) for c in ID_COLUMNS[kind]]
+    rows = graph.link_rows_for_ids(*ids) if kind == 'links' else graph.node_rows_for_ids(*ids)
+    found = rows >= 0
+
+    arrays = {}
+    for column in ATTRIBUTES[kind]:
+        if column not in table.column_names:
+            continue
+        values = np.full(size, np.nan, dtype=np.float32)
+        values[rows[found]] = table.column(column).to_numpy(zero_copy_only=False).astype(np.float32)[found]
+        arrays[column] = values
+    return arrays
+
+
+def _read_table(path):
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def load_scenario(graph, path):
+    with open(os.path.join(path, 'scenario.json')) as f:
+        meta = json.load(f)
+    arrays = {kind: _aligned(graph, kind, _read_table(os.path.join(path, f'{kind}.arrow'))) for kind in ATTRIBUTES}
+    return Scenario(os.path.basename(path), meta, arrays, scenarios_version(os.path.dirname(path)))
+
+
+def base_scenario(graph):
+    arrays = {
+        kind: {c: frame[c].to_numpy(dtype=np.float32) for c in ATTRIBUTES[kind] if c in frame}
+        for kind, frame in (('links', graph.links), ('nodes', graph.nodes))
+    }
+    return Scenario(BASE, BASE_META, arrays, '')
+
+
+def write_scenario(name, meta, links=None, nodes=None, scenario_dir=SCENARIO_DIR):
+    #links/nodes: DataFrames with the id columns and any of ATTRIBUTES
+    path = os.path.join(scenario_dir, name)
+    os.makedirs(path, exist_ok=True)
+    for kind, frame in (('links', links), ('nodes', nodes)):
+        if frame is None:
+            continue
+        columns = [c for c in ID_COLUMNS[kind] + ATTRIBUTES[kind] if c in frame]
+        table = pa.Table.from_pandas(frame[columns], preserve_index=False)
+        with pa.OSFile(os.path.join(path, f'{kind}.arrow'), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    with open(os.path.join(path, 'scenario.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return path
+
+
+class ScenarioStore:
+
+    def __init__(self, data, scenario_dir=SCENARIO_DIR):
+        self.data = data
+        self.version = f'{data.version}-{scenarios_version(scenario_dir)}'
+        self.graph = network.network(data)
+        self.scenarios = {BASE: base_scenario(self.graph)}
+        self._applied = {}
+        if os.path.isdir(scenario_dir):
+            for name in sorted(os.listdir(scenario_dir)):
+                path = os.path.join(scenario_dir, name)
+                if os.path.exists(os.path.join(path, 'scenario.json')):
+                    self.scenarios[name] = load_scenario(self.graph, path)
+
+    @property
+    def names(self):
+        return list(self.scenarios)
+
+    def get(self, name):
+        return self.scenarios[name]
+
+    def diff(self, name, against, kind, column):
+        #per-row change from one scenario to another - nan where either has no value
+        a = self.scenarios[name].values(kind, column)
+        b = self.scenarios[against].values(kind, column)
+        if a is None or b is None:
+            return None
+        return a - b
+
+    def diff_frame(self, name, against, kind, column):
+        #geometry with the change in one attribute, only where it is known in both
+        change = self.diff(name, against, kind, column)
+        frame = self.graph.links if kind == 'links' else self.graph.nodes
+        label = 'label' if kind == 'links' else 'LABEL'
+        if change is None:
+            return frame.iloc[:0][[label, frame.geometry.name]]
+        out = frame[[label, frame.geometry.name]].assign(**{column: np.round(change.astype(float), 1)})
+        return out[~np.isnan(change)]
+
+    def apply(self, data, name):
+        if name == BASE:
+            return data
+        if (data.version, name) not in self._applied:
+            self._applied[(data.version, name)] = ScenarioData(data, self.graph, self.scenarios[name], self.scenarios[BASE])
+        return self._applied[(data.version, name)]
+
+
+class ScenarioData:
+    #stands in for the bundle: link and node attributes come from the scenario. layer rows are
+    #matched to the graph by their own ids only, and a row keeps its own figure wherever the
+    #scenario has the base figure for its link - the graph holds one row per A/B, while a layer
+    #may carry several rows for it with different figures
+
+    def __init__(self, data, graph, scenario, base):
+        self.data = data
+        self.base = getattr(data, 'base', data)
+        self.graph = graph
+        self.scenario = scenario
+        self.base_scenario = base
+        self.version = f'{data.version}-s{scenario.name}{scenario.digest}'
+        self._frames = {}
+
+    def _rows(self, frame, kind):
+        #graph row of each layer row, -1 where it has no ids or they are not in the graph
+        ids = [frame[c].to_numpy(dtype=float) if c in frame else np.full(len(frame.index), np.nan) for c in ID_COLUMNS[kind]]
+        return self.graph.link_rows_for_ids(*ids) if kind == 'links' else self.graph.node_rows_for_ids(*ids)
+
+    def frame(self, name):
+        kind = SOURCE_KINDS.get(name)
+        if kind is None:
+            return self.data.frame(name)
+        if name not in self._frames:
+            frame = self.data.frame(name)
+            rows = self._rows(frame, kind)
+            found = rows >= 0
+            columns = {}
+            for column, values in self.scenario.arrays[kind].items():
+                if column not in frame and column not in ADDED[kind]:
+                    continue
+                scenario = np.where(found, values[rows.clip(0)], np.nan)
+                if column not in frame:
+                    columns[column] = scenario
+                    continue
+                own = frame[column].to_numpy(dtype=float)
+                base = self.base_scenario.values(kind, column)
+                if base is None:
+                    changed = found
+                else:
+                    base = np.where(found, base[rows.clip(0)], np.nan)
+                    changed = found & ~((scenario == base) | (np.isnan(scenario) & np.isnan(base)))
+                columns[column] = np.where(changed, scenario, own)
+            self._frames[name] = frame.assign(**columns)
+        return self._frames[name]
+
+
+def scenario_store(data):
+    return STORE_CACHE.get_or_build((data.version, scenarios_version()), lambda: ScenarioStore(data))
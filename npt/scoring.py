@@ -0,0 +1,147 @@
+#composite priority scoring and ranking
+#
+#every candidate link and node is a row of one criteria matrix, each criterion
+#min-max normalised to 0-1 within its kind so a node's delay and a link's LoS
+#score on the same scale. a score is the matrix times the weight vector, over
+#the weights of the criteria the row has a value for - a criterion that does not
+#apply to its kind, or that it has no data for, counts neither for nor against
+#it, so a node can score 100 like a link. when a single weight moves the scores
+#are updated by that column alone, and the top k come from argpartition rather
+#than sorting the whole network.
+
+import numpy as np
+import pandas as pd
+
+from npt import thresholds
+from npt.cache import LRUCache
+
+#criterion: (label, column for links, column for nodes) - None where a kind has no such measure
+CRITERIA = {
+    'demand': ('Passenger demand (AM peak PT trips)', 'AM_PT', 'AM_PT'),
+    'frequency': ('Bus frequency (buses/hr)', 'buses', None),
+    'delay': ('Delay (LoS / seconds of delay)', 'LOS', 'DELAY_WAVG'),
+    'length': ('Length of road affected', 'length', None),
+}
+
+DEFAULT_WEIGHTS = {'demand': 0.4, 'frequency': 0.2, 'delay': 0.3, 'length': 0.1}
+
+#full recomputes after this many incremental updates, so float error cannot build up
+REFRESH_EVERY = 1000
+
+MATRIX_CACHE = LRUCache('scoring', maxsize=4)
+
+
+def normalise(values):
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    out = np.zeros(len(values))
+    if valid.any():
+        lo, hi = values[valid].min(), values[valid].max()
+        out[valid] = (values[valid] - lo) / (hi - lo) if hi > lo else 1.0
+    return out
+
+
+def _names(frame, label, prefix, id_columns):
+    #model ids for features without a label, where they have them
+    ids = frame[list(id_columns)]
+    known = ids.notna().all(axis=1)
+    names = pd.Series('Unnamed', index=frame.index, dtype=object)
+    names[known] = prefix + ids[known].astype('int64').astype(str).agg('-'.join, axis=1)
+    return frame[label].where(frame[label].notna(), names).to_numpy(dtype=object)
+
+
+class CriteriaMatrix:
+
+    def __init__(self, data):
+        self.version = data.version
+        found = thresholds.candidates(data)
+        links, nodes = found.frames['links'], found.frames['nodes']
+        self.kinds = np.repeat(['links', 'nodes'], [len(links.index), len(nodes.index)])
+        self.labels = np.concatenate([
+            _names(links, 'label', 'Link ', ('A', 'B')),
+            _names(nodes, 'LABEL', 'Node ', ('N',)),
+        ])
+
+        columns = []
+        present = []
+        raw = {}
+        for criterion, (_, link_column, node_column) in CRITERIA.items():
+            parts = []
+            raw_parts = []
+            for frame, column in ((links, link_column), (nodes, node_column)):
+                values = frame[column].to_numpy(dtype=float) if column else np.full(len(frame.index), np.nan)
+                parts.append(normalise(values))
+                raw_parts.append(values)
+            columns.append(np.concatenate(parts))
+            raw[criterion] = np.concatenate(raw_parts)
+            present.append(~np.isnan(raw[criterion]))
+        self.values = np.column_stack(columns)
+        #1 where a row has the criterion, so only those weights count towards its total
+        self.present = np.column_stack(present).astype(float)
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.values)
+
+
+def criteria_matrix(data):
+    return MATRIX_CACHE.get_or_build(data.version, lambda: CriteriaMatrix(data))
+
+
+class Ranker:
+    #per-session scores over a shared matrix
+
+    def __init__(self, matrix, weights=None):
+        self.matrix = matrix
+        self.names = list(CRITERIA)
+        weights = weights or DEFAULT_WEIGHTS
+        self.weights = np.array([float(weights[name]) for name in self.names])
+        self.refresh()
+
+    def refresh(self):
+        self.totals = self.matrix.values @ self.weights
+        self.applied = self.matrix.present @ self.weights
+        self.updates = 0
+
+    @property
+    def scores(self):
+        #0-100 over the weights that apply to each row
+        applied = self.applied
+        return np.divide(self.totals, applied, out=np.zeros(len(applied)), where=applied > 1e-12) * 100
+
+    def set_weight(self, criterion, value):
+        j = self.names.index(criterion)
+        change = float(value) - self.weights[j]
+        if not change:
+            return
+        self.weights[j] = float(value)
+        self.totals += change * self.matrix.values[:, j]
+        self.applied += change * self.matrix.present[:, j]
+        self.updates += 1
+        if self.updates >= REFRESH_EVERY:
+            self.refresh()
+
+    def set_weights(self, weights):
+        for criterion, value in weights.items():
+            self.set_weight(criterion, value)
+
+    def top(self, k):
+        #row indices of the k highest scores, best first
+        scores = self.scores
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        best = np.argpartition(-scores, k - 1)[:k]
+        return best[np.argsort(-scores[best], kind='stable')]
+
+    def table(self, k):
+        rows = self.top(k)
+        out = pd.DataFrame({
+            'Rank': np.arange(1, len(rows) + 1),
+            'Type': np.where(self.matrix.kinds[rows] == 'links', 'Road segment', 'Intersection'),
+            'Name': self.matrix.labels[rows],
+            'Score': np.round(self.scores[rows], 1),
+        })
+        for criterion, (label, _, _) in CRITERIA.items():
+            out[label] = np.round(self.matrix.raw[criterion][rows], 1)
+        return out
@@ -0,0 +1,238 @@
+#content-addressed snapshots of every view
+#
+#    python -m npt.snapshots build                  render every view of the current data
+#    python -m npt.snapshots serve --port 8502      serve them with caching headers
+#
+#a view's map html with its summary is written once per data version to
+#static/snapshots/<sha256>.html (plus a gzipped copy), named after its own
+#content, so a url never changes meaning and can be cached forever. each data
+#version has a manifest, <version>.json, naming the file of each view, and
+#latest.json names the newest version. the app shows a view's snapshot while
+#its live map is still being built, e.g. after a restart. the server answers
+#visitors without a streamlit session at all:
+#
+#    /<sha256>.html     immutable, with an etag
+#    /view/<slug>       the latest snapshot of a view, revalidated against its etag
+#    /                  an index of the latest views
+
+import argparse
+import gzip
+import hashlib
+import html
+import json
+import os
+import re
+import tempfile
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from npt import bundle, maps, summary, tiles, views
+from npt.cache import LRUCache
+
+SNAPSHOT_DIR = os.path.join(tiles.STATIC_DIR, 'snapshots')
+
+#streamlit serves ./static at /app/static - point at `npt.snapshots serve` for the caching headers
+SNAPSHOT_URL = os.environ.get('NPT_SNAPSHOT_URL', '/app/static/snapshots')
+
+#manifests of this many data versions are kept, with the files they name
+KEEP_VERSIONS = 3
+
+#a year, the longest max-age caches honour
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+MANIFEST_CACHE = LRUCache('snapshots', maxsize=8)
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def view_slug(view):
+    return f'{slug(view.analysis.label)}__{slug(view.data)}'
+
+
+def page(view, data, label='2048'):
+    #the view's map with its summary under it, as one standalone page
+    rendered = maps.get_view_map(view, data)
+    text = summary.summarise(view, data, label)
+    return rendered.html.replace('</body>', f'<pre class="npt-summary">{html.escape(text)}</pre></body>', 1)
+
+
+def _replace(path, content):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _store(content, snapshot_dir):
+    #writes content under its own hash, once - returns the file name
+    body = content.encode()
+    digest = hashlib.sha256(body).hexdigest()
+    name = f'{digest}.html'
+    path = os.path.join(snapshot_dir, name)
+    if not os.path.exists(path):
+        _replace(path + '.gz', gzip.compress(body, mtime=0))
+        _replace(path, body)
+    return name
+
+
+def _manifest_path(version, snapshot_dir):
+    return os.path.join(snapshot_dir, f'{version}.json')
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest(version, snapshot_dir=SNAPSHOT_DIR):
+    #{view slug: entry} for a data version, empty when none have been written. keyed on the
+    #file's mtime, so snapshots written by another process are seen
+    path = _manifest_path(version, snapshot_dir)
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    return MANIFEST_CACHE.get_or_build((path, stamp), lambda: _read_json(path) or {})
+
+
+def save(data, views_=None, label='2048', latest=False, snapshot_dir=SNAPSHOT_DIR):
+    #snapshots of the views (default: all, and the map of every layer) this data version has none of yet,
+    #returning its manifest.
+    #folium names elements at random, so a view is only rendered once per version, not once per process
+    os.makedirs(snapshot_dir, exist_ok=True)
+    saved = manifest(data.version, snapshot_dir)
+    entries = {}
+    for view in views_ or [views.network_view(), *views.all_views()]:
+        if view_slug(view) in saved:
+            continue
+        entries[view_slug(view)] = {
+            'file': _store(page(view, data, label), snapshot_dir),
+            'analysis': view.analysis.label,
+            'data': view.data,
+        }
+
+    with bundle._build_lock(snapshot_dir):
+        path = _manifest_path(data.version, snapshot_dir)
+        merged = {**(_read_json(path) or {}), **entries}
+        _replace(path, json.dumps(merged, indent=1).encode())
+        if latest:
+            _replace(os.path.join(snapshot_dir, 'latest.json'), json.dumps({'version': data.version}).encode())
+        prune(snapshot_dir, current=data.version)
+    return merged
+
+
+def prune(snapshot_dir=SNAPSHOT_DIR, keep=KEEP_VERSIONS, current=None):
+    #drop all but the newest manifests, and the files no manifest left names
+    manifests = [n for n in os.listdir(snapshot_dir) if n.endswith('.json') and n != 'latest.json']
+    manifests.sort(key=lambda n: os.stat(os.path.join(snapshot_dir, n)).st_mtime, reverse=True)
+    for name in manifests[keep:]:
+        if name != f'{current}.json':
+            os.remove(os.path.join(snapshot_dir, name))
+
+    named = set()
+    for name in os.listdir(snapshot_dir):
+        if name.endswith('.json') and name != 'latest.json':
+            named.update(entry['file'] for entry in (_read_json(os.path.join(snapshot_dir, name)) or {}).values())
+    for name in os.listdir(snapshot_dir):
+        if name.endswith(('.html', '.html.gz')) and name.removesuffix('.gz') not in named:
+            os.remove(os.path.join(snapshot_dir, name))
+
+
+def lookup(view, data, snapshot_dir=SNAPSHOT_DIR):
+    return manifest(data.version, snapshot_dir).get(view_slug(view))
+
+
+def url(entry, base=SNAPSHOT_URL):
+    return f'{base.rstrip("/")}/{entry["file"]}'
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    #every response has a length, so connections are kept open between requests
+    protocol_version = 'HTTP/1.1'
+    snapshot_dir = SNAPSHOT_DIR
+
+    def _latest(self):
+        version = (_read_json(os.path.join(self.snapshot_dir, 'latest.json')) or {}).get('version')
+        return manifest(version, self.snapshot_dir) if version else {}
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_file(self, name, cache_control):
+        path = os.path.join(self.snapshot_dir, name)
+        if not re.fullmatch(r'[0-9a-f]{64}\.html', name) or not os.path.exists(path):
+            return self._send(HTTPStatus.NOT_FOUND, b'not found', {'Content-Type': 'text/plain'})
+        #the name is the hash of the content, so it is the etag too
+        etag = f'"{name[:-5]}"'
+        headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            return self._send(HTTPStatus.NOT_MODIFIED, headers=headers)
+        headers['Content-Type'] = 'text/html; charset=utf-8'
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and os.path.exists(path + '.gz'):
+            path += '.gz'
+            headers['Content-Encoding'] = 'gzip'
+        with open(path, 'rb') as f:
+            self._send(HTTPStatus.OK, f.read(), headers)
+
+    def do_GET(self):
+        route = self.path.split('?', 1)[0]
+        if route == '/':
+            rows = ''.join(f'<li><a href="/view/{html.escape(key)}">{html.escape(e["analysis"])} - {html.escape(e["data"])}</a></li>'
+                           for key, e in sorted(self._latest().items()))
+            body = ('<html><head><meta charset="utf-8"><title>Network Prioritisation Tool</title></head><body>'
+                    f'<h1>Network Prioritisation Tool</h1><ul>{rows}</ul></body></html>').encode()
+            return self._send(HTTPStatus.OK, body, {'Content-Type': 'text/html; charset=utf-8', 'Cache-Control': 'no-cache'})
+        if route.startswith('/view/'):
+            entry = self._latest().get(route[len('/view/'):])
+            if entry is None:
+                return self._send(HTTPStatus.NOT_FOUND, b'not found', {'Content-Type': 'text/plain'})
+            return self._send_file(entry['file'], 'no-cache')
+        return self._send_file(route.lstrip('/'), IMMUTABLE)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host='0.0.0.0', port=8502, snapshot_dir=SNAPSHOT_DIR):
+    handler = type('Handler', (SnapshotHandler,), {'snapshot_dir': snapshot_dir})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f'serving {snapshot_dir} on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m npt.snapshots', description='Pre-render and serve NPT map snapshots.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('build', help='render every view of the current data')
+    serve_args = commands.add_parser('serve', help='serve the snapshots with ETag and immutable caching')
+    serve_args.add_argument('--host', default='0.0.0.0')
+    serve_args.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        saved = save(bundle.open_bundle(), latest=True)
+        print(f'{len(saved)} snapshots in {SNAPSHOT_DIR}')
+    else:
+        serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#spatial index over the map layers
+#
+#every link and node the views can draw goes into one shapely STRtree in NZTM
+#(EPSG:2193), so click tolerances and viewport queries are in metres. the tree
+#is built once per data version and shared by every session; a click or a
+#viewport is then a single vectorised tree query instead of a scan of the frames.
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+
+from npt.cache import LRUCache
+from npt.views import KINDS, LAYERS
+
+PROJECTED_CRS = 'EPSG:2193'
+
+#how far from a feature a click still selects it, in metres
+CLICK_RADIUS = 30
+
+#intersection markers sit on top of the links that meet there, so a click
+#this close to one picks the intersection
+NODE_PREFERENCE = 10
+
+SPATIAL_CACHE = LRUCache('spatial', maxsize=8)
+
+_TO_PROJECTED = Transformer.from_crs('EPSG:4326', PROJECTED_CRS, always_xy=True)
+
+LAYER_BY_DATASET = {layer.dataset: layer for layer in LAYERS.values()}
+
+
+def project(geoms):
+    return shapely.transform(geoms, lambda coords: np.column_stack(_TO_PROJECTED.transform(coords[:, 0], coords[:, 1])))
+
+
+def project_point(lon, lat):
+    return shapely.points(*_TO_PROJECTED.transform(lon, lat))
+
+
+def project_bounds(bounds):
+    #lon/lat bounds to the projected envelope that contains them
+    minx, miny, maxx, maxy = bounds
+    xs, ys = _TO_PROJECTED.transform([minx, minx, maxx, maxx], [miny, maxy, miny, maxy])
+    return shapely.box(min(xs), min(ys), max(xs), max(ys))
+
+
+class SpatialIndex:
+
+    def __init__(self, data):
+        self.datasets = list(LAYER_BY_DATASET)
+        frames = [data.frame(name) for name in self.datasets]
+        self.dataset = np.repeat(np.arange(len(frames)), [len(f.index) for f in frames])
+        self.row = np.concatenate([np.arange(len(f.index)) for f in frames])
+        geoms = np.concatenate([np.asarray(f.geometry.array, dtype=object) for f in frames])
+        self.geoms = project(geoms)
+        self.tree = shapely.STRtree(self.geoms)
+        self.is_node = shapely.get_type_id(self.geoms) == 0
+
+    def _filter(self, hits, datasets):
+        if datasets is None:
+            return hits
+        wanted = np.isin(self.dataset[hits], [self.datasets.index(name) for name in datasets])
+        return hits[wanted]
+
+    def nearest(self, lon, lat, datasets=None, max_distance=CLICK_RADIUS):
+        #(dataset, row) of the feature closest to a click, or None
+        point = project_point(lon, lat)
+        hits = self._filter(self.tree.query(point, predicate='dwithin', distance=max_distance), datasets)
+        if not len(hits):
+            return None
+        distance = shapely.distance(self.geoms[hits], point) - NODE_PREFERENCE * self.is_node[hits]
+        best = hits[np.argmin(distance)]
+        return self.datasets[self.dataset[best]], int(self.row[best])
+
+    def in_bounds(self, bounds, datasets=None):
+        #{dataset: rows} of the features intersecting lon/lat bounds
+        hits = np.sort(self._filter(self.tree.query(project_bounds(bounds), predicate='intersects'), datasets))
+        return {
+            name: self.row[hits[self.dataset[hits] == i]]
+            for i, name in enumerate(self.datasets)
+            if (self.dataset[hits] == i).any()
+        }
+
+
+def spatial_index(data):
+    return SPATIAL_CACHE.get_or_build(data.version, lambda: SpatialIndex(data))
+
+
+def feature_details(data, dataset, row):
+    #the clicked feature's tooltip fields as a two-column table
+    layer = LAYER_BY_DATASET[dataset]
+    values = data.frame(dataset).iloc[row]
+    fields = [f for f in layer.tooltip if f in values.index]
+    return pd.DataFrame({'Field': fields, 'Value': ['' if pd.isna(values[f]) else str(values[f]) for f in fields]})
+
+
+def features_in_view(data, view, bounds):
+    #one row per feature of this view inside the map bounds
+    found = spatial_index(data).in_bounds(bounds, [layer.dataset for layer in view.layers])
+    frames = []
+    for layer in view.layers:
+        if layer.dataset not in found:
+            continue
+        frame = data.frame(layer.dataset).iloc[found[layer.dataset]]
+        column = KINDS[layer.kind].column
+        frames.append(pd.DataFrame({
+            'Layer': layer.name,
+            'Name': frame[layer.label] if layer.label in frame else None,
+            'AM peak PT trips': frame['AM_PT'] if 'AM_PT' in frame else np.nan,
+            KINDS[layer.kind].caption: frame[column] if column in frame else np.nan,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['Layer', 'Name', 'AM peak PT trips'])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,106 @@
+#precomputed summary statistics for the col2 summaries
+#
+#built once per data version for every (kind, category combination). combined
+#categories are aggregated from per-category sums rather than by adding means,
+#so 'All locations' reports the true mean over the pooled rows.
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from npt.cache import LRUCache
+from npt.views import CATEGORIES, KINDS, LAYERS
+
+METRICS = ('ADT_PT', 'AM_PT', 'LOS', 'DELAY_WAVG')
+
+#intersections carry their level of service as a weighted average
+METRIC_COLUMNS = {
+    'nodes': {'LOS': 'LOS_WAVG'},
+}
+
+STATS_CACHE = LRUCache('stats', maxsize=4)
+
+
+def link_length_m(frame):
+    #TTSM links carry DISTANCE in km; the secondary layer also has a measured length in m
+    length = pd.Series(np.nan, index=frame.index)
+    if 'DISTANCE' in frame:
+        length = frame['DISTANCE'].astype(float) * 1000
+    if 'length' in frame:
+        length = length.fillna(frame['length'].astype(float))
+    return length.to_numpy(dtype=float)
+
+
+def column(frame, kind, metric):
+    name = METRIC_COLUMNS.get(kind, {}).get(metric, metric)
+    if name not in frame:
+        return None
+    return frame[name].to_numpy(dtype=float)
+
+
+def _partials(frame, kind):
+    weights = link_length_m(frame) if kind == 'links' else np.ones(len(frame.index))
+    weights = np.nan_to_num(weights)
+    out = {'count': len(frame.index), 'length_m': weights.sum() if kind == 'links' else np.nan}
+    for metric in METRICS:
+        values = column(frame, kind, metric)
+        if values is None:
+            out[f'{metric}_n'] = 0
+            out[f'{metric}_sum'] = 0.0
+            out[f'{metric}_wsum'] = 0.0
+            out[f'{metric}_w'] = 0.0
+            continue
+        valid = ~np.isnan(values)
+        out[f'{metric}_n'] = int(valid.sum())
+        out[f'{metric}_sum'] = values[valid].sum()
+        out[f'{metric}_wsum'] = (values[valid] * weights[valid]).sum()
+        out[f'{metric}_w'] = weights[valid].sum()
+    return out
+
+
+def build_table(data):
+    partials = {
+        (kind, category): _partials(data.frame(layer.dataset), kind)
+        for (category, kind), layer in LAYERS.items()
+    }
+
+    records = []
+    for kind in KINDS:
+        for r in range(1, len(CATEGORIES) + 1):
+            for combo in combinations(CATEGORIES, r):
+                parts = [partials[(kind, c)] for c in combo if (kind, c) in partials]
+                if not parts:
+                    continue
+                row = {'kind': kind, 'categories': combo, 'count': sum(p['count'] for p in parts)}
+                row['length_m'] = sum(p['length_m'] for p in parts) if kind == 'links' else np.nan
+                for metric in METRICS:
+                    n = sum(p[f'{metric}_n'] for p in parts)
+                    total = sum(p[f'{metric}_sum'] for p in parts)
+                    w = sum(p[f'{metric}_w'] for p in parts)
+                    row[f'{metric}_count'] = n
+                    row[f'{metric}_sum'] = total
+                    row[f'{metric}_mean'] = total / n if n else np.nan
+                    if kind == 'links':
+                        row[f'{metric}_wmean'] = sum(p[f'{metric}_wsum'] for p in parts) / w if w else np.nan
+                    else:
+                        row[f'{metric}_wmean'] = np.nan
+                records.append(row)
+
+    return pd.DataFrame.from_records(records).set_index(['kind', 'categories'])
+
+
+class SummaryTable:
+
+    def __init__(self, table):
+        self.table = table
+        self._rows = table.to_dict('index')
+
+    def get(self, kind, categories):
+        #categories in any order - keyed on the registry order
+        key = (kind, tuple(c for c in CATEGORIES if c in categories))
+        return self._rows[key]
+
+
+def summary_table(data):
+    return STATS_CACHE.get_or_build(data.version, lambda: SummaryTable(build_table(data)))
@@ -0,0 +1,53 @@
+#col2 summary text for a view, read from the precomputed statistics table
+
+import numpy as np
+
+from npt import corridors, stats
+from npt.views import CATEGORIES, KINDS
+
+
+def _int(value):
+    return 0 if np.isnan(value) else int(value)
+
+
+def summarise(view, data, scenario='2048'):
+    #scenario is the label the figures are quoted for
+    table = stats.summary_table(data)
+    kinds = view.kinds
+    counts = {}
+    lines = []
+    for kind in kinds:
+        layers = [layer for layer in view.layers if layer.kind == kind]
+        row = table.get(kind, [layer.category for layer in layers])
+        counts[kind] = row['count']
+
+        delay_note = min((CATEGORIES[layer.category].delay_note for layer in layers), key=lambda n: int(n.lstrip('>')))
+        if len(kinds) > 1:
+            lines.append(f"{KINDS[kind].plural.capitalize()}:")
+        else:
+            lines.append(KINDS[kind].reason)
+        #road figures are averaged over length, so a short stub counts for less than a long link
+        stat = 'wmean' if kind == 'links' else 'mean'
+        for metric, template in layers[0].metrics:
+            lines.append('- ' + template.format(_int(row[f'{metric}_{stat}']), delay_note=delay_note) + f' ({scenario}).')
+        lines.append('')
+
+    found = ' and '.join(f"**{counts[kind]}** {KINDS[kind].plural}" for kind in kinds)
+    header = [
+        'This shows the results of analysis for:',
+        f'- {view.analysis.label}; where,',
+        f'- {view.data} has been selected.',
+        '',
+        f'There are {found} identified in this analysis.',
+        '',
+    ]
+    if 'links' in kinds:
+        found = corridors.view_corridors(view, data)
+        if len(found.index):
+            busiest = found.iloc[0]
+            name = f' ({busiest["name"]})' if isinstance(busiest['name'], str) else ''
+            header += [f'The road segments form **{len(found.index)}** continuous corridors; the longest is {found["length_km"].max():.1f} km. '
+                       f'The busiest{name} carries **{round(busiest["passenger_km"]):,}** PT passenger-km a day.', '']
+    if len(kinds) > 1:
+        header += ['These roads and intersections have been selected because they accomodate:', '']
+    return '\n'.join(header + lines)
@@ -0,0 +1,215 @@
+#interactive threshold engine
+#
+#re-derives priority/secondary locations from the model attributes instead of
+#the pre-filtered layers. every candidate link and node is kept in one frame
+#with a sorted index per attribute, so a threshold change is a handful of
+#searchsorted calls and boolean masks - no pandas filtering or re-reading.
+#
+#the shipped layers were cut by study area as well as by these rules: priority
+#locations are inside the key locations, secondary ones outside the primary
+#areas. a feature keeps the area of the layers it came from and the rules only
+#decide which category within it it reaches, so the defaults give back the
+#shipped layers and a feature outside both areas is never promoted.
+
+import hashlib
+from dataclasses import astuple, dataclass
+
+import numpy as np
+import pandas as pd
+
+from npt.cache import LRUCache
+from npt.views import LAYERS
+
+LOS_GRADES = {'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6}
+
+#least strict first - a feature takes the last category it passes
+CLASSES = ('none', 'secondary', 'priority')
+
+LINK_SOURCES = ('links_key_locations', 'links_outside_primary', 'links_delay', 'links_demand')
+NODE_SOURCES = ('intersections_key_locations', 'intersections_outside_primary', 'delay', 'demand')
+
+LINK_COLUMNS = ('A', 'B', 'label', 'ADT_PT', 'AM_PT', 'IP_PT', 'PM_PT', 'LOS', 'DISTANCE', 'length', 'buses')
+NODE_COLUMNS = ('N', 'LABEL', 'ADT_PT', 'AM_PT', 'IP_PT', 'PM_PT', 'LOS_WAVG', 'DELAY_WAVG')
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    am_pt: float
+    buses: float
+    los: int
+
+
+#the rules described under 'Analysis Thresholds'. the shipped secondary layer has
+#links from one pattern at a 7 minute headway (8.6 buses/hr), so it was not cut
+#on buses/hr and neither is its default
+DEFAULTS = {
+    'priority': Thresholds(am_pt=150, buses=20, los=LOS_GRADES['D']),
+    'secondary': Thresholds(am_pt=80, buses=0, los=LOS_GRADES['C']),
+}
+
+#the highest category a feature of each source layer may take - its study area
+AREAS = {layer.dataset: CLASSES.index(category) for (category, kind), layer in LAYERS.items()}
+
+CANDIDATE_CACHE = LRUCache('thresholds', maxsize=4)
+
+
+class SortedIndex:
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=float)
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted = self.values[self.order]
+        self.missing = np.isnan(self.values)
+        #argsort puts nan last
+        self.valid = len(self.values) - int(self.missing.sum())
+
+    def __len__(self):
+        return len(self.values)
+
+    def count_at_least(self, lo):
+        return self.valid - int(np.searchsorted(self.sorted[:self.valid], lo, side='left'))
+
+    def at_least(self, lo, missing=False):
+        start = np.searchsorted(self.sorted[:self.valid], lo, side='left')
+        mask = np.zeros(len(self.values), dtype=bool)
+        mask[self.order[start:self.valid]] = True
+        if missing:
+            mask |= self.missing
+        return mask
+
+
+def bus_frequency(frame):
+    #buses/hr on each road under the Hybrid network - one row per Remix pattern on the link,
+    #every pattern of every line summed over both directions (A-B and B-A)
+    if 'minheadway' not in frame or 'line_id' not in frame:
+        return pd.Series(np.nan, index=frame.index)
+    patterns = [c for c in ('line_id', 'pattern', 'dir_id') if c in frame]
+    lines = frame[['A', 'B', *patterns, 'minheadway']].dropna(subset=['A', 'B', 'line_id', 'minheadway'])
+    lines = lines.drop_duplicates(['A', 'B', *patterns])
+    per_link = (60 / lines['minheadway']).groupby([lines['A'], lines['B']]).sum()
+    keys = pd.MultiIndex.from_arrays([frame['A'], frame['B']])
+    reverse = pd.MultiIndex.from_arrays([frame['B'], frame['A']])
+    both = per_link.reindex(keys).to_numpy() + np.nan_to_num(per_link.reindex(reverse).to_numpy())
+    return pd.Series(both, index=frame.index)
+
+
+def _dedupe(frame, key_columns):
+    #model ids where present, otherwise the geometry itself
+    keys = frame[list(key_columns)].copy()
+    has_key = keys.notna().all(axis=1)
+    keys['geometry'] = frame.geometry.to_wkb(hex=True).where(~has_key)
+    return frame[~keys.duplicated()].reset_index(drop=True)
+
+
+def _select(frame, columns):
+    out = pd.DataFrame(index=frame.index)
+    for name in columns:
+        out[name] = frame[name] if name in frame else np.nan
+    return out
+
+
+def candidate_links(data):
+    import geopandas as gpd
+
+    frames = []
+    for name in LINK_SOURCES:
+        frame = data.frame(name)
+        frame = frame.assign(label=frame.get('label', frame.get('Label')), area=AREAS.get(name, 0))
+        frames.append(frame)
+    links = pd.concat(frames, ignore_index=True)
+
+    buses = bus_frequency(links)
+    if 'buses' in links:
+        #a scenario's own buses/hr, where it has them
+        buses = links['buses'].where(links['buses'].notna(), buses)
+    links['buses'] = buses.groupby([links['A'], links['B']]).transform('max')
+
+    #sources come widest area first, so the copy a link keeps is the one of its widest area
+    links = _dedupe(links, ('A', 'B'))
+    links['length'] = links['length'].fillna(links['DISTANCE'] * 1000)
+    out = _select(links, LINK_COLUMNS)
+    out['Label'] = out['label']
+    out['area'] = links['area'].to_numpy(dtype=np.int8)
+    return gpd.GeoDataFrame(out, geometry=links.geometry, crs=links.crs)
+
+
+def candidate_nodes(data):
+    import geopandas as gpd
+
+    nodes = pd.concat([data.frame(name).assign(area=AREAS.get(name, 0)) for name in NODE_SOURCES], ignore_index=True)
+    nodes = _dedupe(nodes, ('N',))
+    out = _select(nodes, NODE_COLUMNS)
+    out['LOS'] = out['LOS_WAVG']
+    out['area'] = nodes['area'].to_numpy(dtype=np.int8)
+    return gpd.GeoDataFrame(out, geometry=nodes.geometry, crs=nodes.crs)
+
+
+class Candidates:
+
+    def __init__(self, data):
+        self.version = data.version
+        self.frames = {'links': candidate_links(data), 'nodes': candidate_nodes(data)}
+        self.indexes = {
+            kind: {
+                'am_pt': SortedIndex(frame['AM_PT']),
+                'buses': SortedIndex(frame['buses']) if 'buses' in frame else None,
+                'los': SortedIndex(frame['LOS']),
+            }
+            for kind, frame in self.frames.items()
+        }
+
+    def passes(self, kind, rule):
+        index = self.indexes[kind]
+        mask = index['am_pt'].at_least(rule.am_pt) & index['los'].at_least(rule.los)
+        if index['buses'] is not None:
+            #links without Hybrid network frequency data are not filtered on buses/hr
+            mask &= index['buses'].at_least(rule.buses, missing=True)
+        return mask
+
+    def classify(self, kind, rules):
+        codes = np.zeros(len(self.frames[kind].index), dtype=np.int8)
+        area = self.frames[kind]['area'].to_numpy()
+        for code, category in enumerate(CLASSES):
+            if category in rules:
+                codes[self.passes(kind, rules[category]) & (area >= code)] = code
+        return codes
+
+
+def candidates(data):
+    return CANDIDATE_CACHE.get_or_build(data.version, lambda: Candidates(data))
+
+
+def rules_digest(rules):
+    h = hashlib.sha256()
+    for category in sorted(rules):
+        h.update(repr((category, astuple(rules[category]))).encode())
+    return h.hexdigest()[:8]
+
+
+class Reclassified:
+    #stands in for the bundle: the registry datasets are re-derived from the rules
+
+    def __init__(self, data, rules):
+        self.data = data
+        self.base = getattr(data, 'base', data)
+        self.rules = rules
+        self.candidates = candidates(data)
+        self.version = f'{data.version}-t{rules_digest(rules)}'
+        self.codes = {kind: self.candidates.classify(kind, rules) for kind in self.candidates.frames}
+        self.datasets = {layer.dataset: (category, kind) for (category, kind), layer in LAYERS.items()}
+        self._frames = {}
+
+    def count(self, kind, category):
+        return int((self.codes[kind] == CLASSES.index(category)).sum())
+
+    def frame(self, name):
+        if name not in self.datasets:
+            return self.data.frame(name)
+        if name not in self._frames:
+            category, kind = self.datasets[name]
+            self._frames[name] = self.candidates.frames[kind][self.codes[kind] == CLASSES.index(category)]
+        return self._frames[name]
+
+
+def reclassify(data, rules):
+    return Reclassified(data, rules)
@@ -0,0 +1,254 @@
+#tiled GeoJSON serving mode for large layers
+#
+#instead of embedding every feature in the folium html, each layer is cut into
+#a z/x/y pyramid of small GeoJSON files under static/tiles (served by streamlit
+#with server.enableStaticServing). geometry is generalised and snapped for each
+#zoom by npt.geometry (plain GeoJSON features, no shared arcs), and the browser
+#only fetches the tiles covering its view, so the map payload stays the same
+#size however big the network gets. every
+#data version - including each custom threshold set and scenario - has its own
+#pyramid, and only the KEEP_VERSIONS most recently used are kept on disk.
+
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import shapely
+from folium.map import Layer
+from jinja2 import Template
+
+from npt import bundle, geometry
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+TILE_DIR = os.path.join(STATIC_DIR, 'tiles')
+
+#streamlit serves ./static at /app/static - override when running behind a base path
+TILE_URL = os.environ.get('NPT_TILE_URL', '/app/static/tiles')
+
+MIN_ZOOM = 9
+MAX_ZOOM = 16
+TILE_SIZE = 256
+
+#pyramids of this many data versions are kept, least recently used dropped first
+KEEP_VERSIONS = 16
+
+
+def lonlat_to_tile(lon, lat, z):
+    n = 2 ** z
+    lat = np.clip(np.radians(lat), -1.4844, 1.4844)
+    x = np.floor((np.asarray(lon) + 180) / 360 * n)
+    y = np.floor((1 - np.arcsinh(np.tan(lat)) / math.pi) / 2 * n)
+    return np.clip(x, 0, n - 1).astype(int), np.clip(y, 0, n - 1).astype(int)
+
+
+def tile_bounds(x, y, z):
+    n = 2 ** z
+    west = np.asarray(x) / n * 360 - 180
+    east = (np.asarray(x) + 1) / n * 360 - 180
+    north = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * np.asarray(y) / n))))
+    south = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (np.asarray(y) + 1) / n))))
+    return west, south, east, north
+
+
+def assign_tiles(geoms, z):
+    #(feature, x, y) for every tile a feature actually intersects
+    bounds = shapely.bounds(geoms)
+    x0, y1 = lonlat_to_tile(bounds[:, 0], bounds[:, 1], z)
+    x1, y0 = lonlat_to_tile(bounds[:, 2], bounds[:, 3], z)
+
+    nx = x1 - x0 + 1
+    ny = y1 - y0 + 1
+    counts = nx * ny
+    feature = np.repeat(np.arange(len(geoms)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tx = x0[feature] + offset % nx[feature]
+    ty = y0[feature] + offset // nx[feature]
+
+    boxes = shapely.box(*tile_bounds(tx, ty, z))
+    hit = shapely.intersects(boxes, geoms[feature])
+    return feature[hit], tx[hit], ty[hit]
+
+
+def feature_properties(frame, fields):
+    #one compact JSON object per row
+    records = frame[list(fields)].astype(object).where(frame[list(fields)].notna(), None)
+    return [json.dumps(dict(zip(fields, row)), default=float, separators=(',', ':'))
+            for row in records.itertuples(index=False, name=None)]
+
+
+def build_layer(gdf, fields, out_dir, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    geoms = np.asarray(gdf.geometry.array, dtype=object)
+    properties = feature_properties(gdf, fields)
+    os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(out_dir) + '.', dir=os.path.dirname(out_dir))
+    try:
+        manifest = _write_pyramid(gdf, geoms, properties, tmp, min_zoom, max_zoom)
+        #another session may have finished the same layer first - keep theirs
+        try:
+            os.rename(tmp, out_dir)
+        except OSError:
+            if not os.path.exists(manifest_path):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return manifest
+
+
+def _write_pyramid(gdf, geoms, properties, tmp, min_zoom, max_zoom):
+    tiles = 0
+
+    for z in range(min_zoom, max_zoom + 1):
+        geojson = shapely.to_geojson(geometry.generalise(geoms, z))
+        feature, tx, ty = assign_tiles(geoms, z)
+        order = np.lexsort((feature, ty, tx))
+        feature, tx, ty = feature[order], tx[order], ty[order]
+        breaks = np.flatnonzero(np.diff(tx) | np.diff(ty)) + 1
+
+        for chunk in np.split(np.arange(len(feature)), breaks):
+            if not len(chunk):
+                continue
+            x, y = tx[chunk[0]], ty[chunk[0]]
+            path = os.path.join(tmp, str(z), str(x))
+            os.makedirs(path, exist_ok=True)
+            body = ','.join(
+                f'{{"type":"Feature","id":{i},"properties":{properties[i]},"geometry":{geojson[i]}}}'
+                for i in feature[chunk]
+            )
+            with open(os.path.join(path, f'{y}.json'), 'w') as f:
+                f.write(f'{{"type":"FeatureCollection","features":[{body}]}}')
+            tiles += 1
+
+    minx, miny, maxx, maxy = (float(v) for v in gdf.total_bounds)
+    manifest = {
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': [minx, miny, maxx, maxy],
+        'features': len(geoms),
+        'tiles': tiles,
+    }
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def layer_url(version, dataset):
+    return f'{TILE_URL}/{version}/{dataset}'
+
+
+def build_view_tiles(view, data, tile_dir=TILE_DIR):
+    version_dir = os.path.join(tile_dir, data.version)
+    os.makedirs(version_dir, exist_ok=True)
+    #a version directory's mtime is when it was last used
+    os.utime(version_dir)
+    out = {}
+    for layer in view.layers:
+        out[layer.dataset] = build_layer(data.frame(layer.dataset), layer.tooltip, os.path.join(version_dir, layer.dataset))
+    prune(tile_dir, current=data.version)
+    return out
+
+
+def prune(tile_dir=TILE_DIR, keep=KEEP_VERSIONS, current=None):
+    #drop the pyramids of all but the most recently used versions
+    with bundle._build_lock(tile_dir):
+        versions = [e for e in os.scandir(tile_dir) if e.is_dir() and not e.name.startswith('.')]
+        versions.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in versions[keep:]:
+            if entry.name != current:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class TiledGeoJson(Layer):
+    #leaflet GeoJSON layer that fetches the pyramid tiles covering the current view
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJSON(null, {
+                pointToLayer: function (feature, latlng) {
+                    return L.circleMarker(latlng, {radius: 6});
+                },
+                onEachFeature: function (feature, layer) {
+                    var rows = {{ this.fields|tojson }}.map(function (field) {
+                        return '<tr><th>' + field + '</th><td>' + feature.properties[field] + '</td></tr>';
+                    });
+                    layer.bindTooltip('<table>' + rows.join('') + '</table>', {sticky: true});
+                }
+            });
+            (function (layer, map, opts) {
+                var tiles = {};
+                var shown = {};
+                var zoom = null;
+
+                function colour(value) {
+                    if (!opts.colors || value === null || value === undefined) { return opts.color; }
+                    var t = opts.vmax > opts.vmin ? (value - opts.vmin) / (opts.vmax - opts.vmin) : 0;
+                    return opts.colors[Math.max(0, Math.min(opts.colors.length - 1, Math.floor(t * opts.colors.length)))];
+                }
+
+                layer.options.style = function (feature) {
+                    var c = colour(opts.column ? feature.properties[opts.column] : null);
+                    var style = Object.assign({}, opts.style);
+                    style[opts.colorKey] = c;
+                    if (opts.colorKey === 'fillColor') { style.fillOpacity = 0.7; style.color = c; }
+                    return style;
+                };
+
+                function load() {
+                    if (!map.hasLayer(layer)) { return; }
+                    var z = Math.max(opts.minzoom, Math.min(opts.maxzoom, Math.round(map.getZoom())));
+                    if (z !== zoom) { layer.clearLayers(); shown = {}; zoom = z; }
+                    var n = Math.pow(2, z);
+                    var b = map.getBounds();
+                    var tx = function (lon) { return Math.max(0, Math.min(n - 1, Math.floor((lon + 180) / 360 * n))); };
+                    var ty = function (lat) {
+                        var r = lat * Math.PI / 180;
+                        return Math.max(0, Math.min(n - 1, Math.floor((1 - Math.log(Math.tan(r) + 1 / Math.cos(r)) / Math.PI) / 2 * n)));
+                    };
+                    for (var x = tx(b.getWest()); x <= tx(b.getEast()); x++) {
+                        for (var y = ty(b.getNorth()); y <= ty(b.getSouth()); y++) {
+                            var key = z + '/' + x + '/' + y;
+                            if (!(key in tiles)) {
+                                tiles[key] = fetch(opts.url + '/' + key + '.json')
+                                    .then(function (r) { return r.ok ? r.json() : {features: []}; })
+                                    .catch(function () { return {features: []}; });
+                            }
+                            tiles[key].then(function (data) {
+                                if (zoom !== z) { return; }
+                                data.features.forEach(function (feature) {
+                                    if (!shown[feature.id]) { shown[feature.id] = true; layer.addData(feature); }
+                                });
+                            });
+                        }
+                    }
+                }
+
+                map.on('moveend', load);
+                layer.on('add', load);
+            })({{ this.get_name() }}, {{ this._parent.get_name() }}, {{ this.options|tojson }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, url, manifest, fields, name=None, color=None, color_key='color', style=None,
+                 column=None, colors=None, vmin=None, vmax=None, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = 'TiledGeoJson'
+        self.fields = list(fields)
+        self.options = {
+            'url': url,
+            'minzoom': manifest['minzoom'],
+            'maxzoom': manifest['maxzoom'],
+            'color': color,
+            'colorKey': color_key,
+            'style': style or {},
+            'column': column,
+            'colors': colors,
+            'vmin': vmin,
+            'vmax': vmax,
+        }
@@ -0,0 +1,162 @@
+#viewport-driven incremental loading
+#
+#in this mode the cached base map carries no features. each rerun asks the
+#spatial index for the features inside the bounds st_folium last reported (plus
+#a margin) and sends only the ones this session has not sent yet, through
+#st_folium's feature_group_to_add. a small script keeps everything received in
+#one persistent layer per dataset, so a pan costs what comes into view, not the
+#size of the network. the set sent so far is reset when the view, data version
+#or zoom band changes, since the browser starts again from an empty map then.
+#up to clusters.MAX_ZOOM intersections are sent as the clusters of the zoom, and
+#the set is reset on every zoom change too, as each zoom has its own clusters.
+
+import json
+
+import numpy as np
+import shapely
+from branca.element import MacroElement
+from folium import FeatureGroup
+from jinja2 import Template
+
+from npt import clusters, geometry, instrument, maps, spatial, tiles
+from npt.views import KINDS
+
+#fraction of the viewport added on every side, so small pans are already loaded
+MARGIN = 0.25
+
+
+def expand(bounds, margin=MARGIN):
+    minx, miny, maxx, maxy = bounds
+    dx = (maxx - minx) * margin
+    dy = (maxy - miny) * margin
+    return minx - dx, miny - dy, maxx + dx, maxy + dy
+
+
+class ViewportFeatures(MacroElement):
+    #adds features to layers that outlive the feature group st_folium replaces on every send
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function (map, key, layers) {
+                var store = window.__nptViewport;
+                if (!store || store.key !== key) {
+                    if (store) {
+                        Object.keys(store.groups).forEach(function (name) { map.removeLayer(store.groups[name]); });
+                    }
+                    store = window.__nptViewport = {key: key, groups: {}};
+                }
+                layers.forEach(function (spec) {
+                    var group = store.groups[spec.name];
+                    if (!group) {
+                        group = store.groups[spec.name] = L.geoJSON(null, {
+                            style: function (feature) {
+                                var style = Object.assign({}, spec.style);
+                                style[spec.colorKey] = feature.properties._colour;
+                                if (spec.colorKey === 'fillColor') { style.fillOpacity = 0.7; style.color = feature.properties._colour; }
+                                return style;
+                            },
+                            pointToLayer: function (feature, latlng) {
+                                return L.circleMarker(latlng, {radius: feature.properties._radius || 6});
+                            },
+                            onEachFeature: function (feature, layer) {
+                                var rows = spec.fields.map(function (field) {
+                                    return '<tr><th>' + field + '</th><td>' + feature.properties[field] + '</td></tr>';
+                                });
+                                layer.bindTooltip('<table>' + rows.join('') + '</table>', {sticky: true});
+                            }
+                        }).addTo(map);
+                    }
+                    group.addData(spec.features);
+                });
+            })(window.map, {{ this.key|tojson }}, {{ this.layers }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, key, layers):
+        super().__init__()
+        self._name = 'ViewportFeatures'
+        self.key = key
+        self.layers = layers
+
+
+def _features(rows, properties, geoms):
+    geojson = shapely.to_geojson(np.asarray(geoms, dtype=object))
+    return ','.join(
+        f'{{"type":"Feature","id":{int(i)},"properties":{p},"geometry":{g}}}'
+        for i, p, g in zip(rows, properties, geojson)
+    )
+
+
+def _spec(view, layer, fields, features):
+    style = dict(maps.layer_kwds(view, layer, False)['style_kwds'])
+    colour_key = 'fillColor' if layer.kind == 'nodes' else 'color'
+    style.pop(colour_key, None)
+    return (f'{{"name":{json.dumps(layer.name)},"colorKey":"{colour_key}","style":{json.dumps(style)},'
+            f'"fields":{json.dumps(fields)},"features":[{features}]}}')
+
+
+def _layer_payload(view, layer, data, band, rows):
+    gdf = maps.inline_frame(view, layer, data, band).iloc[rows]
+    if view.choropleth:
+        colormap = maps.layer_colormap(view, layer, data.frame(layer.dataset))
+        values = gdf[KINDS[layer.kind].column].to_numpy(dtype=float)
+        colours = [colormap.rgb_hex_str(v) if not np.isnan(v) else layer.color for v in values]
+    else:
+        colours = [layer.color] * len(rows)
+
+    fields = [f for f in layer.tooltip if f in gdf]
+    properties = tiles.feature_properties(gdf.assign(_colour=colours), fields + ['_colour'])
+    return _spec(view, layer, fields, _features(rows, properties, gdf.geometry.array))
+
+
+def _cluster_payload(view, layer, data, level):
+    colormap = maps.layer_colormap(view, layer, data.frame(layer.dataset)) if view.choropleth else None
+    shown = level[list(clusters.LABELS)].round().rename(columns=clusters.LABELS)
+    shown = shown.assign(_colour=clusters.colours(level, layer.color, colormap), _radius=clusters.radius(level['count']).round(1))
+    fields = list(clusters.LABELS.values())
+    properties = tiles.feature_properties(shown, fields + ['_colour', '_radius'])
+    return _spec(view, layer, fields, _features(level.index, properties, shapely.points(level['lon'], level['lat'])))
+
+
+def delta(view, data, bounds, zoom, sent, base=None):
+    #(feature group with the unsent features in view or None, updated sent state)
+    #base identifies the map the browser holds - a new one starts empty
+    if zoom is None:
+        zoom = geometry.fit_zoom(maps.view_bounds(view, data))
+    band = geometry.band_for_zoom(zoom)
+    clustered = zoom <= clusters.MAX_ZOOM
+    key = f'{data.version}|{"|".join(view.key)}|{band}|{base}' + (f'|z{int(zoom)}' if clustered else '')
+    if sent.get('key') != key:
+        sent = {'key': key, 'rows': {}}
+
+    bounds = bounds or maps.view_bounds(view, data)
+    found = spatial.spatial_index(data).in_bounds(expand(bounds), [layer.dataset for layer in view.layers])
+
+    payload = []
+    rows_sent = dict(sent['rows'])
+    for layer in view.layers:
+        level = None
+        if clustered and layer.kind == 'nodes':
+            #rows of the zoom's clusters rather than of the dataset
+            level = clusters.cluster_index(data, layer.dataset).clusters(zoom, expand(bounds))
+            rows = level.index.to_numpy()
+        else:
+            rows = found.get(layer.dataset, np.zeros(0, dtype=np.int64))
+        new = np.setdiff1d(rows, rows_sent.get(layer.dataset, np.zeros(0, dtype=np.int64)), assume_unique=True)
+        if not len(new):
+            continue
+        if level is not None:
+            payload.append(_cluster_payload(view, layer, data, level.loc[new]))
+        else:
+            payload.append(_layer_payload(view, layer, data, band, new))
+        rows_sent[layer.dataset] = np.union1d(rows_sent.get(layer.dataset, np.zeros(0, dtype=np.int64)), new)
+
+    sent = {'key': key, 'rows': rows_sent}
+    if not payload:
+        return None, sent
+
+    layers = '[' + ','.join(payload) + ']'
+    instrument.payload('viewport features', lambda: len(layers.encode()))
+    group = FeatureGroup(name='Features in view', control=False)
+    group.add_child(ViewportFeatures(key, layers))
+    return group, sent
@@ -0,0 +1,159 @@
+#declarative view registry for 'The tool' tab
+#
+#a view is a set of layers picked by (analysis_selection, data_selection). each
+#layer says which dataset it draws, how it is styled and what it reports in the
+#summary, so adding a category or data type is a new entry here, not new code.
+
+from dataclasses import dataclass
+
+
+LINK_FIELDS = ('ADT_PT', 'AM_PT', 'LOS')
+NODE_FIELDS = ('ADT_PT', 'AM_PT', 'DELAY_WAVG')
+
+LINK_METRICS = (
+    ('ADT_PT', 'an average of **{}** bus users per day'),
+    ('AM_PT', 'an average of **{}** bus users in the AM peak'),
+    ('LOS', 'average level of service (LoS) classification of **{}**, equating to {delay_note} seconds of delay per bus every hour'),
+)
+
+NODE_METRICS = (
+    ('ADT_PT', 'an average of **{}** bus users travelling through them every day'),
+    ('AM_PT', 'an average of **{}** bus users in the AM peak'),
+    ('DELAY_WAVG', 'average delays of **{}** seconds every hour per bus movement'),
+)
+
+
+@dataclass(frozen=True)
+class LayerSpec:
+    name: str
+    dataset: str
+    kind: str
+    category: str
+    label: str
+    fields: tuple
+    color: str
+    metrics: tuple
+
+    @property
+    def tooltip(self):
+        return [self.label, *self.fields]
+
+
+@dataclass(frozen=True)
+class Kind:
+    key: str
+    noun: str
+    plural: str
+    reason: str
+    column: str
+    caption: str
+    caption_prefix: str
+
+
+@dataclass(frozen=True)
+class Category:
+    key: str
+    delay_note: str
+
+
+@dataclass(frozen=True)
+class Analysis:
+    label: str
+    title: str
+    categories: tuple
+
+
+@dataclass(frozen=True)
+class View:
+    analysis: Analysis
+    data: str
+    layers: tuple
+    #colour every layer by its category, even when the view spans several
+    by_category: bool = False
+
+    @property
+    def key(self):
+        return (self.analysis.label, self.data)
+
+    @property
+    def kinds(self):
+        return tuple(dict.fromkeys(layer.kind for layer in self.layers))
+
+    @property
+    def choropleth(self):
+        #views spanning several categories colour each feature by severity instead
+        return not self.by_category and len(self.analysis.categories) > 1
+
+    @property
+    def note(self):
+        if not self.choropleth:
+            return None
+        nouns = ' and '.join(KINDS[k].noun for k in sorted(self.kinds, reverse=True))
+        return f"Note: On this map, each {nouns} is weighted by the severity of delay (ie LoS)."
+
+    def caption(self, kind):
+        spec = KINDS[kind]
+        return f"{spec.caption_prefix} - {spec.caption}" if len(self.kinds) > 1 else spec.caption
+
+
+KINDS = {
+    'links': Kind('links', 'link', 'road segments', 'These roads have been selected because they are forecast to accomodate:',
+                  'LOS', 'Level of service', 'Links'),
+    'nodes': Kind('nodes', 'intersection', 'intersections', 'These intersections have been selected because they accomodate:',
+                  'DELAY_WAVG', 'Seconds of delay/hr per bus movement', 'Intersections'),
+}
+
+CATEGORIES = {
+    'priority': Category('priority', '>120'),
+    'secondary': Category('secondary', '>80'),
+}
+
+LAYERS = {
+    ('priority', 'links'): LayerSpec('Links - Priority locations', 'links_key_locations', 'links', 'priority',
+                                     'label', LINK_FIELDS, 'red', LINK_METRICS),
+    ('priority', 'nodes'): LayerSpec('Intersections - Priority locations', 'intersections_key_locations', 'nodes', 'priority',
+                                     'LABEL', NODE_FIELDS, 'red', NODE_METRICS),
+    ('secondary', 'links'): LayerSpec('Links - Secondary locations', 'links_outside_primary', 'links', 'secondary',
+                                      'Label', LINK_FIELDS + ('length',), 'orange', LINK_METRICS),
+    ('secondary', 'nodes'): LayerSpec('Intersections - Secondary locations', 'intersections_outside_primary', 'nodes', 'secondary',
+                                      'LABEL', NODE_FIELDS, 'orange', NODE_METRICS),
+}
+
+ANALYSES = {
+    'Priority locations': Analysis('Priority locations', 'Priority Locations Summary', ('priority',)),
+    'Secondary Locations': Analysis('Secondary Locations', 'Secondary Locations Summary', ('secondary',)),
+    'All locations': Analysis('All locations', 'All Locations Summary', ('priority', 'secondary')),
+}
+
+DATA_TYPES = {
+    'Roads': ('links',),
+    'Intersections': ('nodes',),
+    'Both roads and intersections': ('nodes', 'links'),
+}
+
+
+def get_view(analysis_selection, data_selection):
+    if analysis_selection not in ANALYSES or data_selection not in DATA_TYPES:
+        return None
+    analysis = ANALYSES[analysis_selection]
+    layers = tuple(
+        LAYERS[(category, kind)]
+        for kind in DATA_TYPES[data_selection]
+        for category in analysis.categories
+        if (category, kind) in LAYERS
+    )
+    return View(analysis, data_selection, layers)
+
+
+def all_views():
+    for analysis_selection in ANALYSES:
+        for data_selection in DATA_TYPES:
+            yield get_view(analysis_selection, data_selection)
+
+
+def network_view():
+    #every layer on one map - the selected view's layers are switched on and off in the browser
+    analysis = Analysis('All layers', 'All Locations Summary', tuple(CATEGORIES))
+    data_selection = 'Both roads and intersections'
+    layers = tuple(LAYERS[(category, kind)] for kind in DATA_TYPES[data_selection] for category in CATEGORIES)
+    return View(analysis, data_selection, layers, by_category=True)
@@ -0,0 +1,29 @@
+#background warm-up of the per-version caches
+#
+#the first session after a start (or a data change) would otherwise build the
+#candidates, graph, spatial index, statistics and every view's map on its first
+#clicks. start() builds them on a daemon thread instead; LRUCache.get_or_build
+#is single-flight, so a session asking for one mid-build just waits for it. the
+#maps are then saved as snapshots (npt.snapshots), so after the next restart a
+#session can show them before these caches are warm again.
+
+import threading
+
+from npt import maps, network, snapshots, spatial, stats, thresholds, views
+
+
+def warm(data):
+    thresholds.candidates(data)
+    network.network(data)
+    spatial.spatial_index(data)
+    stats.summary_table(data)
+    maps.get_view_map(views.network_view(), data)
+    for view in views.all_views():
+        maps.get_view_map(view, data)
+    snapshots.save(data, latest=True)
+
+
+def start(data):
+    thread = threading.Thread(target=warm, args=(data,), name='npt-warm', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,45 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point
+
+from npt import clusters
+
+#three pairs of intersections 10 m apart, the pairs 5 km from each other, and one node far away
+POINTS = [(174.70, -36.80), (174.7001, -36.80), (174.75, -36.80), (174.7501, -36.80),
+          (174.80, -36.80), (174.8001, -36.80), (176.17, -37.69)]
+
+
+@pytest.fixture(scope='module')
+def index():
+    gdf = gpd.GeoDataFrame({
+        'ADT_PT': np.arange(1, len(POINTS) + 1) * 100.0,
+        'AM_PT': np.arange(1, len(POINTS) + 1) * 10.0,
+        'DELAY_WAVG': [5.0, 60.0, 10.0, np.nan, 20.0, 30.0, 40.0],
+    }, geometry=[Point(p) for p in POINTS], crs='EPSG:4326')
+    return clusters.ClusterIndex(gdf)
+
+
+@pytest.mark.parametrize('zoom', range(clusters.MIN_ZOOM, clusters.MAX_ZOOM + 1))
+def test_every_zoom_keeps_every_node(index, zoom):
+    level = index.clusters(zoom)
+    assert level['count'].sum() == len(POINTS)
+    assert level['ADT_PT'].sum() == pytest.approx(2800)
+    assert level['AM_PT'].sum() == pytest.approx(280)
+    assert level['DELAY_WAVG'].max() == 60
+
+
+def test_clusters_split_as_the_zoom_increases(index):
+    sizes = [len(index.clusters(z).index) for z in range(clusters.MIN_ZOOM, clusters.MAX_ZOOM + 1)]
+    assert sizes == sorted(sizes)
+    #the whole region is one marker, the pairs stay together at street level
+    assert sizes[0] == 1
+    assert sorted(index.clusters(clusters.MAX_ZOOM)['count']) == [1, 2, 2, 2]
+    assert index.clusters(clusters.MAX_ZOOM + 1) is None
+
+
+def test_a_cluster_is_where_its_nodes_are(index):
+    pairs = index.clusters(clusters.MAX_ZOOM).sort_values('lon')
+    assert pairs['lon'].iloc[0] == pytest.approx(174.70005)
+    assert pairs['lat'].iloc[0] == pytest.approx(-36.80)
+    assert len(index.clusters(clusters.MAX_ZOOM, bounds=(174.6, -36.9, 174.9, -36.7)).index) == 3
@@ -0,0 +1,74 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import LineString, Point
+
+from npt import corridors, thresholds
+
+NODES = {1: (174.70, -36.80), 2: (174.71, -36.80), 3: (174.72, -36.80), 4: (174.71, -36.81),
+         10: (174.80, -36.80), 11: (174.81, -36.80)}
+
+#(A, B, name, km, ADT_PT) - a street 1-2-3 with a branch 2-4 and, apart from it, 10-11. 2-1 repeats
+#1-2's figures, so it is the same road counted once; 3-2 has its own and shares 2-3's length
+PRIORITY = [(1, 2, 'Main St', 1.0, 100), (2, 3, 'Main St', 2.0, 200), (2, 4, 'Side Rd', 0.5, 400)]
+SECONDARY = [(2, 1, 'Main St', 1.0, 100), (3, 2, 'Main St', 2.0, 300), (10, 11, 'Other Rd', 3.0, 50)]
+
+
+def _links(rows, label):
+    return gpd.GeoDataFrame({
+        'A': [float(a) for a, *_ in rows],
+        'B': [float(b) for _, b, *_ in rows],
+        label: [name for _, _, name, *_ in rows],
+        'DISTANCE': [km for *_, km, _ in rows],
+        'length': np.nan,
+        'ADT_PT': [float(adt) for *_, adt in rows],
+        'AM_PT': 50.0,
+        'LOS': 4,
+    }, geometry=[LineString([NODES[a], NODES[b]]) for a, b, *_ in rows], crs='EPSG:4326')
+
+
+def _nodes(delays):
+    return gpd.GeoDataFrame({'N': [float(n) for n in delays], 'DELAY_WAVG': list(delays.values())},
+                            geometry=[Point(NODES[n]) for n in delays], crs='EPSG:4326')
+
+
+class Layers:
+    #stands in for the bundle - the source layers of thresholds.candidates
+
+    version = 'test-corridors'
+
+    def __init__(self):
+        self.frames = {
+            'links_key_locations': _links(PRIORITY, 'label'),
+            'links_outside_primary': _links(SECONDARY, 'Label'),
+            'links_delay': _links([], 'label'),
+            'links_demand': _links([], 'label'),
+            'intersections_key_locations': _nodes({2: 30.0}),
+        }
+        for name in thresholds.NODE_SOURCES:
+            self.frames.setdefault(name, _nodes({}))
+
+    def frame(self, name):
+        return self.frames[name]
+
+
+@pytest.fixture(scope='module')
+def found():
+    return corridors.build_corridors(Layers(), ('links_key_locations', 'links_outside_primary'))
+
+
+def test_links_sharing_a_node_are_one_corridor(found):
+    assert found['name'].tolist() == ['Main St', 'Other Rd']
+    assert found['links'].tolist() == [3, 1]
+    assert found['intersections'].tolist() == [1, 0]
+    assert found['delay_s'].iloc[0] == 30
+
+
+def test_each_road_is_counted_once_in_length(found):
+    #1 + 2 + 0.5 km - neither direction of 1-2 nor of 2-3 adds its length again
+    assert found['length_km'].tolist() == pytest.approx([3.5, 3.0])
+    #passenger-km is every direction's trips over the full length
+    assert found['passenger_km'].tolist() == pytest.approx([100 * 1 + 200 * 2 + 300 * 2 + 400 * 0.5, 50 * 3])
+    #and trips are averaged over the length each direction carries
+    assert found['ADT_PT'].iloc[0] == pytest.approx((100 * 1 + 200 * 1 + 300 * 1 + 400 * 0.5) / 3.5)
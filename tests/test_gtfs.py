@@ -0,0 +1,58 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import LineString
+
+from npt import gtfs, network
+
+FEED = os.path.join(os.path.dirname(__file__), 'data', 'gtfs')
+
+#a street west-east through node 2 and a side road south from it, each link in both directions
+NODES = {1: (174.760, -36.850), 2: (174.762, -36.850), 3: (174.764, -36.850), 4: (174.762, -36.852)}
+LINKS = [(1, 2), (2, 1), (2, 3), (3, 2), (2, 4), (4, 2)]
+
+#R1 runs east along 1-2-3 four times in the AM peak (07-09) and once in the interpeak, R2 west
+#from 3 and south to 4 twice in the AM. its saturday trip and the rail route T1 are not counted
+AM = {(1, 2): 2.0, (2, 3): 2.0, (3, 2): 1.0, (2, 4): 1.0, (2, 1): 0.0, (4, 2): 0.0}
+IP = {(1, 2): 1 / 6, (2, 3): 1 / 6}
+
+
+@pytest.fixture(scope='module')
+def graph():
+    links = gpd.GeoDataFrame({'A': [a for a, _ in LINKS], 'B': [b for _, b in LINKS]},
+                             geometry=[LineString([NODES[a], NODES[b]]) for a, b in LINKS], crs='EPSG:4326')
+    nodes = gpd.GeoDataFrame({'N': pd.Series(dtype=float)}, geometry=gpd.GeoSeries([], dtype='geometry'), crs='EPSG:4326')
+    return network.Network(links, nodes)
+
+
+@pytest.fixture(scope='module')
+def trips():
+    return gtfs.bus_trips(gtfs.Feed(FEED), 'tuesday')
+
+
+def _by_link(graph, values):
+    return {(int(graph.ids[a]), int(graph.ids[b])): value for a, b, value in zip(graph.link_a, graph.link_b, values)}
+
+
+def test_bus_trips_are_weekday_buses(trips):
+    assert sorted(trips['trip_id']) == ['r1_0600', 'r1_0700', 'r1_0730', 'r1_0800', 'r1_0830', 'r1_1000', 'r2_0715', 'r2_0815']
+
+
+def test_shapes_match_the_links_they_run_along(graph):
+    ids, shapes = gtfs.read_shapes(gtfs.Feed(FEED))
+    shape, link, _ = gtfs.match_shapes(gtfs._links(graph), shapes)
+    matched = {(ids[s], (int(graph.ids[graph.link_a[k]]), int(graph.ids[graph.link_b[k]]))) for s, k in zip(shape, link)}
+    #only the direction each shape runs
+    assert matched == {('s1', (1, 2)), ('s1', (2, 3)), ('s2', (3, 2)), ('s2', (2, 4))}
+
+
+@pytest.mark.parametrize('frequency', [gtfs.shape_frequency, gtfs.stop_frequency])
+def test_buses_per_hour(graph, trips, frequency):
+    out = frequency(graph, gtfs.Feed(FEED), trips)
+    assert _by_link(graph, out['AM']) == pytest.approx(AM)
+    ip = _by_link(graph, out['IP'])
+    assert {link: ip[link] for link in IP} == pytest.approx(IP)
+    assert np.nansum(out['PM']) == 0
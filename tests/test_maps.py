@@ -0,0 +1,51 @@
+import folium
+import geopandas as gpd
+import pytest
+import streamlit_folium
+from shapely.geometry import LineString
+
+from npt import maps
+
+
+def _map():
+    m = folium.Map(tiles=maps.TILES)
+    gdf = gpd.GeoDataFrame({'name': ['a']}, geometry=[LineString([(174.7, -36.8), (174.8, -36.9)])], crs='EPSG:4326')
+    gdf.explore(m=m, legend=False)
+    m.fit_bounds([[-36.9, 174.7], [-36.8, 174.8]])
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def _group():
+    return maps.highlight_group(gpd.GeoDataFrame({'label': ['b']}, geometry=[LineString([(174.7, -36.8), (174.75, -36.85)])],
+                                                 crs='EPSG:4326'), 'Approach links', ['label'])
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+    monkeypatch.setattr(streamlit_folium, '_component_func', lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+def test_show_sends_what_st_folium_sends(sent):
+    #maps.show stands in for st_folium with its private helpers - an upgrade that changes them fails here
+    m = _map()
+    m.get_root().render()
+    streamlit_folium.st_folium(m, key='k', use_container_width=True, render=False, zoom=12, center=(-36.8, 174.7),
+                               feature_group_to_add=[_group()])
+    maps.show(maps.render(_map()), 'k', [_group()], zoom=12, center=(-36.8, 174.7))
+    expected, got = sent
+    for kwargs in sent:
+        del kwargs['on_change'], kwargs['key']
+    assert got == expected
+
+
+def test_show_leaves_the_cached_map_alone(sent):
+    rendered = maps.render(_map())
+    children = list(rendered.map._children)
+    maps.show(rendered, 'k', [_group(), maps.show_layers(['x'])])
+    maps.show(rendered, 'k')
+    assert list(rendered.map._children) == children
+    assert sent[0]['script'] == sent[1]['script'] == rendered.payload.script
+    assert sent[0]['feature_group'] and sent[1]['feature_group'] is None
@@ -0,0 +1,60 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString, Point
+
+from npt import network
+
+
+def _graph(lines):
+    links = gpd.GeoDataFrame({'A': [np.nan] * len(lines), 'B': [np.nan] * len(lines)},
+                             geometry=[LineString(line) for line in lines], crs='EPSG:4326')
+    nodes = gpd.GeoDataFrame({'N': pd.Series(dtype=float)}, geometry=gpd.GeoSeries([], dtype='geometry'), crs='EPSG:4326')
+    return network.Network(links, nodes)
+
+
+def _link_ids(graph, row):
+    return graph.ids[graph.link_a[row]], graph.ids[graph.link_b[row]]
+
+
+def test_links_without_ids_keep_their_ids():
+    #an id-less link's id comes from where it is, not from what else is in the data
+    kept = [(174.76, -36.85), (174.77, -36.86)]
+    alone = _graph([kept])
+    more = _graph([[(175.1, -37.2), (175.2, -37.3)], kept, [(-0.1, 51.5), (0.1, 51.6)]])
+    assert _link_ids(alone, 0) == _link_ids(more, 1)
+    assert (more.ids < 0).all() and len(np.unique(more.ids)) == 6
+    assert more.link_rows_for_ids(*[[i] for i in _link_ids(alone, 0)])[0] == 1
+
+
+def test_approach_links_among_rows():
+    #three links into the middle node - only those among the rows given count
+    graph = _graph([[(0, 0), (1, 1)], [(2, 0), (1, 1)], [(1, 2), (1, 1)], [(1, 1), (3, 3)]])
+    node = graph.link_b[0]
+    assert graph.approach_links(node).tolist() == [0, 1, 2]
+    assert graph.approach_links(node, np.array([1, 3])).tolist() == [1]
+
+
+def test_packed_ids_are_unique_negative_and_exact():
+    #grid points across the whole lon/lat range, a grid step apart, and the corners
+    lon = np.r_[-180, 180, np.linspace(-180, 180, 101), 174.76, 174.76 + network.GRID]
+    lat = np.r_[-90, 90, np.linspace(-90, 90, 101), -36.85, -36.85 + network.GRID]
+    xy = np.array([(x, y) for x in lon for y in lat])
+    ids = network._coord_ids(xy)
+    keys = {tuple(p) for p in np.round(xy / network.GRID).astype(np.int64)}
+    assert len(np.unique(ids)) == len(keys)
+    assert (ids < 0).all()
+    #scenario files keep ids as floats
+    assert (ids.astype(float).astype(np.int64) == ids).all()
+    assert (network._coord_ids(xy[::-1]) == ids[::-1]).all()
+
+
+def test_packed_ids_never_take_a_model_id():
+    links = gpd.GeoDataFrame({'A': [1.0, np.nan, 7.0], 'B': [2.0, 5.0, np.nan]},
+                             geometry=[LineString([(174.7, -36.8), (174.71, -36.8)]), LineString([(174.72, -36.8), (174.73, -36.8)]),
+                                       LineString([(174.74, -36.8), (174.75, -36.8)])], crs='EPSG:4326')
+    nodes = gpd.GeoDataFrame({'N': [2.0]}, geometry=[Point(174.71, -36.8)], crs='EPSG:4326')
+    graph = network.Network(links, nodes)
+    assert graph.ids[graph.ids > 0].tolist() == [1, 2, 5, 7]
+    assert (graph.ids <= 0).sum() == 2
+    assert graph.ids[graph.link_a[1]] == network._coord_ids([(174.72, -36.8)])[0]
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from npt import bundle, network, scenarios
+
+
+@pytest.fixture(scope='module')
+def data():
+    return bundle.open_bundle()
+
+
+def _identity(data, scenario_dir):
+    #a scenario file holding the base figures of every graph link and node with model ids
+    graph = network.network(data)
+    frames = {}
+    for kind, source in (('links', graph.links), ('nodes', graph.nodes)):
+        ids = list(scenarios.ID_COLUMNS[kind])
+        frame = source[ids + [c for c in scenarios.ATTRIBUTES[kind] if c in source]].dropna(subset=ids)
+        frames[kind] = frame.astype({c: np.float32 for c in frame.columns if c not in ids})
+    scenarios.write_scenario('identity', {'label': 'Identity'}, frames['links'], frames['nodes'], scenario_dir=str(scenario_dir))
+
+
+def test_identity_scenario_reproduces_every_layer(data, tmp_path):
+    _identity(data, tmp_path)
+    applied = scenarios.ScenarioStore(data, scenario_dir=str(tmp_path)).apply(data, 'identity')
+    for name in scenarios.SOURCE_KINDS:
+        base = data.frame(name)
+        frame = applied.frame(name)
+        pdt.assert_frame_equal(pd.DataFrame(frame[list(base.columns)]), pd.DataFrame(base), check_dtype=False, obj=name)
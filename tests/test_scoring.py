@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from npt import bundle, scoring
+
+
+@pytest.fixture(scope='module')
+def matrix():
+    return scoring.criteria_matrix(bundle.open_bundle())
+
+
+def test_node_can_score_100(matrix):
+    #frequency and length do not apply to intersections, so they must not hold their scores down
+    ranker = scoring.Ranker(matrix, {'demand': 1.0, 'frequency': 1.0, 'delay': 0.0, 'length': 1.0})
+    nodes = matrix.kinds == 'nodes'
+    busiest = np.nanargmax(np.where(nodes, matrix.raw['demand'], np.nan))
+    assert ranker.scores[busiest] == pytest.approx(100)
+    assert ranker.table(len(matrix))['Score'].max() == pytest.approx(100)
+
+
+def test_missing_values_do_not_count_against(matrix):
+    ranker = scoring.Ranker(matrix, {'demand': 1.0, 'frequency': 1.0, 'delay': 0.0, 'length': 0.0})
+    unknown = (matrix.kinds == 'links') & np.isnan(matrix.raw['frequency'])
+    if not unknown.any():
+        pytest.skip('every link has a bus frequency')
+    row = np.flatnonzero(unknown)[0]
+    assert ranker.scores[row] == pytest.approx(matrix.values[row, list(scoring.CRITERIA).index('demand')] * 100)
+
+
+def test_incremental_weights_match_a_refresh(matrix):
+    ranker = scoring.Ranker(matrix)
+    ranker.set_weights({'demand': 0.1, 'delay': 0.9, 'length': 0.0})
+    moved = ranker.scores.copy()
+    ranker.refresh()
+    np.testing.assert_allclose(moved, ranker.scores)
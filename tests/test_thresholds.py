@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from npt import bundle, thresholds, views
+
+
+def _keys(frame, columns):
+    #model ids where present, otherwise the geometry
+    ids = frame[list(columns)].astype(float)
+    known = ids.notna().all(axis=1)
+    return set(map(tuple, ids[known].to_numpy())) | set(frame.geometry[~known].to_wkb(hex=True))
+
+
+@pytest.mark.parametrize('key', list(views.LAYERS))
+def test_defaults_give_back_the_shipped_layers(key):
+    #turning the rule editor on without moving a slider must not reclassify the network
+    data = bundle.open_bundle()
+    dataset = views.LAYERS[key].dataset
+    columns = ('A', 'B') if key[1] == 'links' else ('N',)
+    assert _keys(thresholds.reclassify(data, thresholds.DEFAULTS).frame(dataset), columns) == _keys(data.frame(dataset), columns)
+
+
+def test_bus_frequency_sums_patterns_and_directions():
+    frame = pd.DataFrame({
+        'A': [1, 1, 1, 2, 3],
+        'B': [2, 2, 2, 1, 4],
+        'line_id': ['x', 'x', 'y', 'x', None],
+        'pattern': ['A', 'A', 'A', 'B', None],
+        'dir_id': [0, 0, 0, 1, None],
+        'minheadway': [10, 10, 15, 12, None],
+    })
+    #x every 10 min and y every 15 one way, x every 12 the other: 6 + 4 + 5 buses/hr on the road
+    assert thresholds.bus_frequency(frame).tolist()[:4] == [15, 15, 15, 15]
+    assert np.isnan(thresholds.bus_frequency(frame).iloc[4])